@@ -0,0 +1,149 @@
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
+
+from airfunctions.executors import map_ordered
+
+
+@dataclass
+class EventResult:
+    """Outcome of one event of a batch, its output or the error it raised."""
+
+    index: int
+    output: Any = None
+    error: str | None = None
+    cause: str | None = None
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+
+def run_event(
+    workflow: Callable[[Any, Any], Any], event: Any, context: Any
+) -> tuple[Any, str | None, str | None]:
+    """Run one event, returning (output, error, cause) instead of raising."""
+    try:
+        return workflow(event, context), None, None
+    except Exception as exc:
+        return None, type(exc).__name__, str(exc)
+
+
+# workflow of a batch worker process, unpickled once by _init_worker
+_worker_workflow: Callable[[Any, Any], Any] | None = None
+
+
+def _init_worker(payload: bytes):
+    global _worker_workflow
+    _worker_workflow = pickle.loads(payload)
+
+
+def _run_chunk(events: list, context: Any) -> list[tuple]:
+    # plain tuples are much cheaper to send back than EventResult objects
+    return [run_event(_worker_workflow, event, context) for event in events]
+
+
+class BatchRun:
+    """
+    Runs a workflow over a stream of events and yields an EventResult per event, in
+    order. With several workers the events are sent in chunks to a process pool
+    whose workers unpickle the workflow once. A failing event does not stop the
+    batch. The counters can be read while the batch runs, from any thread.
+    """
+
+    def __init__(
+        self,
+        workflow: Callable[[Any, Any], Any],
+        events: Iterable[Any],
+        workers: int | None = None,
+        context: Any = None,
+        chunk_size: int = 100,
+    ):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1.")
+        self.workflow = workflow
+        self.events = events
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.context = context
+        self.chunk_size = chunk_size
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Completed events per second."""
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed else 0.0
+
+    def __iter__(self) -> Iterator[EventResult]:
+        if self.started_at is not None:
+            raise RuntimeError("A batch can only be iterated once.")
+        self.started_at = time.perf_counter()
+        try:
+            if self.workers <= 1:
+                results = self._run_local()
+            else:
+                results = self._run_pool()
+            for index, (output, error, cause) in enumerate(results):
+                with self._lock:
+                    self.completed += 1
+                    if error is not None:
+                        self.failed += 1
+                yield EventResult(index, output, error, cause)
+        finally:
+            self.finished_at = time.perf_counter()
+
+    def _chunks(self) -> Iterator[list]:
+        events = iter(self.events)
+        while True:
+            chunk = list(islice(events, self.chunk_size))
+            if not chunk:
+                return
+            with self._lock:
+                self.submitted += len(chunk)
+            yield chunk
+
+    def _run_local(self) -> Iterator[tuple]:
+        for events in self._chunks():
+            for event in events:
+                yield run_event(self.workflow, event, self.context)
+
+    def _run_pool(self) -> Iterator[tuple]:
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(pickle.dumps(self.workflow),),
+        )
+        try:
+            run_chunk = partial(_run_chunk, context=self.context)
+            for results in map_ordered(
+                pool, run_chunk, self._chunks(), 2 * self.workers
+            ):
+                yield from results
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def __repr__(self):
+        return (
+            f"BatchRun(submitted={self.submitted}, completed={self.completed}, "
+            f"failed={self.failed}, throughput={self.throughput:.0f}/s)"
+        )
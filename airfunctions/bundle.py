@@ -26,6 +26,13 @@ def save_dict_to_json_file(data: dict, file_path: str):
         json.dump(data, f)
 
 
+def save_definition_to_json_file(state_machine: StateMachine, file_path: str):
+    """Stream the definition of a state machine to a file, state by state."""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as f:
+        state_machine.dump(f)
+
+
 class TerraformBundler:
     def __init__(self):
         self.tasks = []
@@ -64,6 +71,15 @@ class TerraformBundler:
 
     def to_terraform(self):
         """Convert collected resources to Terraform configurations"""
+        for file_path, blocks in self.terraform_files().items():
+            blocks.save(file_path)
+        subprocess.run(["terraform", "fmt", "--recursive"], cwd="./terraform")
+
+    def terraform_files(self) -> dict[str, TerraformBlocksCollection]:
+        """
+        Build the Terraform blocks of the collected resources by file path, writing
+        the state machine definitions they reference.
+        """
         project_path = Path(".")
         lambda_config = get_lambda_build_config(project_path)
         backend = TerraformBlocksCollection()
@@ -183,8 +199,8 @@ class TerraformBundler:
                 f"terraform/state_machines/{state_machine.name}.json"
             )
 
-            save_dict_to_json_file(
-                state_machine.definition, state_machine_definition_path
+            save_definition_to_json_file(
+                state_machine, state_machine_definition_path
             )
             iam_assume_role_policy_document = Data(
                 "aws_iam_policy_document",
@@ -263,9 +279,9 @@ class TerraformBundler:
         )
         locals.add(locals_block)
 
-        backend.save("terraform/backend.tf")
-        data.save("terraform/data.tf")
-        locals.save("terraform/locals.tf")
-        main.save("terraform/main.tf")
-        data.save("terraform/data.tf")
-        subprocess.run(["terraform", "fmt", "--recursive"], cwd="./terraform")
+        return {
+            "terraform/backend.tf": backend,
+            "terraform/data.tf": data,
+            "terraform/locals.tf": locals,
+            "terraform/main.tf": main,
+        }
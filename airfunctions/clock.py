@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+
+from airfunctions.config import Config
+
+
+class Clock:
+    """Time source of local runs, used to wait between retries and in Wait states."""
+
+    def now(self) -> float:
+        raise NotImplementedError
+
+    def time(self) -> float:
+        """Wall-clock time in seconds since the epoch, to compare timestamps with."""
+        raise NotImplementedError
+
+    def sleep(self, seconds: float, label: str | None = None):
+        raise NotImplementedError
+
+    def sleep_until(self, when: float):
+        """Wait until now() reaches when."""
+        delay = when - self.now()
+        if delay > 0:
+            self.sleep(delay)
+
+    async def asleep(self, seconds: float, label: str | None = None):
+        self.sleep(seconds, label)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(now={self.now()})"
+
+
+class SystemClock(Clock):
+    """Waits in real time."""
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float, label: str | None = None):
+        time.sleep(seconds)
+
+    async def asleep(self, seconds: float, label: str | None = None):
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """
+    Simulated time that moves forward by every wait instead of sleeping.
+    Waits are counted per label (the state name), so retry storms can be measured
+    in simulated seconds without real delays.
+    """
+
+    def __init__(self, start: float = 0.0, epoch: float | None = None):
+        self.start = start
+        # wall-clock time at start
+        self.epoch = time.time() if epoch is None else epoch
+        self._now = start
+        self.waits: Counter[str | None] = Counter()
+        self.waited: Counter[str | None] = Counter()
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return self._now
+
+    def time(self) -> float:
+        return self.epoch + self.elapsed
+
+    @property
+    def elapsed(self) -> float:
+        return self._now - self.start
+
+    def sleep(self, seconds: float, label: str | None = None):
+        with self._lock:
+            self._now += seconds
+            self.waits[label] += 1
+            self.waited[label] += seconds
+
+    def sleep_until(self, when: float):
+        with self._lock:
+            self._now = max(self._now, when)
+
+
+CLOCKS: dict[str, type[Clock]] = {
+    "system": SystemClock,
+    "virtual": VirtualClock,
+}
+
+
+def get_clock(clock: str | Clock | None = None) -> Clock:
+    """
+    Resolve a clock given by name or instance, None falls back to Config().local_clock.
+    Clocks given by name are created on every call, share an instance to measure waits.
+    """
+    if clock is None:
+        clock = Config().local_clock
+    if isinstance(clock, Clock):
+        return clock
+
+    try:
+        clock_cls = CLOCKS[clock]
+    except KeyError:
+        raise ValueError(f"Clock {clock} not recognized, use one of {list(CLOCKS)}.")
+    return clock_cls()
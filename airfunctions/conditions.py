@@ -1,6 +1,12 @@
+import json
 import operator
+import re
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Callable, Iterable
+
+from airfunctions.jsonata import JSONataError
+from airfunctions.jsonata import compile as compile_jsonata
+from airfunctions.jsonata import compile_condition, compile_selector
 
 
 def get_nested_value(
@@ -107,6 +113,8 @@ class Condition:
     def parse_op(op):
         if op.__name__ == "eq":
             return "="
+        elif op.__name__ == "ne":
+            return "!="
         elif op.__name__ in ("and_", "or_"):
             return op.__name__[:-1]
         elif op.__name__ == "gt":
@@ -125,20 +133,37 @@ class Condition:
         if isinstance(arg, Condition):
             return f"({arg.jsonata(top=False)})"
         elif isinstance(arg, str) and not arg.startswith("$"):
-            return '"' + str(arg) + '"'
+            return json.dumps(arg, ensure_ascii=False)
         elif isinstance(arg, Ref):
-            return f"${arg.attr_name}"
+            return reference(arg.attr_name)
+        elif isinstance(arg, (bool, int, float)) or arg is None:
+            return json.dumps(arg)
         else:
             return str(arg)
 
     def jsonata(self, top=True) -> str:
-        if self.b is None and self.operator == operator.not_:
-            res = f"{self.operator.__name__}({self.parse_arg(self.a)})"
-        else:
-            res = f"{self.parse_arg(self.a)} {self.parse_op(self.operator)} {self.parse_arg(self.b)}"
         if top:
-            return f"{{% {res} %}}"
-        return res
+            # the deployed condition is the optimized one, see optimize
+            return f"{{% {_render(optimize(self))} %}}"
+        if self.b is None and self.operator == operator.not_:
+            return f"$not({_render(self.a)})"
+        op = self.parse_op(self.operator)
+        return f"{self._operand(self.a, op)} {op} {self._operand(self.b, op)}"
+
+    @classmethod
+    def _operand(cls, arg: Any, op: str) -> str:
+        # and binds tighter than or, comparisons and $not tighter than both
+        if isinstance(arg, Condition) and op in ("and", "or"):
+            inner = arg.operator
+            if inner in _COMPARISONS or inner is operator.not_ or inner is operator.and_ or (
+                inner is operator.or_ and op == "or"
+            ):
+                return arg.jsonata(top=False)
+        return cls.parse_arg(arg)
+
+    def optimize(self) -> "Condition | bool":
+        """The condition as deployed, see optimize."""
+        return optimize(self)
 
     def evaluate(self, event: dict, context: Any) -> bool:
         if self.b is None:
@@ -149,6 +174,13 @@ class Condition:
             b = self._eval_val(self.b, event, context)
             return self.operator(a, b)
 
+    def compile(self) -> Callable[[Any, Any], bool]:
+        """
+        Function of (event, context) evaluating the condition as deployed, the
+        generated function of jsonata.compile_condition on the JSONata Condition.
+        """
+        return compile_condition(self.jsonata())
+
     @staticmethod
     def _eval_val(val, event: dict, context: object) -> Any:
         if isinstance(val, Condition):
@@ -159,3 +191,306 @@ class Condition:
             return get_nested_value(event, val.replace("$", ""))
         else:
             return val
+
+
+_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# names the JSONata lexer reads as operators or values
+_RESERVED = {"and", "or", "in", "true", "false", "null", "function"}
+
+
+def reference(path: str) -> str:
+    """The JSONata expression of a reference to the state input, $states.input.a.b"""
+    # references may be written as JSONPath, $.a.b
+    path = path[2:] if path.startswith("$.") else path
+    if path in ("", "$"):
+        return "$states.input"
+    fields = "".join(
+        f".{key}" if _NAME.fullmatch(key) and key not in _RESERVED else f".`{key}`"
+        for key in path.split(".")
+    )
+    return f"$states.input{fields}"
+
+
+def _render(arg: Any) -> str:
+    if isinstance(arg, Condition):
+        return arg.jsonata(top=False)
+    return Condition.parse_arg(arg)
+
+
+# Optimization of conditions as JSONata, the semantics of the deployed state machine
+
+_COMPARISONS = {operator.eq, operator.ne, operator.lt, operator.le, operator.gt, operator.ge}
+_JUNCTIONS = {operator.and_, operator.or_}
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _is_constant(arg: Any) -> bool:
+    if isinstance(arg, str):
+        return not arg.startswith("$")
+    return isinstance(arg, _SCALARS) and arg == arg
+
+
+def _is_boolean_valued(arg: Any) -> bool:
+    """Whether a condition evaluates to a boolean in JSONata, never to undefined."""
+    if type(arg) is bool:
+        return True
+    if not isinstance(arg, Condition):
+        return False
+    if arg.operator is operator.not_:
+        return _is_boolean_valued(arg.a)
+    return arg.operator in _COMPARISONS or arg.operator in _JUNCTIONS
+
+
+def _is_total(arg: Any) -> bool:
+    """Whether evaluating a condition never fails: ordering comparisons fail on mixed types."""
+    if not isinstance(arg, Condition):
+        return _is_constant(arg) or isinstance(arg, (Ref, str))
+    op = arg.operator
+    if op is operator.not_:
+        return _is_total(arg.a)
+    if op in (operator.eq, operator.ne) or op in _JUNCTIONS:
+        return _is_total(arg.a) and _is_total(arg.b)
+    return False
+
+
+def _cost(arg: Any) -> int:
+    """Estimated cost of evaluating a condition: lookups of path keys and operators."""
+    if isinstance(arg, Ref):
+        return 1 + arg.attr_name.count(".")
+    if isinstance(arg, str) and arg.startswith("$"):
+        return 1 + arg.count(".")
+    if not isinstance(arg, Condition):
+        return 0
+    cost = 1 + _cost(arg.a) + _cost(arg.b)
+    if arg.operator in (operator.eq, operator.ne) and not (
+        _is_constant(arg.a) or _is_constant(arg.b)
+    ):
+        # deep equality of two selected values
+        cost += 2
+    return cost
+
+
+def _fold(condition: "Condition") -> "Condition | bool":
+    """The value of a condition of constants, the condition itself when it fails."""
+    try:
+        result = compile_jsonata(condition.jsonata(top=False)).evaluate()
+    except JSONataError:
+        return condition
+    return result if type(result) is bool else condition
+
+
+def _operands(op: Any, arg: Any) -> list:
+    """Operands of a chain of one junction, a and b and c."""
+    if isinstance(arg, Condition) and arg.operator is op and arg.b is not None:
+        return _operands(op, arg.a) + _operands(op, arg.b)
+    return [arg]
+
+
+def _absorbed(op: Any, operand: Any, seen: set[str]) -> bool:
+    """
+    Whether an operand of a chain of op is implied by the operands before it: x and
+    (x or y) is x, provided the operands of the inner chain before x cannot fail.
+    """
+    inner = operator.or_ if op is operator.and_ else operator.and_
+    if not (isinstance(operand, Condition) and operand.operator is inner):
+        return False
+    for arg in _operands(inner, operand):
+        if _render(arg) in seen:
+            return True
+        if not _is_total(arg):
+            return False
+    return False
+
+
+def _optimize_junction(op: Any, condition: "Condition") -> "Condition | bool":
+    operands = []
+    for operand in _operands(op, condition):
+        operands.extend(_operands(op, optimize(operand)))
+    # true decides an or and false an and, the other constant changes nothing
+    deciding = op is operator.or_
+    kept: list = []
+    seen: set[str] = set()
+    for operand in operands:
+        if type(operand) is bool:
+            if operand is not deciding:
+                continue
+            # operands after it are never evaluated, those before may still fail
+            if all(_is_total(arg) for arg in kept):
+                return deciding
+            kept.append(operand)
+            break
+        key = _render(operand)
+        if key in seen or _absorbed(op, operand, seen):
+            continue
+        seen.add(key)
+        kept.append(operand)
+    if not kept:
+        return not deciding
+    if len(kept) == 1:
+        if _is_boolean_valued(kept[0]):
+            return kept[0]
+        # the junction casts its operand to a boolean
+        kept.append(not deciding)
+    elif all(_is_total(arg) for arg in kept):
+        # evaluated in any order the chain gives the same result, cheap checks go first
+        kept.sort(key=_cost)
+    result = kept[0]
+    for operand in kept[1:]:
+        result = Condition(op, result, operand)
+    return result
+
+
+def optimize(condition: Any) -> "Condition | bool":
+    """
+    A condition equivalent to the given one as deployed JSONata and cheaper to
+    evaluate: comparisons and negations of constants folded, double negations
+    and repeated or constant operands of and/or chains dropped, and the operands
+    of a chain ordered by estimated cost when none of them can fail. A condition
+    which always or never holds becomes True or False.
+    """
+    if not isinstance(condition, Condition):
+        return condition
+    op = condition.operator
+    if op is operator.not_ and condition.b is None:
+        operand = optimize(condition.a)
+        if _is_constant(operand):
+            return _fold(Condition(op, operand))
+        if (
+            isinstance(operand, Condition)
+            and operand.operator is operator.not_
+            and _is_boolean_valued(operand.a)
+        ):
+            return operand.a
+        return Condition(op, operand)
+    if op in _JUNCTIONS and condition.b is not None:
+        return _optimize_junction(op, condition)
+    if op in _COMPARISONS:
+        a, b = optimize(condition.a), optimize(condition.b)
+        if _is_constant(a) and _is_constant(b):
+            return _fold(Condition(op, a, b))
+        return Condition(op, a, b)
+    return condition
+
+
+# types of literals an equality may be dispatched on by hashing: JSON scalars, whose
+# equal values hash alike (a None operand makes a condition unary)
+_DISPATCHABLE = (str, int, float, bool)
+
+
+def _key(value: Any) -> Any:
+    # JSONata equality never holds between a boolean and a number, unlike 1 == True
+    return (True, value) if type(value) is bool else value
+
+
+def _is_literal(value: Any) -> bool:
+    if type(value) not in _DISPATCHABLE:
+        return False
+    if isinstance(value, str):
+        return not value.startswith("$")
+    # NaN equals nothing, not even itself
+    return value == value
+
+
+def equalities(condition: Any) -> tuple[str, tuple] | None:
+    """
+    (reference path, literals) when the condition holds exactly when the reference
+    equals one of the literals: an equality of a Ref and a literal, or an or of
+    such equalities on the same Ref. None for any other condition.
+    """
+    if not isinstance(condition, Condition):
+        return None
+    if condition.operator is operator.or_:
+        a, b = equalities(condition.a), equalities(condition.b)
+        if a is None or b is None or a[0] != b[0]:
+            return None
+        return a[0], a[1] + b[1]
+    if condition.operator is not operator.eq:
+        return None
+    ref, literal = condition.a, condition.b
+    if not isinstance(ref, Ref):
+        ref, literal = literal, ref
+    if not isinstance(ref, Ref) or not _is_literal(literal):
+        return None
+    return ref.attr_name, (literal,)
+
+
+def equality_table(rules: Iterable[tuple[Any, Any]]) -> tuple[str, dict] | None:
+    """
+    Dispatch table of (condition, target) rules which are all equalities on one
+    reference: the path of the reference, and per literal the target of the first
+    rule it satisfies. None when a rule is not such an equality.
+    """
+    path = None
+    table: dict[Any, Any] = {}
+    for condition, target in rules:
+        match = equalities(condition)
+        if match is None or (path is not None and match[0] != path):
+            return None
+        path = match[0]
+        for literal in match[1]:
+            table.setdefault(_key(literal), target)
+    if path is None:
+        return None
+    return path, table
+
+
+def dispatcher(path: str, table: dict, default: Any) -> Callable[[Any, Any], Any]:
+    """
+    Function of (event, context) giving the target of the value the reference to
+    path selects from the event, as the deployed condition selects it, default
+    when no literal of the table equals it.
+    """
+    select = compile_selector(reference(path))
+
+    def choose(event: Any, context: Any) -> Any:
+        value = select(event, context)
+        kind = type(value)
+        if kind is str or kind is int or kind is float:
+            return table.get(value, default)
+        if kind is bool:
+            return table.get((True, value), default)
+        # undefined, null, arrays and objects equal no literal of the table
+        return default
+
+    return choose
+
+
+def test_optimize():
+    from airfunctions.jsonata import compile_condition
+
+    a, b = Ref("a") == 1, Ref("b.c") > 2
+    assert optimize(a & a) is not a and optimize(a & a).jsonata() == a.jsonata()
+    assert (a & (a | b)).jsonata() == "{% $states.input.a = 1 %}"
+    assert ((Ref("b.c") == 2) & Ref("x")).jsonata() == "{% $states.input.x and $states.input.b.c = 2 %}"
+    assert (b & Ref("x")).jsonata() == "{% $states.input.b.c > 2 and $states.input.x %}"
+    assert (Ref("x") & Ref("x")).jsonata() == "{% $states.input.x and true %}"
+    assert optimize((Condition(operator.eq, 1, 1) | b)) is True
+    assert optimize(~~a).jsonata() == a.jsonata()
+    # the ordering comparison may fail, so a later false does not decide the and
+    assert optimize(b & (Condition(operator.eq, 1, 2))).jsonata() == "{% $states.input.b.c > 2 and false %}"
+    conditions = [a & a, (a | b) & ~~a, b & Ref("x"), ~(a | (Ref("x") == Ref("y"))) | b]
+    events = [{}, {"a": 1}, {"a": True, "b": {"c": 3}}, {"a": 1, "x": [1], "y": [1]}, {"b": {"c": "s"}}]
+    for condition in conditions:
+        raw = compile_condition(condition.jsonata(top=False))
+        optimized = compile_condition(condition.jsonata())
+        for event in events:
+            results = []
+            for check in (raw, optimized):
+                try:
+                    results.append(check(event, None))
+                except JSONataError:
+                    results.append("error")
+            assert results[0] == results[1], (condition, event, results)
+
+
+def test_compile():
+    condition = (Ref("a") == 1) & ~(Ref("b.c") > 2)
+    compiled = condition.compile()
+    for event in [{"a": 1, "b": {"c": 1}}, {"a": 1, "b": {"c": 3}}, {"a": 2, "b": {"c": 0}}]:
+        assert compiled(event, None) is condition.evaluate(event, None)
+
+
+if __name__ == "__main__":
+    test_optimize()
+    test_compile()
+    print("All tests passed!")
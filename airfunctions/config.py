@@ -25,6 +25,10 @@ class Config:
         self.lambda_module_version = "7.20.1"
         self.lambda_module_source = "terraform-aws-modules/lambda/aws"
         self.aws_region = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION") or "us-east-1"
+        self.local_executor = os.environ.get("AIRFUNCTIONS_LOCAL_EXECUTOR", "sequential")
+        self.local_max_concurrency = None
+        self.local_s3_dir = os.environ.get("AIRFUNCTIONS_LOCAL_S3_DIR", "./s3")
+        self.local_clock = os.environ.get("AIRFUNCTIONS_LOCAL_CLOCK", "virtual")
 
     def reset(self):
         self._initialize_defaults()
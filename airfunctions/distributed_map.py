@@ -0,0 +1,259 @@
+import csv
+import json
+import mmap
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from airfunctions.config import Config
+from airfunctions.jsonpath import JSONPath
+
+S3_GET_OBJECT = "arn:aws:states:::s3:getObject"
+S3_PUT_OBJECT = "arn:aws:states:::s3:putObject"
+
+
+def local_s3_path(bucket: str, key: str = "") -> Path:
+    """Map an S3 location to a path below Config().local_s3_dir for local runs."""
+    return Path(Config().local_s3_dir) / bucket / key
+
+
+# Already read pages of a mapped file are released every RELEASE_BYTES
+RELEASE_BYTES = 64 * 1024 * 1024
+
+
+def iter_lines(path: Path | str) -> Iterator[bytes]:
+    """
+    Yield the lines of a file through a read-only memory map.
+    Pages are loaded by the OS on demand and released once read, so memory use
+    does not grow with file size.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            can_release = hasattr(mm, "madvise") and hasattr(mmap, "MADV_DONTNEED")
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            released = 0
+            while True:
+                line = mm.readline()
+                if not line:
+                    return
+                yield line
+
+                position = mm.tell()
+                if can_release and position - released >= RELEASE_BYTES:
+                    end = position - position % mmap.PAGESIZE
+                    mm.madvise(mmap.MADV_DONTNEED, released, end - released)
+                    released = end
+
+
+def iter_jsonl(path: Path | str) -> Iterator[Any]:
+    for line in iter_lines(path):
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_csv(path: Path | str, header: list[str] | None = None) -> Iterator[dict]:
+    """Yield CSV rows as dicts, keyed by the first row unless a header is given."""
+    rows = csv.reader(line.decode("utf-8") for line in iter_lines(path))
+    if header is None:
+        header = next(rows, None)
+        if header is None:
+            return
+    for row in rows:
+        if row:
+            yield dict(zip(header, row))
+
+
+class ItemReader:
+    """Reads Map items from a JSONL or CSV object in S3."""
+
+    INPUT_TYPES = ("JSONL", "CSV")
+
+    def __init__(
+        self,
+        bucket: str,
+        key: str,
+        input_type: str = "JSONL",
+        csv_header: list[str] | None = None,
+        max_items: int | None = None,
+    ):
+        if input_type not in self.INPUT_TYPES:
+            raise ValueError(
+                f"Input type {input_type} not supported, use one of {self.INPUT_TYPES}."
+            )
+        self.bucket = bucket
+        self.key = key
+        self.input_type = input_type
+        self.csv_header = csv_header
+        self.max_items = max_items
+
+    def definition(self) -> dict:
+        reader_config: dict[str, Any] = {"InputType": self.input_type}
+        if self.input_type == "CSV":
+            if self.csv_header:
+                reader_config["CSVHeaderLocation"] = "GIVEN"
+                reader_config["CSVHeaders"] = self.csv_header
+            else:
+                reader_config["CSVHeaderLocation"] = "FIRST_ROW"
+        if self.max_items:
+            reader_config["MaxItems"] = self.max_items
+        return {
+            "Resource": S3_GET_OBJECT,
+            "ReaderConfig": reader_config,
+            "Parameters": {"Bucket": self.bucket, "Key": self.key},
+        }
+
+    def iter_items(self) -> Iterator[Any]:
+        """Stream items from the local copy of the object."""
+        path = local_s3_path(self.bucket, self.key)
+        if self.input_type == "CSV":
+            items = iter_csv(path, self.csv_header)
+        else:
+            items = iter_jsonl(path)
+        for count, item in enumerate(items):
+            if self.max_items and count >= self.max_items:
+                return
+            yield item
+
+
+class ItemBatcher:
+    """Groups Map items into batches passed to child executions as {"Items": [...]}."""
+
+    def __init__(
+        self,
+        max_items_per_batch: int | None = None,
+        max_input_bytes_per_batch: int | None = None,
+        batch_input: dict | None = None,
+    ):
+        if not max_items_per_batch and not max_input_bytes_per_batch:
+            raise ValueError(
+                "max_items_per_batch and max_input_bytes_per_batch are None. At least one needs to be defined."
+            )
+        self.max_items_per_batch = max_items_per_batch
+        self.max_input_bytes_per_batch = max_input_bytes_per_batch
+        self.batch_input = batch_input
+        if batch_input:
+            self.batch_input_template = JSONPath().compile_template(batch_input)
+
+    def definition(self) -> dict:
+        definition: dict[str, Any] = {}
+        if self.max_items_per_batch:
+            definition["MaxItemsPerBatch"] = self.max_items_per_batch
+        if self.max_input_bytes_per_batch:
+            definition["MaxInputBytesPerBatch"] = self.max_input_bytes_per_batch
+        if self.batch_input:
+            definition["BatchInput"] = self.batch_input
+        return definition
+
+    def batches(self, items: Iterable[Any], event: Any) -> Iterator[dict]:
+        """Lazily group items, a single item larger than the byte limit gets its own batch."""
+        batch_input = (
+            self.batch_input_template.render(event) if self.batch_input else None
+        )
+        max_items = self.max_items_per_batch
+        max_bytes = self.max_input_bytes_per_batch
+
+        def make(batch: list) -> dict:
+            if batch_input is None:
+                return {"Items": batch}
+            return {"BatchInput": batch_input, "Items": batch}
+
+        batch: list = []
+        size = 0
+        for item in items:
+            item_size = len(json.dumps(item)) if max_bytes else 0
+            if batch and (
+                (max_items and len(batch) >= max_items)
+                or (max_bytes and size + item_size > max_bytes)
+            ):
+                yield make(batch)
+                batch, size = [], 0
+            batch.append(item)
+            size += item_size
+        if batch:
+            yield make(batch)
+
+
+class ShardWriter:
+    """Streams results into JSON array files of at most max_items_per_shard entries."""
+
+    def __init__(self, directory: Path, name: str, max_items_per_shard: int):
+        self.directory = directory
+        self.name = name
+        self.max_items_per_shard = max_items_per_shard
+        self.files: list[Path] = []
+        self._file = None
+        self._count = 0
+
+    def write(self, result: Any):
+        if self._file is None or self._count >= self.max_items_per_shard:
+            self._close_shard()
+            path = self.directory / f"{self.name}_{len(self.files)}.json"
+            self.files.append(path)
+            self._file = open(path, "w")
+            self._file.write("[")
+            self._count = 0
+        if self._count:
+            self._file.write(",")
+        json.dump(result, self._file)
+        self._count += 1
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.write("]")
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self._close_shard()
+
+
+class ResultWriter:
+    """Writes Map results to S3 as sharded JSON files with a manifest."""
+
+    def __init__(self, bucket: str, prefix: str, max_items_per_shard: int = 1000):
+        self.bucket = bucket
+        self.prefix = prefix
+        # Local only, Step Functions decides the size of result files itself
+        self.max_items_per_shard = max_items_per_shard
+
+    def definition(self) -> dict:
+        return {
+            "Resource": S3_PUT_OBJECT,
+            "Parameters": {"Bucket": self.bucket, "Prefix": self.prefix},
+        }
+
+    def write(self, results: Iterable[Any]) -> dict:
+        """Consume results into shard files and return the ResultWriterDetails output."""
+        map_run_id = str(uuid.uuid4())
+        key_prefix = f"{self.prefix.rstrip('/')}/{map_run_id}"
+        directory = local_s3_path(self.bucket, key_prefix)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        writer = ShardWriter(directory, "SUCCEEDED", self.max_items_per_shard)
+        try:
+            for result in results:
+                writer.write(result)
+        finally:
+            writer.close()
+
+        manifest_key = f"{key_prefix}/manifest.json"
+        manifest = {
+            "DestinationBucket": self.bucket,
+            "MapRunArn": map_run_id,
+            "ResultFiles": {
+                "FAILED": [],
+                "PENDING": [],
+                "SUCCEEDED": [
+                    {"Key": f"{key_prefix}/{path.name}", "Size": path.stat().st_size}
+                    for path in writer.files
+                ],
+            },
+        }
+        with open(local_s3_path(self.bucket, manifest_key), "w") as f:
+            json.dump(manifest, f)
+
+        return {"ResultWriterDetails": {"Bucket": self.bucket, "Key": manifest_key}}
@@ -0,0 +1,86 @@
+from typing import Any, Callable, Iterable
+
+from airfunctions.jsonpath import JSONPath
+
+STATES_ALL = "States.ALL"
+STATES_TASK_FAILED = "States.TaskFailed"
+
+
+def error_name(error: BaseException) -> str:
+    """Name of an error as matched against ErrorEquals, the exception class name."""
+    return type(error).__name__
+
+
+def error_output(error: BaseException) -> dict:
+    """Error output of a failed state, as passed to a catcher."""
+    return {"Error": error_name(error), "Cause": str(error)}
+
+
+class ErrorMatcher:
+    """
+    Finds the first of a list of ErrorEquals rules matching an error with a single
+    dict lookup. States.ALL matches any error and States.TaskFailed any error of a
+    Task state.
+    """
+
+    def __init__(self, rules: Iterable[Iterable[str]], task: bool = True):
+        self._names: dict[str, int] = {}
+        self._wildcard: int | None = None
+        for index, error_equals in enumerate(rules):
+            for name in error_equals:
+                if name == STATES_ALL or (task and name == STATES_TASK_FAILED):
+                    if self._wildcard is None:
+                        self._wildcard = index
+                else:
+                    self._names.setdefault(name, index)
+
+    def match(self, error: BaseException) -> int | None:
+        """Index of the first rule matching the error, None when none does."""
+        index = self._names.get(error_name(error))
+        if self._wildcard is None:
+            return index
+        if index is None:
+            return self._wildcard
+        return min(index, self._wildcard)
+
+
+def error_equals(errors: Iterable[str | type[BaseException]] | str | type[BaseException]) -> list[str]:
+    """ErrorEquals names of errors given as names or exception classes."""
+    if isinstance(errors, (str, type)):
+        errors = [errors]
+    return [err.__name__ if isinstance(err, type) else str(err) for err in errors]
+
+
+class CatchPolicy:
+    """
+    Catch blocks of a state. The first catcher matching an error gives the state to
+    continue at, with the error output placed in the state input by its ResultPath.
+    """
+
+    def __init__(self, catchers: list[dict], task: bool = True):
+        self.catchers = catchers
+        self.matcher = ErrorMatcher((catcher["ErrorEquals"] for catcher in catchers), task)
+        self._results = tuple(_bind_result_path(catcher) for catcher in catchers)
+
+    @property
+    def targets(self) -> list[str]:
+        return [catcher["Next"] for catcher in self.catchers]
+
+    def catch(self, error: BaseException, data: Any) -> tuple[int, Any] | None:
+        """Index of the matching catcher and the output for its Next state, None when none matches."""
+        index = self.matcher.match(error)
+        if index is None:
+            return None
+        return index, self._results[index](data, error_output(error))
+
+    def __repr__(self):
+        return f"CatchPolicy({self.catchers})"
+
+
+def _bind_result_path(catcher: dict) -> Callable[[Any, dict], Any]:
+    # no ResultPath replaces the input with the error output, null discards the error
+    if "ResultPath" not in catcher or catcher["ResultPath"] == "$":
+        return lambda data, output: output
+    if catcher["ResultPath"] is None:
+        return lambda data, output: data
+    return JSONPath.compile(catcher["ResultPath"]).assign
@@ -0,0 +1,154 @@
+import os
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, Executor, Future,
+                                ProcessPoolExecutor, ThreadPoolExecutor, wait)
+from typing import Any, Callable, Iterable, Iterator
+
+from airfunctions.config import Config
+
+
+class LocalExecutor:
+    """
+    Runs units of local work (Parallel branches, Map items) and yields their results
+    in submission order.
+    """
+
+    def __init__(self, max_concurrency: int | None = None):
+        if max_concurrency is not None and max_concurrency < 0:
+            raise ValueError("max_concurrency cannot be negative.")
+        # 0 means no limit, as MaxConcurrency does in Step Functions
+        self.max_concurrency = max_concurrency or None
+
+    def map(self, func: Callable[[Any], Any], items: Iterable[Any]) -> Iterator[Any]:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(max_concurrency={self.max_concurrency})"
+
+
+class SequentialExecutor(LocalExecutor):
+    """Runs items one after another in the calling thread."""
+
+    def map(self, func: Callable[[Any], Any], items: Iterable[Any]) -> Iterator[Any]:
+        for item in items:
+            yield func(item)
+
+
+class PoolExecutor(LocalExecutor):
+    """
+    Runs items on a concurrent.futures pool created for each map call.
+    At most max_concurrency items run at once and at most twice as many are queued,
+    so long inputs are streamed. The first failing item cancels the items that have
+    not started yet and its exception is raised to the caller.
+    """
+
+    def _create_pool(self, max_workers: int) -> Executor:
+        raise NotImplementedError
+
+    def _default_workers(self) -> int:
+        return os.cpu_count() or 1
+
+    def map(self, func: Callable[[Any], Any], items: Iterable[Any]) -> Iterator[Any]:
+        if isinstance(items, (list, tuple)):
+            if not items:
+                return
+            max_workers = min(len(items), self.max_concurrency or len(items))
+        else:
+            max_workers = self.max_concurrency or self._default_workers()
+
+        pool = self._create_pool(max_workers)
+        try:
+            yield from map_ordered(pool, func, iter(items), 2 * max_workers)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ThreadExecutor(PoolExecutor):
+    """Runs items on a thread pool, suited for I/O-bound handlers."""
+
+    def _create_pool(self, max_workers: int) -> Executor:
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    def _default_workers(self) -> int:
+        return min(32, (os.cpu_count() or 1) + 4)
+
+
+class ProcessExecutor(PoolExecutor):
+    """
+    Runs items on a process pool, suited for CPU-bound handlers.
+    Items, the function and their results must be picklable.
+    """
+
+    def _create_pool(self, max_workers: int) -> Executor:
+        return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def map_ordered(
+    pool: Executor, func: Callable[[Any], Any], items: Iterator[Any], window: int
+) -> Iterator[Any]:
+    """
+    Submit items to a pool keeping at most window of them in flight and yield the
+    results in submission order. The first failure cancels the pending items.
+    """
+    pending: deque[Future] = deque()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append(pool.submit(func, item))
+
+            if not pending:
+                return
+
+            for future in pending:
+                if future.done() and future.exception() is not None:
+                    raise future.exception()
+
+            head = pending[0]
+            if head.done():
+                pending.popleft()
+                yield head.result()
+            else:
+                wait(
+                    [future for future in pending if not future.done()],
+                    return_when=FIRST_COMPLETED,
+                )
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+EXECUTORS: dict[str, type[LocalExecutor]] = {
+    "sequential": SequentialExecutor,
+    "thread": ThreadExecutor,
+    "process": ProcessExecutor,
+}
+
+
+def get_executor(
+    executor: str | LocalExecutor | None = None, max_concurrency: int | None = None
+) -> LocalExecutor:
+    """
+    Resolve an executor given by name or instance.
+    None falls back to Config().local_executor and Config().local_max_concurrency.
+    """
+    if isinstance(executor, LocalExecutor):
+        return executor
+
+    if executor is None:
+        executor = Config().local_executor
+    if max_concurrency is None:
+        max_concurrency = Config().local_max_concurrency
+
+    try:
+        executor_cls = EXECUTORS[executor]
+    except KeyError:
+        raise ValueError(
+            f"Executor {executor} not recognized, use one of {list(EXECUTORS)}."
+        )
+    return executor_cls(max_concurrency)
@@ -1,11 +1,16 @@
 import base64
+import copy
 import hashlib
 import json
+import operator
 import random
-import re
 import sys
+import threading
 import uuid
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from functools import partial
+from itertools import compress
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 
 ModuleType = type(sys)
 
@@ -123,6 +128,33 @@ class JSONPathLexer:
 
         return JSONPathToken(JSONPathToken.NAME, result)
 
+    def read_balanced(self) -> str:
+        """
+        Read raw text up to the parenthesis closing one that was already consumed.
+        Used for filter expressions, which have their own grammar.
+        """
+        start = self.pos
+        depth = 1
+        quote_char = None
+        while self.current_char is not None:
+            if quote_char:
+                if self.current_char == "\\":
+                    self.advance()
+                elif self.current_char == quote_char:
+                    quote_char = None
+            elif self.current_char in ("'", '"'):
+                quote_char = self.current_char
+            elif self.current_char == "(":
+                depth += 1
+            elif self.current_char == ")":
+                depth -= 1
+                if depth == 0:
+                    text = self.path[start : self.pos]
+                    self.advance()
+                    return text
+            self.advance()
+        self.error(f"Unterminated filter expression starting at position {start}")
+
     def get_next_token(self) -> Optional[JSONPathToken]:
         """Get the next token from the input."""
         while self.current_char is not None:
@@ -393,15 +425,22 @@ class JSONPathParser:
                     and self.current_token.type == JSONPathToken.FILTER
                 ):
                     self.eat(JSONPathToken.FILTER)
-                    # In a real implementation, we would parse filter expressions here
-                    # For simplicity, we'll just capture the entire filter text
-                    # This is a simplification; a real implementation would parse this properly
-                    self.eat(JSONPathToken.LPAREN)
-                    # TODO: Parse filter expression
-                    filter_expr = "..."  # Placeholder
-                    self.eat(JSONPathToken.RPAREN)
+                    if (
+                        not self.current_token
+                        or self.current_token.type != JSONPathToken.LPAREN
+                    ):
+                        self.error("Expected '(' after '?' in filter expression")
+                    # The lexer stands right after '(', the filter text has its own grammar
+                    filter_expr = self.lexer.read_balanced()
+                    self.current_token = self.lexer.get_next_token()
                     self.eat(JSONPathToken.RBRACKET)
-                    operations.append({"op": "filter", "expr": filter_expr})
+                    operations.append(
+                        {
+                            "op": "filter",
+                            "expr": filter_expr,
+                            "filter": JSONPathFilter(filter_expr),
+                        }
+                    )
 
                 else:
                     self.error("Unexpected token inside brackets")
@@ -412,6 +451,521 @@ class JSONPathParser:
         return operations
 
 
+def iter_containers(node: Any) -> Iterator[Any]:
+    """
+    Yield node and all dicts and lists nested in it in document order.
+    Uses an explicit stack, so deeply nested documents do not hit the recursion limit.
+    """
+    if not isinstance(node, (dict, list)):
+        return
+    yield node
+    stack = [iter(node.values() if isinstance(node, dict) else node)]
+    while stack:
+        for child in stack[-1]:
+            if isinstance(child, dict):
+                yield child
+                stack.append(iter(child.values()))
+                break
+            elif isinstance(child, list):
+                yield child
+                stack.append(iter(child))
+                break
+        else:
+            stack.pop()
+
+
+def iter_recursive_descent(node: Any, name: str) -> Iterator[Any]:
+    """Lazily yield the values of every field called name below node (`..name`)."""
+    for container in iter_containers(node):
+        if isinstance(container, dict) and name in container:
+            yield container[name]
+
+
+def iter_recursive_wildcard(node: Any) -> Iterator[Any]:
+    """Lazily yield every value below node (`..*`)."""
+    for container in iter_containers(node):
+        if isinstance(container, dict):
+            yield from container.values()
+        else:
+            yield from container
+
+
+class FilterToken:
+    """Represents a token in a filter expression."""
+
+    PATH = "PATH"  # @.price
+    STRING = "STRING"  # 'abc'
+    NUMBER = "NUMBER"  # 10, -1.5
+    LITERAL = "LITERAL"  # null, true, false
+    COMPARE = "COMPARE"  # ==, !=, <, <=, >, >=
+    AND = "AND"  # &&
+    OR = "OR"  # ||
+    NOT = "NOT"  # !
+    LPAREN = "LPAREN"  # (
+    RPAREN = "RPAREN"  # )
+
+    def __init__(self, type: str, value: Any = None):
+        self.type = type
+        self.value = value
+
+    def __repr__(self):
+        if self.value is not None:
+            return f"<{self.type}:{self.value}>"
+        return f"<{self.type}>"
+
+
+class FilterLexer:
+    """Tokenizes the expression inside `[?(...)]`."""
+
+    COMPARATORS = {
+        "==": operator.eq,
+        "!=": operator.ne,
+        "<=": operator.le,
+        ">=": operator.ge,
+        "<": operator.lt,
+        ">": operator.gt,
+    }
+    LITERALS = {"null": None, "true": True, "false": False}
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.pos = 0
+
+    def error(self, message: str):
+        raise JSONPathError(
+            f"Filter error at position {self.pos} in {self.expression!r}: {message}"
+        )
+
+    @property
+    def current_char(self) -> Optional[str]:
+        if self.pos >= len(self.expression):
+            return None
+        return self.expression[self.pos]
+
+    def path(self) -> FilterToken:
+        """Parse an `@` path up to the next operator, parenthesis or whitespace."""
+        start = self.pos
+        self.pos += 1
+        depth = 0
+        quote_char = None
+        while self.current_char is not None:
+            char = self.current_char
+            if quote_char:
+                if char == quote_char:
+                    quote_char = None
+            elif char in ("'", '"') and depth:
+                quote_char = char
+            elif char == "[":
+                depth += 1
+            elif char == "]":
+                depth -= 1
+            elif not depth and not (char.isalnum() or char in "_.*"):
+                break
+            self.pos += 1
+        return FilterToken(FilterToken.PATH, self.expression[start : self.pos])
+
+    def string(self) -> FilterToken:
+        quote_char = self.current_char
+        self.pos += 1
+        result = []
+        while self.current_char is not None and self.current_char != quote_char:
+            if self.current_char == "\\" and self.pos + 1 < len(self.expression):
+                self.pos += 1
+            result.append(self.current_char)
+            self.pos += 1
+        if self.current_char is None:
+            self.error("Unterminated string")
+        self.pos += 1
+        return FilterToken(FilterToken.STRING, "".join(result))
+
+    def number(self) -> FilterToken:
+        start = self.pos
+        if self.current_char == "-":
+            self.pos += 1
+        while self.current_char is not None and (
+            self.current_char.isdigit() or self.current_char in ".eE"
+        ):
+            self.pos += 1
+        text = self.expression[start : self.pos]
+        try:
+            value = int(text) if text.lstrip("-").isdigit() else float(text)
+        except ValueError:
+            self.error(f"Invalid number: {text}")
+        return FilterToken(FilterToken.NUMBER, value)
+
+    def tokenize(self) -> List[FilterToken]:
+        tokens = []
+        while self.current_char is not None:
+            char = self.current_char
+            two = self.expression[self.pos : self.pos + 2]
+            if char.isspace():
+                self.pos += 1
+            elif char == "@":
+                tokens.append(self.path())
+            elif char == "$":
+                self.error("Only @ paths are supported in filter expressions")
+            elif char in ("'", '"'):
+                tokens.append(self.string())
+            elif char.isdigit() or (char == "-" and two[1:].isdigit()):
+                tokens.append(self.number())
+            elif two in self.COMPARATORS:
+                tokens.append(FilterToken(FilterToken.COMPARE, two))
+                self.pos += 2
+            elif char in self.COMPARATORS:
+                tokens.append(FilterToken(FilterToken.COMPARE, char))
+                self.pos += 1
+            elif two == "&&":
+                tokens.append(FilterToken(FilterToken.AND))
+                self.pos += 2
+            elif two == "||":
+                tokens.append(FilterToken(FilterToken.OR))
+                self.pos += 2
+            elif char == "!":
+                tokens.append(FilterToken(FilterToken.NOT))
+                self.pos += 1
+            elif char == "(":
+                tokens.append(FilterToken(FilterToken.LPAREN))
+                self.pos += 1
+            elif char == ")":
+                tokens.append(FilterToken(FilterToken.RPAREN))
+                self.pos += 1
+            elif char.isalpha():
+                start = self.pos
+                while self.current_char is not None and self.current_char.isalpha():
+                    self.pos += 1
+                word = self.expression[start : self.pos]
+                if word not in self.LITERALS:
+                    self.pos = start
+                    self.error(f"Unexpected word: {word}")
+                tokens.append(FilterToken(FilterToken.LITERAL, self.LITERALS[word]))
+            else:
+                self.error(f"Unexpected character: {char}")
+        return tokens
+
+
+# Comparison with the operands swapped, used to bind the literal side first
+_REFLECTED = {
+    operator.eq: operator.eq,
+    operator.ne: operator.ne,
+    operator.lt: operator.gt,
+    operator.le: operator.ge,
+    operator.gt: operator.lt,
+    operator.ge: operator.le,
+}
+
+
+class FilterLiteral:
+    """A constant operand of a filter expression."""
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def getter(self) -> Callable[[Any], Any]:
+        value = self.value
+        return lambda item: value
+
+
+class FilterPath:
+    """An `@` path operand, evaluated relative to the filtered item."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.compiled = JSONPath.compile("$" + path[1:])
+
+    @property
+    def key(self) -> Optional[str]:
+        """The field name when the path is a single `@.field` step."""
+        operations = self.compiled.operations
+        if len(operations) == 1 and operations[0]["op"] == "field":
+            return operations[0]["name"]
+        return None
+
+    def getter(self) -> Callable[[Any], Any]:
+        """Return a function giving the path value of an item, or _MISSING."""
+        if self.compiled.simple:
+            return compile_simple_path(self.compiled.operations)
+
+        find = self.compiled.find
+
+        def get(item: Any) -> Any:
+            matches = find(item)
+            if not matches:
+                return _MISSING
+            return matches[0] if len(matches) == 1 else matches
+
+        return get
+
+
+class FilterExists:
+    """A bare operand: a path that must match, or a truthy literal."""
+
+    def __init__(self, operand: Any):
+        self.operand = operand
+
+    def compile(self) -> Callable[[Any], bool]:
+        if isinstance(self.operand, FilterLiteral):
+            value = bool(self.operand.value)
+            return lambda item: value
+
+        get = self.operand.getter()
+        return lambda item: get(item) is not _MISSING
+
+    def compile_batch(self) -> Optional[Callable[[List[Any]], Optional[List[Any]]]]:
+        return None
+
+
+class FilterCompare:
+    """A comparison between two operands."""
+
+    def __init__(self, op: Callable[[Any, Any], bool], left: Any, right: Any):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def compile(self) -> Callable[[Any], bool]:
+        op = self.op
+        if isinstance(self.right, FilterLiteral) or isinstance(
+            self.left, FilterLiteral
+        ):
+            if isinstance(self.right, FilterLiteral):
+                get, value, op = self.left.getter(), self.right.value, _REFLECTED[op]
+            else:
+                get, value = self.right.getter(), self.left.value
+
+            # op(value, a) with the literal already bound on the left side
+            def compare_literal(item: Any) -> bool:
+                a = get(item)
+                if a is _MISSING:
+                    return False
+                try:
+                    return op(value, a)
+                except TypeError:
+                    return False
+
+            return compare_literal
+
+        get_left = self.left.getter()
+        get_right = self.right.getter()
+
+        def compare(item: Any) -> bool:
+            a = get_left(item)
+            b = get_right(item)
+            if a is _MISSING or b is _MISSING:
+                return False
+            try:
+                return op(a, b)
+            except TypeError:
+                return False
+
+        return compare
+
+    def compile_batch(self) -> Optional[Callable[[List[Any]], Optional[List[Any]]]]:
+        """
+        Compile `@.field OP literal` into a function filtering a whole list at once.
+        The field values are fetched and compared with C-level map/compress calls.
+        The function returns None when the list is not made of dicts holding the
+        field with values of the literal's type, the caller then falls back to the
+        per-item predicate.
+        """
+        if isinstance(self.left, FilterPath) and isinstance(self.right, FilterLiteral):
+            path, value, op = self.left, self.right.value, self.op
+        elif isinstance(self.right, FilterPath) and isinstance(
+            self.left, FilterLiteral
+        ):
+            path, value, op = self.right, self.left.value, _REFLECTED[self.op]
+        else:
+            return None
+
+        key = path.key
+        if key is None:
+            return None
+
+        if op in (operator.eq, operator.ne):
+            allowed_types = None
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            allowed_types = {int, float}
+        elif isinstance(value, str):
+            allowed_types = {str}
+        else:
+            return None
+
+        get = operator.itemgetter(key)
+        test = partial(_REFLECTED[op], value)
+
+        def batch(items: List[Any]) -> Optional[List[Any]]:
+            try:
+                values = list(map(get, items))
+            except (KeyError, TypeError, IndexError):
+                return None
+            if allowed_types is not None and not set(map(type, values)) <= allowed_types:
+                return None
+            return list(compress(items, map(test, values)))
+
+        return batch
+
+
+class FilterNot:
+    """Negation of a filter expression."""
+
+    def __init__(self, operand: Any):
+        self.operand = operand
+
+    def compile(self) -> Callable[[Any], bool]:
+        predicate = self.operand.compile()
+        return lambda item: not predicate(item)
+
+    def compile_batch(self) -> Optional[Callable[[List[Any]], Optional[List[Any]]]]:
+        return None
+
+
+class FilterAnd:
+    """Conjunction of two filter expressions."""
+
+    def __init__(self, left: Any, right: Any):
+        self.left = left
+        self.right = right
+
+    def compile(self) -> Callable[[Any], bool]:
+        left = self.left.compile()
+        right = self.right.compile()
+        return lambda item: left(item) and right(item)
+
+    def compile_batch(self) -> Optional[Callable[[List[Any]], Optional[List[Any]]]]:
+        left = self.left.compile_batch()
+        right = self.right.compile_batch()
+        if left is None or right is None:
+            return None
+
+        # Filtering the survivors of the left side keeps the original order
+        def batch(items: List[Any]) -> Optional[List[Any]]:
+            selected = left(items)
+            if selected is None:
+                return None
+            return right(selected)
+
+        return batch
+
+
+class FilterOr:
+    """Disjunction of two filter expressions."""
+
+    def __init__(self, left: Any, right: Any):
+        self.left = left
+        self.right = right
+
+    def compile(self) -> Callable[[Any], bool]:
+        left = self.left.compile()
+        right = self.right.compile()
+        return lambda item: left(item) or right(item)
+
+    def compile_batch(self) -> Optional[Callable[[List[Any]], Optional[List[Any]]]]:
+        return None
+
+
+class FilterParser:
+    """Recursive-descent parser for filter expressions."""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = FilterLexer(expression).tokenize()
+        self.pos = 0
+
+    def error(self, message: str):
+        raise JSONPathError(f"Invalid filter expression {self.expression!r}: {message}")
+
+    @property
+    def current_token(self) -> Optional[FilterToken]:
+        if self.pos >= len(self.tokens):
+            return None
+        return self.tokens[self.pos]
+
+    def accept(self, token_type: str) -> Optional[FilterToken]:
+        token = self.current_token
+        if token is not None and token.type == token_type:
+            self.pos += 1
+            return token
+        return None
+
+    def parse(self) -> Any:
+        if not self.tokens:
+            self.error("Empty filter expression")
+        node = self.or_()
+        if self.current_token is not None:
+            self.error(f"Unexpected token: {self.current_token}")
+        return node
+
+    def or_(self) -> Any:
+        node = self.and_()
+        while self.accept(FilterToken.OR):
+            node = FilterOr(node, self.and_())
+        return node
+
+    def and_(self) -> Any:
+        node = self.unary()
+        while self.accept(FilterToken.AND):
+            node = FilterAnd(node, self.unary())
+        return node
+
+    def unary(self) -> Any:
+        if self.accept(FilterToken.NOT):
+            return FilterNot(self.unary())
+        if self.accept(FilterToken.LPAREN):
+            node = self.or_()
+            if not self.accept(FilterToken.RPAREN):
+                self.error("Expected ')'")
+            return node
+
+        left = self.operand()
+        comparator = self.accept(FilterToken.COMPARE)
+        if comparator is None:
+            return FilterExists(left)
+        return FilterCompare(
+            FilterLexer.COMPARATORS[comparator.value], left, self.operand()
+        )
+
+    def operand(self) -> Any:
+        token = self.current_token
+        if token is None:
+            self.error("Unexpected end of expression")
+        self.pos += 1
+        if token.type == FilterToken.PATH:
+            return FilterPath(token.value)
+        if token.type in (FilterToken.STRING, FilterToken.NUMBER, FilterToken.LITERAL):
+            return FilterLiteral(token.value)
+        self.error(f"Unexpected token: {token}")
+
+
+class JSONPathFilter:
+    """
+    A `[?(...)]` filter compiled once into a Python predicate.
+    Lists of dicts compared on a single field are filtered in one batch.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        tree = FilterParser(expression).parse()
+        self.predicate = tree.compile()
+        self.batch = tree.compile_batch()
+
+    def select(self, node: Any) -> Iterator[Any]:
+        """Yield the items of an array, or values of an object, matching the filter."""
+        if isinstance(node, list):
+            if self.batch is not None:
+                selected = self.batch(node)
+                if selected is not None:
+                    return iter(selected)
+            return filter(self.predicate, node)
+        elif isinstance(node, dict):
+            return filter(self.predicate, node.values())
+        return iter(())
+
+    def __reduce__(self):
+        return (JSONPathFilter, (self.expression,))
+
+    def __repr__(self):
+        return f"JSONPathFilter({self.expression!r})"
+
+
 class JSONPathEvaluator:
     """Evaluates JSONPath expressions against JSON data."""
 
@@ -474,8 +1028,6 @@ class JSONPathEvaluator:
 
             for node in nodes:
                 if isinstance(node, list):
-                    if end is None:
-                        end = len(node)
                     result.extend(node[start:end:step])
 
         elif op_type == "multi_field":
@@ -486,62 +1038,345 @@ class JSONPathEvaluator:
                             result.append(node[name])
 
         elif op_type == "recursive_descent":
-            # Implementation for recursive descent
-            def collect_matching(current_node, field_name):
-                matches = []
+            for node in nodes:
+                result.extend(iter_recursive_descent(node, operation["name"]))
 
-                if isinstance(current_node, dict):
-                    # Check if the current node has the field
-                    if field_name in current_node:
-                        matches.append(current_node[field_name])
+        elif op_type == "recursive_wildcard":
+            for node in nodes:
+                result.extend(iter_recursive_wildcard(node))
 
-                    # Recursively check all values
-                    for value in current_node.values():
-                        matches.extend(collect_matching(value, field_name))
+        elif op_type == "filter":
+            for node in nodes:
+                result.extend(operation["filter"].select(node))
 
-                elif isinstance(current_node, list):
-                    # Recursively check all items
-                    for item in current_node:
-                        matches.extend(collect_matching(item, field_name))
+        return result
 
-                return matches
 
-            for node in nodes:
-                result.extend(collect_matching(node, operation["name"]))
+_MISSING = object()
 
-        elif op_type == "recursive_wildcard":
-            # Implementation for recursive wildcard
-            def collect_all(current_node):
-                matches = []
 
-                if isinstance(current_node, dict):
-                    # Add all values
-                    matches.extend(current_node.values())
+def is_simple_path(operations: List[Dict[str, Any]]) -> bool:
+    """Check whether the operations only step through single fields and indices."""
+    return all(op["op"] in ("field", "index") for op in operations)
 
-                    # Recursively collect from all values
-                    for value in current_node.values():
-                        matches.extend(collect_all(value))
 
-                elif isinstance(current_node, list):
-                    # Add all items
-                    matches.extend(current_node)
+def compile_simple_path(operations: List[Dict[str, Any]]) -> Callable[[Any], Any]:
+    """
+    Compile a pure field/index chain into a function walking the document directly.
+    The function returns the matched node, or _MISSING when the path does not match.
+    """
+    keys = tuple(
+        (op["op"] == "field", op["name"] if op["op"] == "field" else op["index"])
+        for op in operations
+    )
+
+    def get(data: Any) -> Any:
+        node = data
+        for is_field, key in keys:
+            if is_field:
+                if isinstance(node, dict) and key in node:
+                    node = node[key]
+                else:
+                    return _MISSING
+            elif isinstance(node, list) and -len(node) <= key < len(node):
+                node = node[key]
+            else:
+                return _MISSING
+        return node
 
-                    # Recursively collect from all items
-                    for item in current_node:
-                        matches.extend(collect_all(item))
+    return get
 
-                return matches
 
-            for node in nodes:
-                result.extend(collect_all(node))
+def compile_simple_assign(operations: List[Dict[str, Any]]) -> Callable[[Any, Any], Any]:
+    """
+    Compile a pure field/index chain into a function placing a value at the path.
+    The function returns a new document where only the containers along the path are
+    copied and everything else is shared with the original, missing fields are
+    created as objects.
+    """
+    keys = tuple(
+        (op["op"] == "field", op["name"] if op["op"] == "field" else op["index"])
+        for op in operations
+    )
+    depth = len(keys)
+
+    def put(node: Any, level: int, value: Any) -> Any:
+        if level == depth:
+            return value
+        is_field, key = keys[level]
+        if is_field:
+            if node is None or node is _MISSING:
+                node = {}
+            elif isinstance(node, dict):
+                node = dict(node)
+            else:
+                raise JSONPathError(f"Cannot set field {key!r} on {type(node).__name__}")
+            node[key] = put(node.get(key, _MISSING), level + 1, value)
+            return node
+        if isinstance(node, list) and -len(node) <= key < len(node):
+            node = list(node)
+            node[key] = put(node[key], level + 1, value)
+            return node
+        raise JSONPathError(f"Cannot set index {key} on {type(node).__name__}")
 
-        elif op_type == "filter":
-            # Simplified filter implementation
-            # In a real implementation, we would evaluate filter expressions
-            # This is a placeholder
-            pass
+    def assign(data: Any, value: Any) -> Any:
+        return put(data, 0, value)
 
-        return result
+    return assign
+
+
+# Each compiled step takes an iterable of nodes and lazily yields the next nodes.
+PathStep = Callable[[Iterable[Any]], Iterator[Any]]
+
+
+def _compile_field(operation: Dict[str, Any]) -> PathStep:
+    name = operation["name"]
+
+    def field(nodes: Iterable[Any]) -> Iterator[Any]:
+        for node in nodes:
+            if isinstance(node, dict) and name in node:
+                yield node[name]
+
+    return field
+
+
+def _compile_wildcard(operation: Dict[str, Any]) -> PathStep:
+    def wildcard(nodes: Iterable[Any]) -> Iterator[Any]:
+        for node in nodes:
+            if isinstance(node, dict):
+                yield from node.values()
+            elif isinstance(node, list):
+                yield from node
+
+    return wildcard
+
+
+def _compile_index(operation: Dict[str, Any]) -> PathStep:
+    index = operation["index"]
+
+    def index_(nodes: Iterable[Any]) -> Iterator[Any]:
+        for node in nodes:
+            if isinstance(node, list) and -len(node) <= index < len(node):
+                yield node[index]
+
+    return index_
+
+
+def _compile_multi_index(operation: Dict[str, Any]) -> PathStep:
+    indices = tuple(operation["indices"])
+
+    def multi_index(nodes: Iterable[Any]) -> Iterator[Any]:
+        for node in nodes:
+            if isinstance(node, list):
+                size = len(node)
+                for idx in indices:
+                    if -size <= idx < size:
+                        yield node[idx]
+
+    return multi_index
+
+
+def _compile_slice(operation: Dict[str, Any]) -> PathStep:
+    _slice = slice(operation["start"], operation["end"], operation["step"])
+
+    def slice_(nodes: Iterable[Any]) -> Iterator[Any]:
+        for node in nodes:
+            if isinstance(node, list):
+                yield from node[_slice]
+
+    return slice_
+
+
+def _compile_multi_field(operation: Dict[str, Any]) -> PathStep:
+    names = tuple(operation["names"])
+
+    def multi_field(nodes: Iterable[Any]) -> Iterator[Any]:
+        for node in nodes:
+            if isinstance(node, dict):
+                for name in names:
+                    if name in node:
+                        yield node[name]
+
+    return multi_field
+
+
+def _compile_recursive_descent(operation: Dict[str, Any]) -> PathStep:
+    name = operation["name"]
+
+    def recursive_descent(nodes: Iterable[Any]) -> Iterator[Any]:
+        for node in nodes:
+            yield from iter_recursive_descent(node, name)
+
+    return recursive_descent
+
+
+def _compile_recursive_wildcard(operation: Dict[str, Any]) -> PathStep:
+    def recursive_wildcard(nodes: Iterable[Any]) -> Iterator[Any]:
+        for node in nodes:
+            yield from iter_recursive_wildcard(node)
+
+    return recursive_wildcard
+
+
+def _compile_filter(operation: Dict[str, Any]) -> PathStep:
+    select = operation["filter"].select
+
+    def filter_(nodes: Iterable[Any]) -> Iterator[Any]:
+        for node in nodes:
+            yield from select(node)
+
+    return filter_
+
+
+_OPERATION_COMPILERS = {
+    "field": _compile_field,
+    "wildcard": _compile_wildcard,
+    "index": _compile_index,
+    "multi_index": _compile_multi_index,
+    "slice": _compile_slice,
+    "multi_field": _compile_multi_field,
+    "recursive_descent": _compile_recursive_descent,
+    "recursive_wildcard": _compile_recursive_wildcard,
+    "filter": _compile_filter,
+}
+
+
+def compile_operations(
+    operations: List[Dict[str, Any]],
+) -> Callable[[Any], Iterator[Any]]:
+    """
+    Compile parsed JSONPath operations into a single function lazily yielding all
+    matches, in the same order as JSONPathEvaluator.evaluate returns them.
+    """
+    if is_simple_path(operations):
+        get = compile_simple_path(operations)
+
+        def iter_simple(data: Any) -> Iterator[Any]:
+            node = get(data)
+            if node is not _MISSING:
+                yield node
+
+        return iter_simple
+
+    steps = tuple(_OPERATION_COMPILERS[op["op"]](op) for op in operations)
+
+    def iter_matches(data: Any) -> Iterator[Any]:
+        nodes = iter((data,))
+        for step in steps:
+            nodes = step(nodes)
+        return nodes
+
+    return iter_matches
+
+
+class CompiledJSONPath:
+    """A JSONPath expression parsed once and reusable against any data."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.operations = JSONPathParser(JSONPathLexer(path)).parse()
+        self.simple = is_simple_path(self.operations)
+        self.iter = compile_operations(self.operations)
+        self._get = compile_simple_path(self.operations) if self.simple else None
+        self._assign = None
+
+    def find(self, data: Any) -> List[Any]:
+        """Return all matches of the path in data."""
+        return list(self.iter(data))
+
+    def first(self, data: Any, default: Any = None) -> Any:
+        """Return the first match of the path, without evaluating the remaining ones."""
+        return next(self.iter(data), default)
+
+    def apply(self, data: Any) -> Any:
+        """
+        Return the result of the path in data.
+        No match gives None, a single match is returned as is, several matches as a list.
+        """
+        if self._get is not None:
+            node = self._get(data)
+            return None if node is _MISSING else node
+
+        results = self.find(data)
+        if len(results) == 0:
+            return None
+        elif len(results) == 1:
+            return results[0]
+        else:
+            return results
+
+    def assign(self, data: Any, value: Any) -> Any:
+        """
+        Return data with value placed at the path, as ResultPath does.
+        Only reference paths (fields and indices) can be assigned, the input is not
+        modified.
+        """
+        if self._assign is None:
+            if not self.simple:
+                raise JSONPathError(f"{self.path} is not a reference path")
+            self._assign = compile_simple_assign(self.operations)
+        return self._assign(data, value)
+
+    def __reduce__(self):
+        # compiled steps are closures, pickles carry the path and compile it again
+        return (CompiledJSONPath, (self.path,))
+
+    def __repr__(self):
+        return f"CompiledJSONPath({self.path!r})"
+
+
+class JSONPathCache:
+    """
+    Bounded LRU cache of compiled expressions keyed on the expression string.
+    Compiles JSONPath expressions unless another factory is given.
+    """
+
+    def __init__(self, maxsize: int = 1024, factory: Callable[[str], Any] = None):
+        self.maxsize = maxsize
+        self.factory = factory or CompiledJSONPath
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Any:
+        """Return the compiled expression, compiling and storing it on a miss."""
+        with self._lock:
+            compiled = self._entries.get(path)
+            if compiled is not None:
+                self.hits += 1
+                self._entries.move_to_end(path)
+                return compiled
+            self.misses += 1
+
+        # Compile outside the lock, parse errors must not poison the cache
+        compiled = self.factory(path)
+
+        with self._lock:
+            self._entries[path] = compiled
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        """Drop all compiled paths and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current cache size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+path_cache = JSONPathCache()
 
 
 class JSONPathIntrinsicFunctions:
@@ -880,6 +1715,421 @@ class JSONPathIntrinsicFunctions:
         return str(uuid.uuid4())
 
 
+class IntrinsicToken:
+    """Represents a token in an intrinsic function expression."""
+
+    NAME = "NAME"  # States.Format
+    LPAREN = "LPAREN"  # (
+    RPAREN = "RPAREN"  # )
+    COMMA = "COMMA"  # ,
+    STRING = "STRING"  # 'abc'
+    NUMBER = "NUMBER"  # 1, -2, 3.5
+    PATH = "PATH"  # $.a, $$.Execution.Id
+    LITERAL = "LITERAL"  # null, true, false
+
+    def __init__(self, type: str, value: Any = None, pos: int = 0):
+        self.type = type
+        self.value = value
+        self.pos = pos
+
+    def __repr__(self):
+        if self.value is not None:
+            return f"<{self.type}:{self.value}>"
+        return f"<{self.type}>"
+
+
+class IntrinsicLexer:
+    """Tokenizes an intrinsic function expression."""
+
+    LITERALS = {"null": None, "true": True, "false": False}
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.pos = 0
+
+    def error(self, message: str):
+        raise JSONPathError(
+            f"Intrinsic function error at position {self.pos} in "
+            f"{self.expression!r}: {message}"
+        )
+
+    @property
+    def current_char(self) -> Optional[str]:
+        if self.pos >= len(self.expression):
+            return None
+        return self.expression[self.pos]
+
+    def string(self) -> IntrinsicToken:
+        """Parse a string argument, only the escaped quote itself is unescaped."""
+        start = self.pos
+        quote_char = self.current_char
+        self.pos += 1
+
+        result = []
+        while self.current_char is not None and self.current_char != quote_char:
+            if (
+                self.current_char == "\\"
+                and self.pos + 1 < len(self.expression)
+                and self.expression[self.pos + 1] == quote_char
+            ):
+                result.append(quote_char)
+                self.pos += 2
+            else:
+                result.append(self.current_char)
+                self.pos += 1
+
+        if self.current_char is None:
+            self.pos = start
+            self.error("Unterminated string")
+
+        self.pos += 1
+        return IntrinsicToken(IntrinsicToken.STRING, "".join(result), start)
+
+    def number(self) -> IntrinsicToken:
+        start = self.pos
+        if self.current_char == "-":
+            self.pos += 1
+        while self.current_char is not None and (
+            self.current_char.isdigit() or self.current_char == "."
+        ):
+            self.pos += 1
+
+        text = self.expression[start : self.pos]
+        try:
+            value = float(text) if "." in text else int(text)
+        except ValueError:
+            self.pos = start
+            self.error(f"Invalid number: {text}")
+        return IntrinsicToken(IntrinsicToken.NUMBER, value, start)
+
+    def path(self) -> IntrinsicToken:
+        """Parse a path argument up to the next top-level comma or parenthesis."""
+        start = self.pos
+        depth = 0
+        quote_char = None
+        while self.current_char is not None:
+            char = self.current_char
+            if quote_char:
+                if char == quote_char:
+                    quote_char = None
+            elif char in ("'", '"') and depth:
+                quote_char = char
+            elif char == "[":
+                depth += 1
+            elif char == "]":
+                depth -= 1
+            elif not depth and (char in ",()" or char.isspace()):
+                break
+            self.pos += 1
+        return IntrinsicToken(
+            IntrinsicToken.PATH, self.expression[start : self.pos], start
+        )
+
+    def name(self) -> IntrinsicToken:
+        start = self.pos
+        while self.current_char is not None and (
+            self.current_char.isalnum() or self.current_char in "._"
+        ):
+            self.pos += 1
+
+        text = self.expression[start : self.pos]
+        if text in self.LITERALS:
+            return IntrinsicToken(IntrinsicToken.LITERAL, self.LITERALS[text], start)
+        return IntrinsicToken(IntrinsicToken.NAME, text, start)
+
+    def tokenize(self) -> List[IntrinsicToken]:
+        tokens = []
+        punctuation = {
+            "(": IntrinsicToken.LPAREN,
+            ")": IntrinsicToken.RPAREN,
+            ",": IntrinsicToken.COMMA,
+        }
+        while self.current_char is not None:
+            char = self.current_char
+            if char.isspace():
+                self.pos += 1
+            elif char in punctuation:
+                tokens.append(IntrinsicToken(punctuation[char], pos=self.pos))
+                self.pos += 1
+            elif char in ("'", '"'):
+                tokens.append(self.string())
+            elif char == "$":
+                tokens.append(self.path())
+            elif char.isdigit() or char == "-":
+                tokens.append(self.number())
+            elif char.isalpha() or char == "_":
+                tokens.append(self.name())
+            else:
+                self.error(f"Unexpected character: {char}")
+        return tokens
+
+
+class IntrinsicLiteral:
+    """A constant intrinsic function argument."""
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def evaluate(self, input_data: Any, context_data: Any, functions: dict) -> Any:
+        return self.value
+
+    def __repr__(self):
+        return f"IntrinsicLiteral({self.value!r})"
+
+
+class IntrinsicPath:
+    """A path argument evaluated against the input or the context object."""
+
+    def __init__(self, path: str):
+        self.from_context = path.startswith("$$")
+        self.path = JSONPath.compile(path[1:] if self.from_context else path)
+
+    def evaluate(self, input_data: Any, context_data: Any, functions: dict) -> Any:
+        if self.from_context:
+            return self.path.apply(context_data)
+        return self.path.apply(input_data)
+
+    def __repr__(self):
+        prefix = "$" if self.from_context else ""
+        return f"IntrinsicPath({prefix}{self.path.path!r})"
+
+
+class IntrinsicCall:
+    """An intrinsic function call with its already parsed arguments."""
+
+    def __init__(self, name: str, args: List[Any]):
+        self.name = name
+        self.args = tuple(args)
+
+    def evaluate(self, input_data: Any, context_data: Any, functions: dict) -> Any:
+        func = functions.get(self.name)
+        if func is None:
+            raise JSONPathError(f"Unknown intrinsic function: {self.name}")
+        return func(
+            *[arg.evaluate(input_data, context_data, functions) for arg in self.args]
+        )
+
+    def __repr__(self):
+        return f"IntrinsicCall({self.name}, {list(self.args)})"
+
+
+class IntrinsicParser:
+    """Recursive-descent parser turning intrinsic function expressions into an AST."""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = IntrinsicLexer(expression).tokenize()
+        self.pos = 0
+
+    def error(self, message: str):
+        raise JSONPathError(
+            f"Invalid intrinsic function format: {self.expression!r}: {message}"
+        )
+
+    @property
+    def current_token(self) -> Optional[IntrinsicToken]:
+        if self.pos >= len(self.tokens):
+            return None
+        return self.tokens[self.pos]
+
+    def eat(self, token_type: str) -> IntrinsicToken:
+        token = self.current_token
+        if token is None or token.type != token_type:
+            self.error(f"Expected {token_type}, got {token}")
+        self.pos += 1
+        return token
+
+    def parse(self) -> IntrinsicCall:
+        call = self.call()
+        if self.current_token is not None:
+            self.error(f"Unexpected token after function call: {self.current_token}")
+        return call
+
+    def call(self) -> IntrinsicCall:
+        name = self.eat(IntrinsicToken.NAME).value
+        self.eat(IntrinsicToken.LPAREN)
+        args = []
+        if self.current_token and self.current_token.type != IntrinsicToken.RPAREN:
+            args.append(self.argument())
+            while self.current_token and self.current_token.type == IntrinsicToken.COMMA:
+                self.eat(IntrinsicToken.COMMA)
+                args.append(self.argument())
+        self.eat(IntrinsicToken.RPAREN)
+        return IntrinsicCall(name, args)
+
+    def argument(self) -> Any:
+        token = self.current_token
+        if token is None:
+            self.error("Unexpected end of expression")
+        if token.type == IntrinsicToken.NAME:
+            return self.call()
+        if token.type == IntrinsicToken.PATH:
+            self.pos += 1
+            return IntrinsicPath(token.value)
+        if token.type in (
+            IntrinsicToken.STRING,
+            IntrinsicToken.NUMBER,
+            IntrinsicToken.LITERAL,
+        ):
+            self.pos += 1
+            return IntrinsicLiteral(token.value)
+        self.error(f"Unexpected token: {token}")
+
+
+def parse_intrinsic(expression: str) -> IntrinsicCall:
+    """Parse an intrinsic function expression into an IntrinsicCall tree."""
+    return IntrinsicParser(expression).parse()
+
+
+intrinsic_cache = JSONPathCache(factory=parse_intrinsic)
+
+
+class TemplateNode:
+    """Node of a compiled payload template."""
+
+    dynamic = True
+
+    def render(self, input_data: Any, context_data: Any) -> Any:
+        raise NotImplementedError
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(
+        f"{type(self).__name__} is a constant shared by every render of a payload "
+        "template, copy it before modifying"
+    )
+
+
+class ReadOnlyDict(dict):
+    """
+    Object of a payload template constant, shared by all renders. Copies
+    (dict(), copy.copy, copy.deepcopy) are plain mutable objects.
+    """
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return (ReadOnlyDict, (dict(self),))
+
+
+class ReadOnlyList(list):
+    """Array of a payload template constant, see ReadOnlyDict."""
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(value, memo) for value in self]
+
+    def __reduce__(self):
+        return (ReadOnlyList, (list(self),))
+
+
+def _freeze_json(value: Any) -> Any:
+    """The objects and arrays of a JSON value made read-only, scalars as they are."""
+    if isinstance(value, (ReadOnlyDict, ReadOnlyList)):
+        return value
+    if isinstance(value, dict):
+        return ReadOnlyDict((key, _freeze_json(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return ReadOnlyList(_freeze_json(item) for item in value)
+    return value
+
+
+class ConstantNode(TemplateNode):
+    """
+    Part of a template without paths or intrinsic functions, analysed once.
+    Objects and arrays are made read-only and shared by every render.
+    """
+
+    dynamic = False
+
+    def __init__(self, value: Any):
+        self.value = _freeze_json(value)
+
+    def render(self, input_data: Any, context_data: Any) -> Any:
+        return self.value
+
+
+class PathNode(TemplateNode):
+    """A `key.$` path evaluated against the input or the context object."""
+
+    def __init__(self, path: str, from_context: bool = False):
+        self.path = JSONPath.compile(path)
+        self.from_context = from_context
+
+    def render(self, input_data: Any, context_data: Any) -> Any:
+        if self.from_context:
+            return self.path.apply(context_data)
+        return self.path.apply(input_data)
+
+
+class IntrinsicNode(TemplateNode):
+    """A `key.$` intrinsic function call."""
+
+    def __init__(self, expression: str, processor: "PayloadTemplateProcessor"):
+        self.expression = expression
+        self.call = intrinsic_cache.get(expression)
+        self.functions = processor.intrinsic_functions
+
+    def render(self, input_data: Any, context_data: Any) -> Any:
+        return self.call.evaluate(input_data, context_data, self.functions)
+
+
+class DictNode(TemplateNode):
+    """An object with at least one dynamic value."""
+
+    def __init__(self, items: List[tuple]):
+        self.items = tuple(items)
+
+    def render(self, input_data: Any, context_data: Any) -> Any:
+        return {key: node.render(input_data, context_data) for key, node in self.items}
+
+
+class ListNode(TemplateNode):
+    """An array with at least one dynamic item."""
+
+    def __init__(self, nodes: List[TemplateNode]):
+        self.nodes = tuple(nodes)
+
+    def render(self, input_data: Any, context_data: Any) -> Any:
+        return [node.render(input_data, context_data) for node in self.nodes]
+
+
+class CompiledTemplate:
+    """A payload template analysed once into constant, path and intrinsic nodes."""
+
+    def __init__(self, template: Any, root: TemplateNode):
+        self.template = template
+        self.root = root
+
+    @property
+    def dynamic(self) -> bool:
+        return self.root.dynamic
+
+    def render(self, input_data: Any, context_data: Any = None) -> Any:
+        """Evaluate the dynamic parts of the template for the given input."""
+        if context_data is None:
+            context_data = {}
+        output = self.root.render(input_data, context_data)
+        # the rendered object itself is always new, nested constants are shared
+        if isinstance(output, ReadOnlyDict):
+            return dict(output)
+        if isinstance(output, ReadOnlyList):
+            return list(output)
+        return output
+
+
 class PayloadTemplateProcessor:
     """Processes payload templates with variable substitution and intrinsic functions."""
 
@@ -909,187 +2159,65 @@ class PayloadTemplateProcessor:
         self, template: Any, input_data: Any, context_data: Any = None
     ) -> Any:
         """Process a payload template by evaluating paths and intrinsic functions."""
-        if context_data is None:
-            context_data = {}
+        return self.compile_template(template).render(input_data, context_data)
 
+    def compile_template(self, template: Any) -> "CompiledTemplate":
+        """Analyse a payload template once so it can be rendered for many inputs."""
+        return CompiledTemplate(template, self._compile_node(template))
+
+    def _compile_node(self, template: Any) -> "TemplateNode":
         if isinstance(template, dict):
-            # Process dictionary template
-            result = {}
+            items = []
             for key, value in template.items():
                 if key.endswith(".$"):
                     # Path substitution
                     new_key = key[:-2]
                     if isinstance(value, str):
-                        if value.startswith("$$"):
-                            # Context object path
-                            path_value = value[1:]  # Remove one $
-                            path_result = self.evaluate_path(path_value, context_data)
-                            result[new_key] = path_result
-                        elif value.startswith("$"):
-                            # Input data path
-                            path_result = self.evaluate_path(value, input_data)
-                            result[new_key] = path_result
-                        else:
-                            # Intrinsic function
-                            func_result = self.evaluate_intrinsic_function(
-                                value, input_data, context_data
-                            )
-                            result[new_key] = func_result
+                        items.append((new_key, self._compile_expression(value)))
                     else:
                         # Not a string, use as is
-                        result[new_key] = value
+                        items.append((new_key, ConstantNode(value)))
                 else:
                     # Regular key, process value recursively
-                    result[key] = self.process_template(value, input_data, context_data)
+                    items.append((key, self._compile_node(value)))
 
-            return result
+            if any(node.dynamic for _, node in items):
+                return DictNode(items)
+            return ConstantNode({key: node.value for key, node in items})
 
         elif isinstance(template, list):
-            # Process list template
-            return [
-                self.process_template(item, input_data, context_data)
-                for item in template
-            ]
+            nodes = [self._compile_node(item) for item in template]
+            if any(node.dynamic for node in nodes):
+                return ListNode(nodes)
+            return ConstantNode([node.value for node in nodes])
 
         else:
             # Scalar value, return as is
-            return template
+            return ConstantNode(template)
+
+    def _compile_expression(self, value: str) -> "TemplateNode":
+        if value.startswith("$$"):
+            # Context object path
+            return PathNode(value[1:], from_context=True)
+        elif value.startswith("$"):
+            # Input data path
+            return PathNode(value)
+        else:
+            # Intrinsic function
+            return IntrinsicNode(value, self)
 
     def evaluate_path(self, path_str: str, data: Any) -> Any:
         """Evaluate a JSONPath expression against data."""
-        # if not path_str.startswith('$'):
-        #    raise JSONPathError("Path must start with $")
-
-        lexer = JSONPathLexer(path_str)
-        parser = JSONPathParser(lexer)
-        operations = parser.parse()
-        evaluator = JSONPathEvaluator(operations)
-
-        results = evaluator.evaluate(data)
-
-        # If there are multiple results, return as a list
-        # If there's only one result, return it directly
-        if len(results) == 0:
-            return None
-        elif len(results) == 1:
-            return results[0]
-        else:
-            return results
+        return JSONPath.compile(path_str).apply(data)
 
     def evaluate_intrinsic_function(
-        self, func_str: str, input_data: Any, context_data: Any
+        self, func_str: str, input_data: Any, context_data: Any = None
     ) -> Any:
         """Evaluate an intrinsic function."""
-        # Simple regex-based parser for intrinsic functions
-        # In a real implementation, you'd want a more robust parser
-        func_match = re.match(r"^([A-Za-z0-9_.]+)\((.*)\)", func_str)
-        if not func_match:
-            raise JSONPathError(f"Invalid intrinsic function format: {func_str}")
-
-        func_name = func_match.group(1)
-        if func_name not in self.intrinsic_functions:
-            raise JSONPathError(f"Unknown intrinsic function: {func_name}")
-
-        # Parse arguments
-        args_str = func_match.group(2)
-        args = []
-        # Simple argument parser
-        # This is a simplification; a real implementation would handle nested functions properly
-        if args_str:
-            in_string = False
-            current_arg = ""
-            string_quote = None
-            i = 0
-
-            while i < len(args_str):
-                char = args_str[i]
-
-                if not in_string and (char == "'" or char == '"'):
-                    # Start of string
-                    in_string = True
-                    string_quote = char
-                    i += 1
-                    continue
-
-                elif (
-                    in_string
-                    and char == "\\"
-                    and i + 1 < len(args_str)
-                    and args_str[i + 1] == string_quote
-                ):
-                    # Escaped quote in string
-                    current_arg += string_quote
-                    i += 2
-                    continue
-
-                elif in_string and char == string_quote:
-                    # End of string
-                    in_string = False
-                    i += 1
-                    continue
-
-                elif not in_string and char == ",":
-                    # Argument separator
-                    args.append(self._parse_arg(current_arg.strip(), input_data))
-                    current_arg = ""
-                    i += 1
-                    continue
-
-                else:
-                    # Regular character
-                    current_arg += char
-                    i += 1
-
-            # Add the last argument
-            if current_arg.strip():
-                curr = current_arg.strip()
-                if curr.startswith("$$"):
-                    curr = curr[1:]
-                    args.append(self._parse_arg(curr, context_data))
-                else:
-                    args.append(self._parse_arg(curr, input_data))
-
-        # Call the function with the parsed arguments
-        func = self.intrinsic_functions[func_name]
-        return func(*args)
-
-    def _parse_arg(self, arg_str: str, input_data: Any) -> Any:
-        """Parse a single argument for an intrinsic function."""
-        if arg_str.startswith("'") and arg_str.endswith("'"):
-            # String literal
-            return arg_str[1:-1]
-
-        elif arg_str.startswith('"') and arg_str.endswith('"'):
-            # String literal with double quotes
-            return arg_str[1:-1]
-
-        elif arg_str.startswith("$"):
-            # Path
-            return self.evaluate_path(arg_str, input_data)
-
-        elif arg_str.isdigit() or (arg_str.startswith("-") and arg_str[1:].isdigit()):
-            # Integer
-            return int(arg_str)
-
-        elif arg_str == "null":
-            # Null value
-            return None
-
-        elif arg_str == "true":
-            # Boolean true
-            return True
-
-        elif arg_str == "false":
-            # Boolean false
-            return False
-
-        elif "(" in arg_str and ")" in arg_str:
-            # Nested function
-            return self.evaluate_intrinsic_function(arg_str, input_data)
-
-        else:
-            # Unknown, treat as string
-            return arg_str
+        if context_data is None:
+            context_data = {}
+        call = intrinsic_cache.get(func_str)
+        return call.evaluate(input_data, context_data, self.intrinsic_functions)
 
 
 class JSONPath:
@@ -1098,9 +2226,24 @@ class JSONPath:
     def __init__(self):
         self.processor = PayloadTemplateProcessor()
 
+    @staticmethod
+    def compile(path: str) -> CompiledJSONPath:
+        """Return the compiled form of path from the process-wide cache."""
+        return path_cache.get(path)
+
+    @staticmethod
+    def cache_info() -> Dict[str, int]:
+        """Return hit/miss counters of the process-wide compiled path cache."""
+        return path_cache.info()
+
     def apply(self, path: str, data: Any) -> Any:
         """Apply a JSONPath to data and return the result."""
-        return self.processor.evaluate_path(path, data)
+        return self.compile(path).apply(data)
+
+    @staticmethod
+    def iter(path: str, data: Any) -> Iterator[Any]:
+        """Lazily yield the matches of a JSONPath in data."""
+        return path_cache.get(path).iter(data)
 
     def process_payload_template(
         self, template: Any, input_data: Any, context_data: Any = None
@@ -1108,6 +2251,10 @@ class JSONPath:
         """Process a payload template."""
         return self.processor.process_template(template, input_data, context_data)
 
+    def compile_template(self, template: Any) -> CompiledTemplate:
+        """Compile a payload template for repeated processing."""
+        return self.processor.compile_template(template)
+
 
 # Example usage functions
 
@@ -1180,6 +2327,156 @@ def test_jsonpath_advanced():
     print("Advanced JSONPath tests passed!")
 
 
+def test_compiled_path_cache():
+    """Test the compiled JSONPath cache."""
+    cache = JSONPathCache(maxsize=2)
+    data = {"a": {"b": 1}, "c": [1, 2]}
+
+    assert cache.get("$.a.b").apply(data) == 1
+    assert cache.get("$.a.b") is cache.get("$.a.b")
+    assert cache.info()["hits"] == 2
+    assert cache.info()["misses"] == 1
+
+    # Least recently used path is evicted first
+    cache.get("$.c")
+    cache.get("$.a.b")
+    cache.get("$.c[0]")
+    assert cache.info()["size"] == 2
+    assert "$.c" not in cache._entries
+
+    print("Compiled path cache tests passed!")
+
+
+def test_compiled_path_assign():
+    """Test placing values at reference paths without modifying the input."""
+    data = {"a": {"b": 1, "keep": [1, 2]}, "c": [{"d": 1}, {"d": 2}]}
+
+    out = JSONPath.compile("$.a.b").assign(data, 5)
+    assert out == {"a": {"b": 5, "keep": [1, 2]}, "c": data["c"]}
+    assert data["a"]["b"] == 1
+    assert out["c"] is data["c"] and out["a"]["keep"] is data["a"]["keep"]
+
+    assert JSONPath.compile("$.c[1].d").assign(data, 3)["c"][1] == {"d": 3}
+    assert JSONPath.compile("$.x.y").assign(data, 0)["x"] == {"y": 0}
+    assert JSONPath.compile("$").assign(data, 0) == 0
+
+    for path in ("$.c[5]", "$.a.b.z", "$..d"):
+        try:
+            JSONPath.compile(path).assign(data, 0)
+            assert False, path
+        except JSONPathError:
+            pass
+
+    print("Compiled path assign tests passed!")
+
+
+def test_compiled_matches_evaluator():
+    """Test that compiled paths give the same results as JSONPathEvaluator."""
+    data = {
+        "a": {"b": {"c": [1, {"d": 2}, [3, 4]]}, "d": None},
+        "list": [{"id": 1, "x": {"id": 2}}, {"id": 3}, 5, [6, {"id": 7}]],
+        "empty": {},
+        "s": "text",
+        "quoted key": {"id": 8},
+    }
+    paths = [
+        "$",
+        "$.a",
+        "$.a.b.c",
+        "$.a.b.c[1].d",
+        "$.a.b.c[-1][0]",
+        "$.a.b.c[3]",
+        "$.a.b.c[-4]",
+        "$.a.d",
+        "$.a.missing.b",
+        "$.s.b",
+        "$.s[0]",
+        "$['quoted key'].id",
+        "$['a','list']",
+        "$.list[*].id",
+        "$.list[*]",
+        "$.*",
+        "$.*.*",
+        "$.list[0,2,-1]",
+        "$.list[0:2]",
+        "$.list[1:]",
+        "$.list[-2:]",
+        "$.list[0:4:2]",
+        "$..id",
+        "$..d",
+        "$.list..id",
+        "$..*",
+        "$.a..*",
+        "$.list[*][1]",
+    ]
+    for path in paths:
+        expected = JSONPathEvaluator(
+            JSONPathParser(JSONPathLexer(path)).parse()
+        ).evaluate(data)
+        assert CompiledJSONPath(path).find(data) == expected, path
+
+    print("Compiled evaluator differential tests passed!")
+
+
+def test_iterative_recursive_descent():
+    """Test recursive descent on deep documents and lazy iteration."""
+    data = {"id": 0}
+    for level in range(1, 5000):
+        data = {"id": level, "child": [data]}
+
+    ids = JSONPath().apply("$..id", data)
+    assert len(ids) == 5000
+    assert ids[0] == 4999 and ids[-1] == 0
+    assert len(JSONPath().apply("$..*", data)) == 3 * 4999 + 1
+
+    # Iteration stops as soon as the caller stops asking
+    matches = JSONPath.iter("$..id", data)
+    assert next(matches) == 4999
+    assert next(matches) == 4998
+    assert JSONPath.compile("$..child[0].id").first(data) == 4998
+    assert JSONPath.compile("$..missing").first(data, "default") == "default"
+
+    print("Iterative recursive descent tests passed!")
+
+
+def test_filter_expressions():
+    """Test compiled filter expressions."""
+    books = [
+        {"category": "reference", "price": 8.95, "isbn": "0-553"},
+        {"category": "fiction", "price": 12.99},
+        {"category": "fiction", "price": "unknown"},
+        {"category": "fiction", "price": 22.99, "isbn": "0-395"},
+    ]
+    data = {"store": {"book": books}}
+    jsonpath = JSONPath()
+
+    assert jsonpath.apply("$.store.book[?(@.price < 10)].category", data) == "reference"
+    assert jsonpath.apply("$.store.book[?(@.isbn)].price", data) == [8.95, 22.99]
+    assert jsonpath.apply("$.store.book[?(!@.isbn)].price", data) == [12.99, "unknown"]
+    assert jsonpath.apply(
+        "$.store.book[?(@.category == 'fiction' && @.price > 20)].isbn", data
+    ) == "0-395"
+    assert jsonpath.apply(
+        "$.store.book[?(@.price < 9 || (@.isbn && @.price >= 20))].isbn", data
+    ) == ["0-553", "0-395"]
+    assert jsonpath.apply("$..book[?(10 > @.price)].price", data) == 8.95
+
+    # Batched filtering gives the same items as the per-item predicate
+    items = [{"id": i, "group": i % 7} for i in range(1000)]
+    compiled = JSONPathFilter("@.group == 3 && @.id >= 500")
+    assert compiled.batch is not None
+    assert compiled.batch(items) == list(filter(compiled.predicate, items))
+    assert compiled.batch(items + [{"id": "x", "group": 3}]) is None
+
+    try:
+        jsonpath.apply("$.store.book[?(@.price = 1)]", data)
+        raise AssertionError("Expected a filter error")
+    except JSONPathError:
+        pass
+
+    print("Filter expression tests passed!")
+
+
 def test_intrinsic_functions():
     """Test intrinsic functions."""
     jsonpath = JSONPath()
@@ -1206,6 +2503,42 @@ def test_intrinsic_functions():
     print("Intrinsic functions tests passed!")
 
 
+def test_intrinsic_parser():
+    """Test parsing of nested intrinsic functions."""
+    processor = PayloadTemplateProcessor()
+    input_data = {"items": [1, 2, 3], "name": "World"}
+    context_data = {"Execution": {"Id": "exec-1"}}
+
+    call = parse_intrinsic("States.Array(States.ArrayLength($.items), $$.Execution.Id)")
+    assert isinstance(call.args[0], IntrinsicCall)
+    assert intrinsic_cache.get("States.UUID()") is intrinsic_cache.get("States.UUID()")
+
+    result = processor.evaluate_intrinsic_function(
+        "States.Array(States.ArrayLength($.items), $$.Execution.Id, 'a, b', null)",
+        input_data,
+        context_data,
+    )
+    assert result == [3, "exec-1", "a, b", None]
+
+    result = processor.evaluate_intrinsic_function(
+        "States.Array(States.UUID())", input_data
+    )
+    assert len(result) == 1 and len(result[0]) == 36
+
+    result = processor.evaluate_intrinsic_function(
+        "States.Format('It\\'s {}', States.Format('Hello, {}!', $.name))", input_data
+    )
+    assert result == "It's Hello, World!"
+
+    try:
+        parse_intrinsic("States.Array(1 2)")
+        raise AssertionError("Expected a parser error")
+    except JSONPathError:
+        pass
+
+    print("Intrinsic parser tests passed!")
+
+
 def test_payload_template():
     """Test payload template processing."""
     jsonpath = JSONPath()
@@ -1236,6 +2569,58 @@ def test_payload_template():
     print("Payload template tests passed!")
 
 
+def test_compiled_template():
+    """Test compiled payload templates."""
+    jsonpath = JSONPath()
+    template = {
+        "static": {"a": [1, 2], "b.$": 3},
+        "value.$": "$.value",
+        "items": [{"id.$": "$.value"}, "plain"],
+        "weekday.$": "$$.DayOfWeek",
+    }
+    compiled = jsonpath.compile_template(template)
+
+    first = compiled.render({"value": 1}, {"DayOfWeek": "MONDAY"})
+    second = compiled.render({"value": 2})
+    assert first == {
+        "static": {"a": [1, 2], "b": 3},
+        "value": 1,
+        "items": [{"id": 1}, "plain"],
+        "weekday": "MONDAY",
+    }
+    assert second["value"] == 2 and second["weekday"] is None
+
+    # Constant subtrees are analysed once and shared read-only by every render
+    assert first["static"] == second["static"] and first["static"] is second["static"]
+    assert first == jsonpath.process_payload_template(
+        template, {"value": 1}, {"DayOfWeek": "MONDAY"}
+    )
+    constant = jsonpath.compile_template({"count": 0, "items": []})
+    output = constant.render({})
+    # the rendered object is new, its constant members cannot be modified
+    output["count"] += 1
+    assert output is not constant.render({})
+    for mutate in (lambda: output["items"].append(1), lambda: first["static"].update(a=[])):
+        try:
+            mutate()
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("constants of a template must be read-only")
+    assert constant.render({}) == {"count": 0, "items": []}
+    assert compiled.render({"value": 3})["static"] == {"a": [1, 2], "b": 3}
+    # copies are plain objects, pickles keep them read-only
+    import pickle
+
+    thawed = copy.deepcopy(first["static"])
+    thawed["a"].append(3)
+    assert type(thawed) is dict and first["static"]["a"] == [1, 2]
+    assert json.dumps(first["static"]) == '{"a": [1, 2], "b": 3}'
+    assert type(pickle.loads(pickle.dumps(first["static"]))) is ReadOnlyDict
+
+    print("Compiled template tests passed!")
+
+
 def test_jsonpath_for_aws_states():
     """
     Test JSONPath functionality for AWS States simulation.
@@ -1333,8 +2718,15 @@ if __name__ == "__main__":
     # Run test functions
     test_jsonpath_basic()
     test_jsonpath_advanced()
+    test_compiled_path_cache()
+    test_compiled_path_assign()
+    test_compiled_matches_evaluator()
+    test_iterative_recursive_descent()
+    test_filter_expressions()
     test_intrinsic_functions()
+    test_intrinsic_parser()
     test_payload_template()
+    test_compiled_template()
     test_jsonpath_for_aws_states()
     jsonpath = JSONPath()
     res = jsonpath.apply("$.resultadosParalelos", {"resultadosParalelos": [1, 2, 3]})
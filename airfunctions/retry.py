@@ -0,0 +1,45 @@
+from airfunctions.errors import ErrorMatcher
+
+# defaults of a Step Functions retrier
+INTERVAL_SECONDS = 1
+MAX_ATTEMPTS = 3
+BACK_OFF_RATE = 2.0
+
+
+class RetryPolicy:
+    """
+    Retry blocks of a state. The first retrier matching an error decides whether the
+    state runs again and after how many seconds, each retrier counts its own attempts.
+    """
+
+    def __init__(self, retriers: list[dict], task: bool = True):
+        self.retriers = retriers
+        self.matcher = ErrorMatcher(
+            (retrier["ErrorEquals"] for retrier in retriers), task
+        )
+
+    def start(self) -> list[int]:
+        """Attempt counters of one run of the state."""
+        return [0] * len(self.retriers)
+
+    def delay(self, error: BaseException, attempts: list[int]) -> float | None:
+        """Seconds to wait before the next attempt, None when the error is not retried."""
+        index = self.matcher.match(error)
+        if index is None:
+            return None
+
+        retrier = self.retriers[index]
+        attempt = attempts[index]
+        if attempt >= retrier.get("MaxAttempts", MAX_ATTEMPTS):
+            return None
+
+        delay = retrier.get("IntervalSeconds", INTERVAL_SECONDS) * (
+            retrier.get("BackOffRate", BACK_OFF_RATE) ** attempt
+        )
+        if "MaxDelaySeconds" in retrier:
+            delay = min(delay, retrier["MaxDelaySeconds"])
+        attempts[index] = attempt + 1
+        return delay
+
+    def __repr__(self):
+        return f"RetryPolicy({self.retriers})"
@@ -0,0 +1,112 @@
+import heapq
+from collections import Counter
+from dataclasses import dataclass
+from itertools import count
+from typing import Any, Generator
+
+from airfunctions.batch import EventResult
+from airfunctions.clock import Clock, get_clock
+from airfunctions.errors import error_name
+from airfunctions.steps import Branch, CompiledBranch
+
+
+@dataclass
+class ScheduledRun(EventResult):
+    """An execution driven by a Scheduler, started and finished in scheduler time."""
+
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def duration(self) -> float | None:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class Scheduler:
+    """
+    Discrete-event scheduler interleaving many executions of branches.
+    An execution runs until it waits (Wait state or retry backoff), its wake-up time
+    goes to a heap and the earliest one is resumed next. On a virtual clock (the
+    default) time jumps straight to the next wake-up, on the system clock the
+    scheduler sleeps until it. Waits inside Parallel and Map branches are not
+    interleaved, they wait on the default clock.
+    """
+
+    def __init__(self, clock: str | Clock | None = None):
+        self.clock = get_clock(clock)
+        self.runs: list[ScheduledRun] = []
+        self.waits: Counter[str] = Counter()
+        self.waited: Counter[str] = Counter()
+        self.max_pending = 0
+        self._queue: list[tuple[float, int, Generator, ScheduledRun]] = []
+        self._order = count()
+
+    @property
+    def pending(self) -> int:
+        """Executions started or waiting to start which have not finished yet."""
+        return len(self._queue)
+
+    def submit(
+        self,
+        workflow: Branch | CompiledBranch,
+        event: Any,
+        context: Any = None,
+        delay: float = 0.0,
+    ) -> ScheduledRun:
+        """Schedule an execution to start after delay seconds, run() drives it."""
+        if isinstance(workflow, Branch):
+            workflow = workflow.compile()
+        run = ScheduledRun(len(self.runs))
+        self.runs.append(run)
+        steps = workflow.iterate(event, context, self.clock)
+        self._push(self.clock.now() + delay, steps, run)
+        return run
+
+    def _push(self, when: float, steps: Generator, run: ScheduledRun):
+        heapq.heappush(self._queue, (when, next(self._order), steps, run))
+        if len(self._queue) > self.max_pending:
+            self.max_pending = len(self._queue)
+
+    def run(self, until: float | None = None) -> list[ScheduledRun]:
+        """
+        Resume executions in order of their wake-up times until all have finished,
+        or until the clock would pass until. A failing execution records its error
+        and does not stop the others.
+        """
+        queue = self._queue
+        clock = self.clock
+        while queue:
+            when, _, steps, run = queue[0]
+            if until is not None and when > until:
+                break
+            heapq.heappop(queue)
+            clock.sleep_until(when)
+            if run.started_at is None:
+                run.started_at = clock.now()
+            try:
+                delay, name = next(steps)
+            except StopIteration as done:
+                run.output = done.value
+                run.finished_at = clock.now()
+                continue
+            except Exception as exc:
+                run.error = error_name(exc)
+                run.cause = str(exc)
+                run.finished_at = clock.now()
+                continue
+            self.waits[name] += 1
+            self.waited[name] += delay
+            self._push(clock.now() + delay, steps, run)
+        return self.runs
+
+    def __repr__(self):
+        return (
+            f"Scheduler(now={self.clock.now()}, runs={len(self.runs)}, "
+            f"pending={self.pending})"
+        )
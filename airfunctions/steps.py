@@ -1,15 +1,31 @@
+import asyncio
 import inspect
+import json
 import os
+import sys
+import time
 from collections import deque
-from copy import deepcopy
+from collections.abc import Mapping
 from dataclasses import dataclass
+from datetime import datetime, timezone
 from enum import Enum
+from functools import partial
+from importlib import import_module
 from pathlib import Path
-from typing import Any, Callable
+from typing import Any, Awaitable, Callable, Generator, Iterable, Iterator
 
-from airfunctions.conditions import Condition, Ref
+from airfunctions.batch import BatchRun
+from airfunctions.clock import Clock, get_clock
+from airfunctions.conditions import Condition, Ref, dispatcher, equality_table
 from airfunctions.context import ContextManager
+from airfunctions.distributed_map import ItemBatcher, ItemReader, ResultWriter
+from airfunctions.errors import CatchPolicy
+from airfunctions.errors import error_equals as _error_equals
+from airfunctions.executors import LocalExecutor, get_executor
+from airfunctions.jsonata import JSONataTemplate, compile_condition, compile_rules
 from airfunctions.jsonpath import JSONPath
+from airfunctions.retry import RetryPolicy
+from airfunctions.tracing import Tracer, active_tracer
 
 
 def get_handler_path(func: Callable) -> str:
@@ -26,83 +42,234 @@ class AWSResource(str, Enum):
     AWS_STATES_START_EXECUTION_SYNC = "arn:aws:states:::states:startExecution.sync:2"
 
 
-def collect_steps(step: str, content: dict, q: deque):
-    if step not in content["States"]:
-        return
-
-    if content["States"][step]["Type"] == "Choice":
-        for choice in content["States"][step]["Choices"]:
-            q.appendleft(choice["Next"])
-        if "Default" in content["States"][step]:
-            q.appendleft(content["States"][step]["Default"])
-    else:
-        q.appendleft(step)
-
-
-def find_ends(step: str, content: dict) -> list[str]:
-    queue = deque([])
-    collect_steps(step, content, queue)
-    ends = set()
-
-    while queue:
-        nxt = queue.popleft()
-
-        while content["States"][nxt]["Type"] != "Choice" and not content["States"][
-            nxt
-        ].get("End", False):
-            nxt = content["States"][nxt]["Next"]
-        if content["States"][nxt]["Type"] == "Choice":
-            collect_steps(nxt, content, queue)
-            continue
-
-        ends.add(nxt)
-    return list(ends)
+class StepTable(Mapping):
+    """
+    Steps of a Branch keyed by name.
+    A derived table shares the entries of its source as a chain of frozen layers and
+    only stores its own changes, so composing branches never copies their steps.
+    """
+
+    # lookups walking more layers than this flatten the table once
+    MAX_LOOKUP_DEPTH = 32
+
+    def __init__(self, layers: tuple | None = None):
+        # (entries, parent) pairs, newest first
+        self._layers = layers
+        self._own: dict[str, Any] = {}
+        self._flat: dict[str, Any] | None = None
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._own:
+            return self._own[key]
+        if self._flat is not None:
+            return self._flat[key]
+
+        layers = self._layers
+        for _ in range(self.MAX_LOOKUP_DEPTH):
+            if layers is None:
+                raise KeyError(key)
+            entries, layers = layers
+            if key in entries:
+                return entries[key]
+        return self._flatten()[key]
+
+    def __setitem__(self, key: str, step: Any):
+        self._own[key] = step
+        if self._flat is not None:
+            self._flat[key] = step
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._flatten())
+
+    def __len__(self) -> int:
+        return len(self._flatten())
+
+    def keys(self):
+        return self._flatten().keys()
+
+    def values(self):
+        return self._flatten().values()
+
+    def items(self):
+        return self._flatten().items()
+
+    def owns(self, key: str) -> bool:
+        """Whether the step was set on this table since it was last derived from."""
+        return key in self._own
+
+    def derive(self) -> "StepTable":
+        """Freeze the current entries and return a new table sharing them."""
+        if self._own:
+            self._layers = (self._own, self._layers)
+            self._own = {}
+        # sources are rarely read again, shared steps would keep their copy alive
+        self._flat = None
+        return StepTable(self._layers)
+
+    def _flatten(self) -> dict[str, Any]:
+        if self._flat is None:
+            stack = [self._own]
+            layers = self._layers
+            while layers is not None:
+                entries, layers = layers
+                stack.append(entries)
+
+            flat: dict[str, Any] = {}
+            for entries in reversed(stack):
+                flat.update(entries)
+            self._flat = flat
+        return self._flat
 
 
 @dataclass(frozen=True, init=True)
 class Branch:
-    def __init__(self, head: Any, steps: dict | None = None, branch: Any | None = None):
+    """
+    Steps wired into a workflow.
+    Composing with >> returns a new branch sharing the steps of its operands. Steps
+    are copied only when their wiring changes and the terminal states are indexed,
+    so building a workflow edge by edge costs O(1) per edge.
+    The definition is built on first use and kept up to date as steps are added.
+    """
+
+    def __init__(
+        self,
+        head: Any,
+        steps: dict | StepTable | None = None,
+        branch: Any | None = None,
+    ):
         object.__setattr__(self, "head", head)
         object.__setattr__(self, "branch", branch)
-
-        if steps:
+        object.__setattr__(self, "_ends", None)
+        object.__setattr__(self, "_definition", None)
+        object.__setattr__(self, "_version", 0)
+        # names of the states embedding other branches (Parallel, Map)
+        object.__setattr__(self, "_nested", set())
+        # (version, CompiledBranch) of the last compile
+        object.__setattr__(self, "_compiled", None)
+
+        if isinstance(steps, StepTable):
             object.__setattr__(self, "steps", steps)
-            for _, step in self.steps.items():
-                self.add_step(step)
         else:
-            object.__setattr__(self, "steps", {})
+            object.__setattr__(self, "steps", StepTable())
+            for _, step in (steps or {}).items():
+                self.add_step(step)
 
-        self.steps[head.name] = head
-        self.steps[head.name].branch = self
+        self.add_step(head)
 
     def add_step(self, step):
         self.steps[step.name] = step
         step.branch = self
 
+        self._touch()
+        if self._definition is not None:
+            self._definition["States"][step.name] = step._content
+        if step._nested_branches():
+            self._nested.add(step.name)
+        else:
+            self._nested.discard(step.name)
+        for catcher in step.catchers.values():
+            # states an error is routed to belong to the branch of the failing state
+            if catcher.name not in self.steps:
+                self.add_step(catcher if catcher.branch is None else catcher.copy())
+
+    def _touch(self):
+        object.__setattr__(self, "_version", self._version + 1)
+
+    def _stamp(self) -> tuple:
+        """Changes whenever the JSON of the definition would change."""
+        return (
+            self._version,
+            tuple(self.steps[name]._stamp() for name in self._nested),
+        )
+
     def __getitem__(self, key: str):
-        return self.steps[key]
+        # steps looked up by name are wired in place by >>, so they must belong here
+        return self._mutable_step(key)
+
+    def _mutable_step(self, name: str) -> Any:
+        """Return the step for name, copying it first if it is shared with another branch."""
+        step = self.steps[name]
+        if not self.steps.owns(name):
+            step = step.copy()
+            self.add_step(step)
+            if name == self.head.name:
+                object.__setattr__(self, "head", step)
+        return step
+
+    def _derive(self) -> "Branch":
+        new_branch = Branch(self.head.copy(), self.steps.derive())
+        new_branch._nested.update(self._nested)
+        if self._ends is not None:
+            object.__setattr__(new_branch, "_ends", set(self._ends))
+        return new_branch
+
+    @property
+    def ends(self) -> set[str]:
+        """Names of the terminal states reachable from the head, the states add_end wires."""
+        if self._ends is None:
+            object.__setattr__(self, "_ends", self._find_ends(self.head.name))
+        return self._ends
+
+    def _reset_ends(self):
+        object.__setattr__(self, "_ends", None)
+
+    def _find_ends(self, start: str) -> set[str]:
+        """Walk Next pointers from start, looking through Choice states, to the End states."""
+        ends = set()
+        seen = set()
+        queue = deque([start])
+        while queue:
+            name = queue.popleft()
+            if name in seen:
+                continue
+            seen.add(name)
+            try:
+                content = self.steps[name]._content
+            except KeyError:
+                continue
+
+            if content["Type"] == "Choice":
+                queue.extend(choice["Next"] for choice in content["Choices"])
+                if "Default" in content:
+                    queue.append(content["Default"])
+            elif content.get("End", False):
+                ends.add(name)
+            elif "Next" in content:
+                queue.append(content["Next"])
+        return ends
 
     def add_end(self, step):
         if step:
-            ends = find_ends(self.head.name, self.definition)
+            ends = self.ends
             for end in ends:
                 self.add_step(step)
-                self.steps[end].set_next(step)
+                self._mutable_step(end).set_next(step)
+            if ends:
+                # every path now continues at step, so only its ends remain
+                object.__setattr__(self, "_ends", self._find_ends(step.name))
+
+    def _wire(self, name: str, step: Any):
+        """Set step as the Next of the state name, updating the ends when name was one."""
+        ends = self._ends
+        self.add_step(step)
+        self._mutable_step(name).set_next(step)
+        if ends is not None and name in ends:
+            ends.discard(name)
+            ends.update(self._find_ends(step.name))
+            object.__setattr__(self, "_ends", ends)
 
     @classmethod
     def merge_branches(cls, a, b, merge_at: list[str] | None = None):
-        _a = deepcopy(a)
-        _b = deepcopy(b)
-        _head = _a.head
+        new_branch = a._derive()
 
         if merge_at is None:
-            merge_at = (None, _b.head.name)
+            merge_at = (None, b.head.name)
 
-        _steps = {**_a.steps, **_b.steps}
-        new_branch = Branch(_head, _steps)
+        for step in b.steps.values():
+            new_branch.add_step(step.copy())
 
         if merge_at[0]:
-            new_branch.steps[merge_at].set_next(merge_at[1])
+            new_branch._wire(merge_at[0], new_branch.steps[merge_at[1]])
         else:
             new_branch.add_end(new_branch.steps[merge_at[1]])
 
@@ -112,18 +279,15 @@ class Branch:
         if isinstance(nxt, Branch):
             return self.merge_branches(self, nxt)
 
-        _steps = deepcopy(self.steps)
-        _nxt = deepcopy(nxt)
-        _head = _steps[self.head.name]
+        new_branch = self._derive()
 
-        if isinstance(_nxt, Choice):
-            choices = deepcopy(list(_nxt.branch.steps.values()))
-            for c in choices:
-                _steps[c.name] = c
+        if isinstance(nxt, Choice):
+            for step in nxt.branch.steps.values():
+                new_branch.add_step(step.copy())
+            _nxt = new_branch.steps[nxt.name]
         else:
-            _steps[_nxt.name] = _nxt
+            _nxt = nxt.copy()
 
-        new_branch = Branch(_head, _steps)
         new_branch.add_end(_nxt)
         return new_branch
 
@@ -137,37 +301,480 @@ class Branch:
 
     @property
     def definition(self) -> dict:
-        return {
-            "StartAt": self.head.name,
-            "States": dict((k, v._content) for k, v in self.steps.items()),
-        }
+        if self._definition is None:
+            definition = {
+                "StartAt": self.head.name,
+                "States": dict((k, v._content) for k, v in self.steps.items()),
+            }
+            object.__setattr__(self, "_definition", definition)
+        return self._definition
+
+    def iter_json(self, members: dict | None = None) -> Iterator[str]:
+        """
+        Yield the definition as JSON text in chunks, equal to json.dumps(definition).
+        Every state is serialized by its step, which reuses the text until it changes.
+        Extra members are written before StartAt.
+        """
+        yield "{"
+        for key, value in (members or {}).items():
+            yield f"{json.dumps(key)}: {json.dumps(value)}, "
+        yield f'"StartAt": {json.dumps(self.head.name)}, "States": {{'
+        separator = ""
+        for name, step in self.steps.items():
+            yield f"{separator}{json.dumps(name)}: {step.to_json()}"
+            separator = ", "
+        yield "}}"
+
+    def to_json(self) -> str:
+        return "".join(self.iter_json())
+
+    def dump(self, fp):
+        """Stream the definition as JSON to a file object without building it as a dict."""
+        fp.writelines(self.iter_json())
 
     def to_statemachine(self, name: str) -> Any:
         return StateMachine(name, branch=self)
 
-    @staticmethod
-    def __call_choice(curr, event, context):
-        con: Condition
-        for con, step_name in curr.choices.items():
-            if con.evaluate(event, context):
-                return curr.branch.steps[step_name]
-        return curr.branch.steps[curr.default]
+    def compile(self, clock: str | Clock | None = None) -> "CompiledBranch":
+        """
+        Compile the branch into an executor, reused until the branch changes.
+        Runs of the branch go through it, the executor can also be kept and called
+        directly. Retries wait on the given clock, by default on Config().local_clock
+        (an executor with its own clock is not reused).
+        """
+        if clock is not None:
+            return CompiledBranch(self, clock)
+        if self._compiled is None or self._compiled[0] != self._version:
+            object.__setattr__(
+                self, "_compiled", (self._version, CompiledBranch(self))
+            )
+        return self._compiled[1]
 
     def __call__(self, event: dict, context: Any):
-        curr: Step = self.head
-        _in = event
-        _context = context
+        tracer = active_tracer()
+        if tracer is not None:
+            return self.compile().trace(event, context, tracer)
+        return self.compile()(event, context)
+
+    def run_many(self, events: Iterable[dict], context: Any = None) -> list:
+        """Run one simulated execution per event, one after another."""
+        tracer = active_tracer()
+        if tracer is not None:
+            executor = self.compile()
+            return [executor.trace(event, context, tracer) for event in events]
+        return self.compile().run_many(events, context)
+
+    def run_batch(
+        self,
+        events: Iterable[dict],
+        workers: int | None = None,
+        context: Any = None,
+        chunk_size: int = 100,
+    ) -> BatchRun:
+        """
+        Replay a stream of events on a pool of worker processes (all CPUs by default,
+        workers=1 runs in this process). Iterating the returned BatchRun yields an
+        EventResult per event in order, failures included, and updates its counters.
+        """
+        return BatchRun(self, events, workers, context, chunk_size)
+
+    def __getstate__(self):
+        # the compiled executor holds closures, it is compiled again after unpickling
+        state = self.__dict__.copy()
+        state["_compiled"] = None
+        return state
+
+    async def acall(self, event: dict, context: Any):
+        """
+        Run the branch on the running event loop, see CompiledBranch.acall.
+        Coroutine handlers are awaited and Parallel branches run concurrently.
+        """
+        return await self.compile().acall(event, context, active_tracer())
+
+    async def acall_many(
+        self,
+        events: Iterable[dict],
+        context: Any = None,
+        max_concurrency: int | None = None,
+    ) -> list:
+        """Run one simulated execution per event concurrently on the running loop."""
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def run(event):
+            if semaphore is None:
+                return await self.acall(event, context)
+            async with semaphore:
+                return await self.acall(event, context)
+
+        return await gather_or_cancel([run(event) for event in events])
+
+
+class CompiledBranch:
+    """
+    Immutable executor of a Branch.
+    States are numbered and every state is bound once to its input and output
+    processing and to the index of its successor, so running an event does no
+    lookups by name.
+    """
+
+    __slots__ = ("names", "clock", "_start", "_states", "_aruns", "_waits")
+
+    def __init__(self, branch: Branch, clock: str | Clock | None = None):
+        names = tuple(branch.steps.keys())
+        index = {name: i for i, name in enumerate(names)}
+
+        def resolve(step: Step, target: str) -> int:
+            try:
+                return index[target]
+            except KeyError:
+                raise ValueError(
+                    f"State {step.name} transitions to unknown state {target}."
+                )
+
+        states = []
+        aruns = []
+        waits = []
+        for name in names:
+            step = branch.steps[name]
+            waits.append(step if isinstance(step, Wait) else None)
+            aruns.append(None)
+            process_input, process_output = step._processors
+            if isinstance(step, Choice):
+                default = resolve(step, step.default)
+                dispatch = step.dispatch
+                if dispatch is not None:
+                    path, table = dispatch
+                    table = {
+                        literal: resolve(step, target) for literal, target in table.items()
+                    }
+                    successor = dispatcher(path, table, default)
+                else:
+                    successor = compile_rules(
+                        (
+                            (rule["Condition"], resolve(step, rule["Next"]))
+                            for rule in step._content["Choices"]
+                        ),
+                        default,
+                    )
+                states.append((process_input, None, None, successor, None))
+            else:
+                successor = -1 if step.end else resolve(step, step.next)
+                retry, catch = step._retry_policy(), step._catch_policy()
+                errors = None
+                if retry is not None or catch is not None:
+                    targets = tuple(
+                        resolve(step, target) for target in (catch.targets if catch else ())
+                    )
+                    errors = (retry, catch, targets)
+                run = step._run
+                arun = step._acall
+                if isinstance(step, Wait) and clock is not None:
+                    run = partial(_wait, step, get_clock(clock))
+                    arun = partial(_await_wait, step, get_clock(clock))
+                aruns[-1] = arun
+                states.append(
+                    (process_input, run, process_output, successor, errors)
+                )
+
+        object.__setattr__(self, "names", names)
+        object.__setattr__(self, "clock", clock)
+        object.__setattr__(self, "_start", index[branch.head.name])
+        object.__setattr__(self, "_states", tuple(states))
+        object.__setattr__(self, "_aruns", tuple(aruns))
+        object.__setattr__(self, "_waits", tuple(waits))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledBranch is immutable.")
+
+    def __call__(self, event: Any, context: Any = None) -> Any:
+        states = self._states
+        data = event
+        i = self._start
+        while True:
+            process_input, run, process_output, successor, errors = states[i]
+            raw = data
+            if process_input is not None:
+                data = process_input(data)
+            if run is None:
+                i = successor(data, context)
+                continue
+            try:
+                data = run(data, context)
+            except Exception as error:
+                if errors is None:
+                    raise
+                data, target = self._recover(i, errors, raw, data, context, error)
+                if target >= 0:
+                    i = target
+                    continue
+            if process_output is not None:
+                data = process_output(raw, data)
+            if successor < 0:
+                return data
+            i = successor
+
+    def trace(self, event: Any, context: Any, tracer: Tracer) -> Any:
+        """Run an event like calling the executor does, recording every state on tracer."""
+        clock = time.perf_counter_ns
+        branch = self.names[self._start]
+        states = self._states
+        names = self.names
+        data = event
+        i = self._start
+        while True:
+            process_input, run, process_output, successor, errors = states[i]
+            raw = data
+            start = clock()
+            if process_input is not None:
+                data = process_input(data)
+            input_end = clock()
+            if run is None:
+                target = successor(data, context)
+                end = clock()
+                tracer.record(branch, names[i], start, input_end, end, end, raw, data)
+                i = target
+                continue
+            try:
+                data = run(data, context)
+            except Exception as error:
+                handler_end = clock()
+                if errors is None:
+                    tracer.record(
+                        branch, names[i], start, input_end, handler_end, handler_end,
+                        raw, error=error,
+                    )
+                    raise
+                try:
+                    data, target = self._recover(i, errors, raw, data, context, error)
+                except Exception as exc:
+                    end = clock()
+                    tracer.record(
+                        branch, names[i], start, input_end, end, end, raw, error=exc
+                    )
+                    raise
+                if target >= 0:
+                    end = clock()
+                    tracer.record(branch, names[i], start, input_end, end, end, raw, data)
+                    i = target
+                    continue
+            handler_end = clock()
+            if process_output is not None:
+                data = process_output(raw, data)
+            end = clock()
+            tracer.record(branch, names[i], start, input_end, handler_end, end, raw, data)
+            if successor < 0:
+                return data
+            i = successor
+
+    def iterate(
+        self, event: Any, context: Any = None, clock: Clock | None = None
+    ) -> Generator[tuple[float, str], None, Any]:
+        """
+        Run an event as a generator which, instead of waiting in Wait states and
+        before retries, yields (seconds, state name) and expects to be resumed once
+        that time has passed. Returns the output of the run, see Scheduler.
+        """
+        clock = get_clock(clock or self.clock)
+        states = self._states
+        waits = self._waits
+        names = self.names
+        data = event
+        i = self._start
         while True:
-            _in = curr._parse_input(_in)
-            if isinstance(curr, Choice):
-                curr = self.__call_choice(curr, _in, context)
+            process_input, run, process_output, successor, errors = states[i]
+            raw = data
+            if process_input is not None:
+                data = process_input(data)
+            if run is None:
+                i = successor(data, context)
                 continue
-            _out = curr(_in, _context)
-            _in = curr._parse_output(_out)
-            if curr.end:
-                break
-            curr = self.steps[curr.next]
-        return _in
+            wait = waits[i]
+            if wait is not None:
+                yield wait.delay(data, clock.time()), names[i]
+            else:
+                try:
+                    data = run(data, context)
+                except Exception as error:
+                    if errors is None:
+                        raise
+                    recovering = self._recovering(i, errors, raw, error)
+                    request, caught = _resume(recovering, None)
+                    while request is not None:
+                        yield request
+                        try:
+                            caught = run(data, context), -1
+                        except Exception as exc:
+                            request, caught = _resume(recovering, exc)
+                        else:
+                            break
+                    data, target = caught
+                    if target >= 0:
+                        i = target
+                        continue
+            if process_output is not None:
+                data = process_output(raw, data)
+            if successor < 0:
+                return data
+            i = successor
+
+    async def acall(
+        self, event: Any, context: Any = None, tracer: Tracer | None = None
+    ) -> Any:
+        """
+        Run an event on the running event loop like calling the executor does:
+        coroutine handlers are awaited, Parallel and Map states run their branches
+        concurrently and waits go through asyncio. States are recorded on tracer
+        when one is given.
+        """
+        clock = time.perf_counter_ns
+        branch = self.names[self._start]
+        states = self._states
+        aruns = self._aruns
+        names = self.names
+        data = event
+        i = self._start
+        while True:
+            process_input, run, process_output, successor, errors = states[i]
+            raw = data
+            start = clock()
+            if process_input is not None:
+                data = process_input(data)
+            input_end = clock()
+            if run is None:
+                target = successor(data, context)
+                if tracer is not None:
+                    end = clock()
+                    tracer.record(branch, names[i], start, input_end, end, end, raw, data)
+                i = target
+                continue
+            try:
+                data = await aruns[i](data, context)
+            except Exception as error:
+                try:
+                    if errors is None:
+                        raise
+                    data, target = await self._arecover(i, errors, raw, data, context, error)
+                except Exception as exc:
+                    if tracer is not None:
+                        end = clock()
+                        tracer.record(
+                            branch, names[i], start, input_end, end, end, raw, error=exc
+                        )
+                    raise
+                if target >= 0:
+                    if tracer is not None:
+                        end = clock()
+                        tracer.record(branch, names[i], start, input_end, end, end, raw, data)
+                    i = target
+                    continue
+            handler_end = clock()
+            if process_output is not None:
+                data = process_output(raw, data)
+            if tracer is not None:
+                end = clock()
+                tracer.record(
+                    branch, names[i], start, input_end, handler_end, end, raw, data
+                )
+            if successor < 0:
+                return data
+            i = successor
+
+    def _recover(
+        self, i: int, errors: tuple, raw: Any, data: Any, context: Any, error: Exception
+    ) -> tuple[Any, int]:
+        """Handle an error of state i, waiting on the clock before every retry."""
+        clock = get_clock(self.clock)
+        run = self._states[i][1]
+        recovering = self._recovering(i, errors, raw, error)
+        request, caught = _resume(recovering, None)
+        while request is not None:
+            clock.sleep(*request)
+            try:
+                return run(data, context), -1
+            except Exception as exc:
+                request, caught = _resume(recovering, exc)
+        return caught
+
+    async def _arecover(
+        self, i: int, errors: tuple, raw: Any, data: Any, context: Any, error: Exception
+    ) -> tuple[Any, int]:
+        """Handle an error of state i like _recover, waiting on the event loop."""
+        clock = get_clock(self.clock)
+        arun = self._aruns[i]
+        recovering = self._recovering(i, errors, raw, error)
+        request, caught = _resume(recovering, None)
+        while request is not None:
+            await clock.asleep(*request)
+            try:
+                return await arun(data, context), -1
+            except Exception as exc:
+                request, caught = _resume(recovering, exc)
+        return caught
+
+    def _recovering(
+        self, i: int, errors: tuple, raw: Any, error: Exception
+    ) -> Generator[tuple[float, str], Exception, tuple[Any, int]]:
+        """
+        Decide how an error of state i is handled, for every way of running events.
+        Yields (seconds, state name) before every attempt its Retry blocks allow:
+        the caller waits, runs the state again and sends the error of a failed
+        attempt. Then routes the last error to the first matching Catch block,
+        returning the catcher output with the index of the catcher state, or raises
+        the error.
+        """
+        retry, catch, targets = errors
+        if retry is not None:
+            name = self.names[i]
+            attempts = retry.start()
+            while True:
+                delay = retry.delay(error, attempts)
+                if delay is None:
+                    break
+                error = yield delay, name
+        if catch is not None:
+            caught = catch.catch(error, raw)
+            if caught is not None:
+                index, output = caught
+                return output, targets[index]
+        raise error
+
+    def run_many(self, events: Iterable[Any], context: Any = None) -> list:
+        """Run one simulated execution per event, one after another."""
+        return [self(event, context) for event in events]
+
+    def __repr__(self):
+        return f"CompiledBranch({', '.join(self.names)})"
+
+
+def _wait(step: "Wait", clock: Clock, event: Any, context: Any) -> Any:
+    return step.wait(event, clock)
+
+
+async def _await_wait(step: "Wait", clock: Clock, event: Any, context: Any) -> Any:
+    await clock.asleep(step.delay(event, clock.time()), step.name)
+    return event
+
+
+def _resume(recovering: Generator, error: Exception | None) -> tuple[tuple | None, Any]:
+    """
+    Resume a CompiledBranch._recovering generator with the error of the last
+    attempt: (the next (seconds, state name), None), or (None, its result) once done.
+    """
+    try:
+        return recovering.send(error), None
+    except StopIteration as done:
+        return None, done.value
+
+
+async def gather_or_cancel(aws: list[Awaitable]) -> list:
+    """Gather awaitables in order, cancelling the remaining ones on the first error."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
 
 
 class Step:
@@ -177,7 +784,7 @@ class Step:
         type: str,
         query_language: str | None = None,
         input_path: str | None = None,
-        result_path: str | None = None,
+        result_path: str | None = "$",
         output_path: str | None = None,
         comment: str | None = None,
         branch: Branch | None = None,
@@ -191,7 +798,8 @@ class Step:
         if input_path:
             self._content["InputPath"] = input_path
 
-        if result_path:
+        # "$" is the default of ResultPath, null discards the result of the state
+        if result_path != "$":
             self._content["ResultPath"] = result_path
 
         if output_path:
@@ -202,6 +810,12 @@ class Step:
 
         self.branch = branch
         self.catchers: dict[tuple[str], Step] = {}
+        self._version = 0
+        # (stamp, JSON text) of the last serialization
+        self._rendered: tuple[Any, str] | None = None
+        self._bound: tuple | None = None
+        # (Arguments, Output) templates of a JSONata state once compiled, see _jsonata
+        self._bound_jsonata: tuple | None = None
 
     @property
     def input_path(self):
@@ -215,27 +829,132 @@ class Step:
     def output_path(self):
         return self._content.get("OutputPath")
 
-    def _parse_input(self, input_data) -> Any:
-        jsonpath = JSONPath()
-        if getattr(self, "input_path", None):
-            effective_input = jsonpath.apply(self.input_path, input_data)
-        else:
-            effective_input = input_data
+    @property
+    def _processors(self) -> tuple:
+        """
+        Input (InputPath, Parameters) and output (ResultPath, OutputPath) processing
+        bound once, each None when the data passes through unchanged.
+        """
+        if self._bound is None:
+            self._bound = (self._bind_input(), self._bind_output())
+        return self._bound
+
+    def _bind_input(self) -> Callable[[Any], Any] | None:
+        select = _bind_path(self.input_path)
+        if not getattr(self, "parameters", None):
+            return select
+
+        render = self.parameters_template.render
+        if select is None:
+            return render
+        return lambda data: render(select(data))
+
+    def _bind_output(self) -> Callable[[Any, Any], Any] | None:
+        """
+        Function of (state input, result) giving the state output: the result
+        placed in the state input by ResultPath, then selected by OutputPath.
+        """
+        result = _bind_result_path(self._content.get("ResultPath", "$"))
+        output = _bind_path(self.output_path)
+        if result is None:
+            if output is None:
+                return None
+            return lambda data, value: output(value)
+        if output is None:
+            return result
+        return lambda data, value: output(result(data, value))
 
-        if getattr(self, "parameters", None):
-            return jsonpath.process_payload_template(self.parameters, effective_input)
-        return effective_input
+    @property
+    def _jsonata(self) -> tuple | None:
+        """
+        Compiled (Arguments, Output) of a JSONata state, either None when absent,
+        None for other states.
+        """
+        if self._bound_jsonata is None:
+            fields = None
+            if self._content.get("QueryLanguage") == "JSONata" and not isinstance(self, Choice):
+                arguments = self._content.get("Arguments")
+                output = self._content.get("Output")
+                if arguments is not None or output is not None:
+                    fields = (
+                        JSONataTemplate(arguments) if arguments is not None else None,
+                        JSONataTemplate(output) if output is not None else None,
+                    )
+            self._bound_jsonata = (fields,)
+        return self._bound_jsonata[0]
 
-    def _parse_output(self, output_data) -> Any:
-        jsonpath = JSONPath()
-        if getattr(self, "result_path", None):
-            effective_output = jsonpath.apply(self.result_path, output_data)
-        else:
-            effective_output = output_data
+    @property
+    def _run(self) -> Callable[[Any, Any], Any]:
+        """
+        The step as local runs call it: a JSONata state evaluates its Arguments as
+        the handler input and its Output from $states.input and $states.result.
+        """
+        fields = self._jsonata
+        if fields is None:
+            return self
+        arguments, output = fields
+        result_bound = isinstance(self, Task)
+
+        def run(event: Any, context: Any) -> Any:
+            args = event if arguments is None else arguments.render_state(event, context)
+            result = self(args, context)
+            if output is None:
+                return result
+            if result_bound:
+                return output.render_state(event, context, result=result)
+            return output.render_state(event, context)
+
+        return run
+
+    async def _acall(self, event: Any, context: Any) -> Any:
+        """acall with the Arguments and Output of a JSONata state, see _run."""
+        fields = self._jsonata
+        if fields is None:
+            return await self.acall(event, context)
+        arguments, output = fields
+        args = event if arguments is None else arguments.render_state(event, context)
+        result = await self.acall(args, context)
+        if output is None:
+            return result
+        if isinstance(self, Task):
+            return output.render_state(event, context, result=result)
+        return output.render_state(event, context)
+
+    def _retry_policy(self) -> RetryPolicy | None:
+        """Retry blocks of the state, None when errors are not retried."""
+        retriers = self._content.get("Retry")
+        if not retriers:
+            return None
+        return RetryPolicy(retriers, task=isinstance(self, Task))
+
+    def _catch_policy(self) -> CatchPolicy | None:
+        """Catch blocks of the state, None when errors are not caught."""
+        catchers = self._content.get("Catch")
+        if not catchers:
+            return None
+        return CatchPolicy(catchers, task=isinstance(self, Task))
 
-        if getattr(self, "output_path", None):
-            return jsonpath.apply(self.output_path, effective_output)
-        return effective_output
+    def _parse_input(self, input_data) -> Any:
+        process_input = self._processors[0]
+        if process_input is None:
+            return input_data
+        return process_input(input_data)
+
+    def _parse_output(self, output_data, input_data) -> Any:
+        process_output = self._processors[1]
+        if process_output is None:
+            return output_data
+        return process_output(input_data, output_data)
+
+    def __getstate__(self):
+        # bound processors are closures, they are bound again after unpickling
+        state = self.__dict__.copy()
+        state["_bound"] = None
+        state["_bound_jsonata"] = None
+        return state
+
+    async def acall(self, event: Any, context: Any) -> Any:
+        return self(event, context)
 
     @property
     def end(self) -> bool:
@@ -252,6 +971,51 @@ class Step:
         if nxt:
             self._content["Next"] = nxt.name
             self._content.pop("End", None)
+            self._touch()
+            if self.branch is not None:
+                self.branch._reset_ends()
+
+    def _touch(self):
+        """Mark the state definition as changed, so it is serialized again."""
+        self._version += 1
+        if self.branch is not None:
+            self.branch._touch()
+
+    def _nested_branches(self) -> list[Branch]:
+        return []
+
+    def _stamp(self) -> Any:
+        return self._version
+
+    def to_json(self) -> str:
+        """The state definition as JSON text, cached until the step changes."""
+        stamp = self._stamp()
+        if self._rendered is None or self._rendered[0] != stamp:
+            self._rendered = (stamp, self._render())
+        return self._rendered[1]
+
+    def _render(self) -> str:
+        return json.dumps(self._content)
+
+    def copy(self) -> "Step":
+        """
+        Copy the step for use in another branch.
+        The copy gets its own state definition, so wiring it leaves this step
+        untouched, while handlers, templates and nested branches are shared.
+        """
+        step = self.__class__.__new__(self.__class__)
+        step.__dict__.update(self.__dict__)
+        step._content = {
+            key: (
+                [dict(item) if isinstance(item, dict) else item for item in value]
+                if isinstance(value, list)
+                else value
+            )
+            for key, value in self._content.items()
+        }
+        step.catchers = dict(self.catchers)
+        step.branch = None
+        return step
 
     def __rshift__(self, next: Any) -> Branch:
         if isinstance(next, Branch):
@@ -261,26 +1025,24 @@ class Step:
                 )
                 return new_branch
             else:
-                new_branch = deepcopy(next)
+                new_branch = next._derive()
                 new_branch.add_end(self)
                 return new_branch
 
-        _next = deepcopy(next)
-        if isinstance(_next, Step):
+        if isinstance(next, Step):
+            _next = next.copy()
             if next != self and self.branch is None:
                 branch = Branch(head=self)
                 branch.add_end(_next)
                 return branch
             elif self.branch:
-                _next.branch = self.branch
-                self.branch.steps[_next.name] = _next
-                self.branch.steps[self.name].set_next(_next)
+                self.branch._wire(self.name, _next)
                 return self.branch
             else:
                 raise ValueError("step cannot be attached to itself.")
 
-        if isinstance(_next, (list, tuple)):
-            pnext: Parallel = parallel(*_next)
+        if isinstance(next, (list, tuple)):
+            pnext: Parallel = parallel(*next)
 
             if self.branch:
                 branch = self.branch
@@ -289,11 +1051,11 @@ class Step:
 
             branch.add_end(pnext)
             return branch
-        return _next
+        return next
 
     def retry(
         self,
-        error_equals: list[str, Exception] | Exception | str,
+        error_equals: list[str | type[Exception]] | type[Exception] | str,
         interval_seconds: int,
         max_attempts: int,
         max_delay_seconds: int | None = None,
@@ -302,67 +1064,86 @@ class Step:
         if "Retry" not in self._content:
             self._content["Retry"] = []
 
-        retry = {}
-        if isinstance(error_equals, (str, Exception)):
-            retry["ErrorEquals"] = [
-                str(error_equals),
-            ]
-        else:
-            retry["ErrorEquals"] = [str(err) for err in error_equals]
+        retry = {"ErrorEquals": _error_equals(error_equals)}
 
-        if interval_seconds:
+        # zero is a meaningful value, MaxAttempts 0 never retries
+        if interval_seconds is not None:
             retry["IntervalSeconds"] = interval_seconds
-        if max_attempts:
+        if max_attempts is not None:
             retry["MaxAttempts"] = max_attempts
-        if max_delay_seconds:
+        if max_delay_seconds is not None:
             retry["MaxDelaySeconds"] = max_delay_seconds
-        if back_off_rate:
+        if back_off_rate is not None:
             retry["BackOffRate"] = back_off_rate
 
         self._content["Retry"].append(retry)
+        self._touch()
 
-    def catch(self, error_equals: list[str, Exception] | Exception | str, nxt: Any):
+    def catch(
+        self,
+        error_equals: list[str | type[Exception]] | type[Exception] | str,
+        nxt: Any,
+        result_path: str | None = "$",
+    ):
         if "Catch" not in self._content:
             self._content["Catch"] = []
 
-        _catch = {}
-        if isinstance(error_equals, (str, Exception)):
-            _catch["ErrorEquals"] = (str(error_equals),)
-        else:
-            _catch["ErrorEquals"] = tuple([str(err) for err in error_equals])
+        _catch = {"ErrorEquals": _error_equals(error_equals)}
+        if result_path != "$":
+            _catch["ResultPath"] = result_path
 
-        _key = _catch["ErrorEquals"]
-        self.catchers[_key] = deepcopy(nxt)
+        _key = tuple(_catch["ErrorEquals"])
+        self.catchers[_key] = nxt.copy()
         _next = self.catchers[_key]
+        _catch["Next"] = _next.name
 
         try:
             idx, _ = next(
                 filter(
-                    lambda _, item: item["ErrorEquals"] == _key,
+                    lambda item: tuple(item[1]["ErrorEquals"]) == _key,
                     enumerate(self._content["Catch"]),
                 )
             )
-            self._content["Catch"][idx]["Next"] = _next.name
+            self._content["Catch"][idx] = _catch
         except StopIteration:
-            _catch["Next"] = _next.name
             self._content["Catch"].append(_catch)
+        if self.branch is not None and _next.name not in self.branch.steps:
+            self.branch.add_step(_next)
+        self._touch()
         return self
 
-    def catcher(self, error_equals: list[str, Exception] | Exception | str) -> Any:
-        if isinstance(error_equals, (str, Exception)):
-            _key = (str(error_equals),)
-        else:
-            _key = tuple([str(err) for err in error_equals])
+    def catcher(self, error_equals: list[str | type[Exception]] | type[Exception] | str) -> Any:
+        _key = tuple(_error_equals(error_equals))
 
         if not self.branch:
             return self.catchers[_key]
         _name = self.catchers[_key].name
-        return self.branch.steps[_name]
+        return self.branch[_name]
 
     def __repr__(self):
         return f"{self._content['Type']}(name={self.name})"
 
 
+def _bind_path(path: str | None) -> Callable[[Any], Any] | None:
+    """Bind a state path, None when it selects the whole input."""
+    if not path or path == "$":
+        return None
+    return JSONPath.compile(path).apply
+
+
+def _bind_result_path(path: str | None) -> Callable[[Any, Any], Any] | None:
+    """
+    Bind a ResultPath as a function of (state input, result), None when the result
+    replaces the input, null discards the result. Only the objects along the path
+    are copied, the rest of the output is shared with the input.
+    """
+    if path is None:
+        return lambda data, value: data
+    if not path or path == "$":
+        return None
+    return JSONPath.compile(path).assign
+
+
 class Task(Step):
     def __init__(
         self,
@@ -371,9 +1152,11 @@ class Task(Step):
         parameters: dict | None = None,
         query_language: str | None = None,
         input_path: str | None = None,
-        result_path: str | None = None,
+        result_path: str | None = "$",
         output_path: str | None = None,
         comment: str | None = None,
+        arguments: Any | None = None,
+        output: Any | None = None,
         **kwargs,
     ):
         super().__init__(
@@ -393,6 +1176,14 @@ class Task(Step):
 
         if self.parameters:
             self._content["Parameters"] = self.parameters
+            self.parameters_template = JSONPath().compile_template(self.parameters)
+
+        # fields of JSONata states, evaluated locally by airfunctions.jsonata
+        if arguments is not None:
+            self._content["Arguments"] = arguments
+
+        if output is not None:
+            self._content["Output"] = output
 
 
 class Choice(Step):
@@ -408,11 +1199,20 @@ class Choice(Step):
         **kwargs,
     ):
         super().__init__(
-            name, "Choice", "JSONata", input_path, None, None, comment, **kwargs
+            name, "Choice", "JSONata", input_path, "$", None, comment, **kwargs
         )
         self._content.pop("End", None)
 
         self.choices: dict[Condition, str] = {}
+        # optimized condition per rule of the definition: conditions which render
+        # differently may still be equal keys of choices (Ref("a") == 1, Ref("a") == True)
+        self._conditions: list[Condition | bool] = []
+        # (compiled Condition, target) per rule of the definition, compiled by choose
+        self._rules: tuple | None = ()
+        # (equality table or None,) once analysed, see dispatch
+        self._dispatch: tuple | None = None
+        # function of (event, context) to the next state name, see router
+        self._router: Callable[[Any, Any], str] | None = None
         self._content["Choices"] = []
 
         self.branch = Branch(head=self)
@@ -424,34 +1224,104 @@ class Choice(Step):
     def choice(self, condition: Condition | None = None) -> Step | Branch | None:
         if condition:
             _name = self.choices[condition]
-            return self.branch.steps[_name]
+            return self.branch[_name]
         else:
             if condition:
                 _name = self.choices[condition].name
-                return self.branch.steps[_name]
+                return self.branch[_name]
+            else:
+                return self.branch[self.default]
+
+    def copy(self) -> "Choice":
+        step = super().copy()
+        step.choices = dict(self.choices)
+        step._conditions = list(self._conditions)
+        return step
+
+    @property
+    def rules(self) -> tuple:
+        """
+        (compiled condition, target state name) per rule, in evaluation order. The
+        JSONata Conditions of the definition are evaluated, so local runs route as
+        the deployed state machine does.
+        """
+        if self._rules is None:
+            self._rules = tuple(
+                (compile_condition(rule["Condition"]), rule["Next"])
+                for rule in self._content["Choices"]
+            )
+        return self._rules
+
+    @property
+    def dispatch(self) -> tuple[str, dict] | None:
+        """
+        Path of the reference and table of targets by literal when every rule is an
+        equality (or an or of equalities) of one reference, see equality_table.
+        Local runs then route with one lookup instead of testing rules in order.
+        """
+        if self._dispatch is None:
+            targets = [rule["Next"] for rule in self._content["Choices"]]
+            self._dispatch = (equality_table(zip(self._conditions, targets)),)
+        return self._dispatch[0]
+
+    @property
+    def router(self) -> Callable[[Any, Any], str]:
+        """
+        Function of (event, context) giving the name of the state the Choice moves
+        to: a lookup in the table of dispatch when there is one, otherwise the rules
+        in order, see compile_rules.
+        """
+        if self._router is None:
+            dispatch = self.dispatch
+            if dispatch is not None:
+                self._router = dispatcher(*dispatch, self.default)
             else:
-                return self.branch.steps[self.default]
+                self._router = compile_rules(
+                    ((rule["Condition"], rule["Next"]) for rule in self._content["Choices"]),
+                    self.default,
+                )
+        return self._router
 
     def choose(self, condition: Condition, next: Step):
-        _next = deepcopy(next)
+        _next = next.copy()
         self.branch.add_step(_next)
+        self.branch._reset_ends()
 
         self.choices[condition] = _next.name
+        self._dispatch = None
+        self._router = None
+
+        # rules are analysed as deployed, see Condition.optimize
+        jsonata = condition.jsonata()
+        condition = condition.optimize()
         try:
             condition_idx = [
                 item["Condition"] for item in self._content["Choices"]
-            ].index(condition)
+            ].index(jsonata)
             self._content["Choices"][condition_idx]["Next"] = _next.name
+            self._conditions[condition_idx] = condition
+            self._rules = None
         except ValueError:
+            rules = self.rules + ((compile_condition(jsonata), _next.name),)
             self._content["Choices"].append(
-                {"Condition": condition.jsonata(), "Next": _next.name}
+                {"Condition": jsonata, "Next": _next.name}
             )
+            self._conditions.append(condition)
+            self._rules = rules
+        self._touch()
         return self
 
+    def __getstate__(self):
+        # compiled conditions are closures, they are compiled again after unpickling
+        state = super().__getstate__()
+        state["_rules"] = None
+        state["_router"] = None
+        return state
+
     def __repr__(self):
         choices = []
         for con, step_name in self.choices.items():
-            step = self.branch[step_name]
+            step = self.branch.steps[step_name]
             choices.append(f"{con}>>{step}")
         if self.default:
             choices.append(f"default>>{self.default}")
@@ -468,10 +1338,12 @@ class Parallel(Step):
         branches: list[Step | Branch] | None = None,
         query_language=None,
         input_path=None,
-        result_path=None,
+        result_path="$",
         output_path=None,
         comment=None,
         branch=None,
+        executor: str | LocalExecutor | None = None,
+        max_concurrency: int | None = None,
         **kwargs,
     ):
         super().__init__(
@@ -489,18 +1361,60 @@ class Parallel(Step):
             self.branches = branches
         else:
             self.branches = []
+        self.executor = executor
+        self.max_concurrency = max_concurrency
 
-        self._content["Branches"] = []
+        # definitions are live, later changes of the branches show up in the state
+        self._graphs: list[Branch] = []
         branch: Step | Branch
         for branch in self.branches:
             if isinstance(branch, Step):
-                self._content["Branches"].append(
-                    Branch(head=branch).definition)
+                self._graphs.append(Branch(head=branch))
             if isinstance(branch, Branch):
-                self._content["Branches"].append(branch.definition)
+                self._graphs.append(branch)
+        self._content["Branches"] = [graph.definition for graph in self._graphs]
+
+    def _nested_branches(self) -> list[Branch]:
+        return self._graphs
+
+    def _stamp(self) -> Any:
+        return (self._version, tuple(graph._stamp() for graph in self._graphs))
+
+    def _render(self) -> str:
+        branches = ", ".join(graph.to_json() for graph in self._graphs)
+        return render_content(self._content, {"Branches": f"[{branches}]"})
 
     def __call__(self, event, context, *args, **kwds):
-        return [_branch(event, context) for _branch in self.branches]
+        executor = get_executor(self.executor, self.max_concurrency)
+        run_branch = partial(_run_branch, event=event, context=context)
+        return list(executor.map(run_branch, self.branches))
+
+    async def acall(self, event, context):
+        if not self.max_concurrency:
+            return await gather_or_cancel(
+                [_branch.acall(event, context) for _branch in self.branches]
+            )
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(_branch):
+            async with semaphore:
+                return await _branch.acall(event, context)
+
+        return await gather_or_cancel([run(_branch) for _branch in self.branches])
+
+
+def render_content(content: dict, rendered: dict[str, str]) -> str:
+    """json.dumps(content), with the values of some keys given as JSON text."""
+    members = []
+    for key, value in content.items():
+        text = rendered[key] if key in rendered else json.dumps(value)
+        members.append(f"{json.dumps(key)}: {text}")
+    return "{" + ", ".join(members) + "}"
+
+
+def _run_branch(branch: Step | Branch, event: Any, context: Any) -> Any:
+    return branch(event, context)
 
 
 def parallel(*branches: list[Step | Branch], **kwargs) -> Parallel:
@@ -511,6 +1425,171 @@ def parallel(*branches: list[Step | Branch], **kwargs) -> Parallel:
     return Parallel(name=name, branches=branches, **kwargs)
 
 
+class Map(Step):
+    """
+    Runs item_processor for every item of an array.
+    With mode="DISTRIBUTED" items can be read by an ItemReader, grouped by an
+    ItemBatcher and results written by a ResultWriter. Local distributed runs
+    default to the process executor.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        item_processor: Step | Branch,
+        items_path: str | None = None,
+        item_selector: dict | None = None,
+        max_concurrency: int | None = None,
+        query_language: str | None = None,
+        input_path: str | None = None,
+        result_path: str | None = "$",
+        output_path: str | None = None,
+        comment: str | None = None,
+        branch: Branch | None = None,
+        executor: str | LocalExecutor | None = None,
+        mode: str = "INLINE",
+        execution_type: str = "STANDARD",
+        item_reader: ItemReader | None = None,
+        item_batcher: ItemBatcher | None = None,
+        result_writer: ResultWriter | None = None,
+        **kwargs,
+    ):
+        super().__init__(
+            name,
+            "Map",
+            query_language,
+            input_path,
+            result_path,
+            output_path,
+            comment,
+            branch,
+            **kwargs,
+        )
+        if mode not in ("INLINE", "DISTRIBUTED"):
+            raise ValueError(f"Map mode {mode} not recognized.")
+        if mode == "INLINE" and (item_reader or item_batcher or result_writer):
+            raise ValueError(
+                "item_reader, item_batcher and result_writer require mode='DISTRIBUTED'."
+            )
+
+        if isinstance(item_processor, Branch):
+            self.item_processor = item_processor
+        else:
+            self.item_processor = Branch(head=item_processor)
+        self.items_path = items_path
+        self.item_selector = item_selector
+        self.max_concurrency = max_concurrency
+        self.mode = mode
+        self.item_reader = item_reader
+        self.item_batcher = item_batcher
+        self.result_writer = result_writer
+        if executor is None and mode == "DISTRIBUTED":
+            executor = "process"
+        self.executor = executor
+
+        if items_path:
+            self._content["ItemsPath"] = items_path
+
+        if item_reader:
+            self._content["ItemReader"] = item_reader.definition()
+
+        if item_selector:
+            self._content["ItemSelector"] = item_selector
+            self.item_selector_template = JSONPath().compile_template(item_selector)
+
+        if item_batcher:
+            self._content["ItemBatcher"] = item_batcher.definition()
+
+        processor_config = {"Mode": mode}
+        if mode == "DISTRIBUTED":
+            processor_config["ExecutionType"] = execution_type
+        self._content["ItemProcessor"] = {
+            "ProcessorConfig": processor_config,
+            **self.item_processor.definition,
+        }
+
+        if max_concurrency is not None:
+            self._content["MaxConcurrency"] = max_concurrency
+
+        if result_writer:
+            self._content["ResultWriter"] = result_writer.definition()
+
+    def _nested_branches(self) -> list[Branch]:
+        return [self.item_processor]
+
+    def _stamp(self) -> Any:
+        return (self._version, self.item_processor._stamp())
+
+    def _render(self) -> str:
+        processor_config = self._content["ItemProcessor"]["ProcessorConfig"]
+        item_processor = "".join(
+            self.item_processor.iter_json({"ProcessorConfig": processor_config})
+        )
+        return render_content(self._content, {"ItemProcessor": item_processor})
+
+    def _items(self, event: Any) -> Iterable[Any]:
+        if self.item_reader:
+            return self.item_reader.iter_items()
+        if self.items_path:
+            items = JSONPath.compile(self.items_path).apply(event)
+        else:
+            items = event
+        if not isinstance(items, list):
+            raise ValueError(
+                f"Map state {self.name} expects an array, "
+                f"got {type(items).__name__}."
+            )
+        return items
+
+    def _item_inputs(self, event: Any, context: Any) -> Iterator[Any]:
+        """Lazily yield the input of every child execution."""
+        items = self._items(event)
+        if self.item_selector:
+            items = (
+                self.item_selector_template.render(
+                    event, {"Map": {"Item": {"Index": index, "Value": item}}}
+                )
+                for index, item in enumerate(items)
+            )
+        if self.item_batcher:
+            return self.item_batcher.batches(items, event)
+        return iter(items)
+
+    def _output(self, results: Iterable[Any]) -> Any:
+        if self.result_writer:
+            return self.result_writer.write(results)
+        return list(results)
+
+    def iter_results(self, event: Any, context: Any) -> Iterator[Any]:
+        """
+        Run the item processor over the items and yield results in item order.
+        At most MaxConcurrency items are processed at once.
+        """
+        executor = get_executor(self.executor, self.max_concurrency)
+        run_item = partial(_run_branch, self.item_processor, context=context)
+        return executor.map(run_item, self._item_inputs(event, context))
+
+    def __call__(self, event, context, *args, **kwargs):
+        return self._output(self.iter_results(event, context))
+
+    async def acall(self, event, context):
+        item_inputs = self._item_inputs(event, context)
+        if not self.max_concurrency:
+            return self._output(
+                await gather_or_cancel(
+                    [self.item_processor.acall(item, context) for item in item_inputs]
+                )
+            )
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(item_input):
+            async with semaphore:
+                return await self.item_processor.acall(item_input, context)
+
+        return self._output(await gather_or_cancel([run(item) for item in item_inputs]))
+
+
 class Wait(Step):
     def __init__(
         self,
@@ -537,6 +1616,43 @@ class Wait(Step):
         if timestamp_path:
             self._content["TimestampPath"] = str(timestamp_path)
 
+    def delay(self, event: Any, now: float) -> float:
+        """Seconds to wait for the event, now being the wall-clock time."""
+        content = self._content
+        if "Seconds" in content:
+            seconds = content["Seconds"]
+        elif "SecondsPath" in content:
+            seconds = JSONPath.compile(content["SecondsPath"]).apply(event)
+        else:
+            timestamp = JSONPath.compile(content["TimestampPath"]).apply(event)
+            try:
+                when = datetime.fromisoformat(timestamp)
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"Wait {self.name} needs an ISO 8601 timestamp, got {timestamp!r}."
+                )
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            return max(0.0, when.timestamp() - now)
+
+        if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds < 0:
+            raise ValueError(
+                f"Wait {self.name} needs a non-negative number of seconds, got {seconds!r}."
+            )
+        return seconds
+
+    def wait(self, event: Any, clock: Clock) -> Any:
+        clock.sleep(self.delay(event, clock.time()), self.name)
+        return event
+
+    def __call__(self, event: Any, context: Any, *args, **kwargs):
+        return self.wait(event, get_clock())
+
+    async def acall(self, event: Any, context: Any) -> Any:
+        clock = get_clock()
+        await clock.asleep(self.delay(event, clock.time()), self.name)
+        return event
+
 
 class Pass(Step):
     def __init__(
@@ -544,7 +1660,7 @@ class Pass(Step):
         name: str,
         query_language: str | None = None,
         input_path: str | None = None,
-        result_path: str | None = None,
+        result_path: str | None = "$",
         output_path: str | None = None,
         result: Any | None = None,
         output: Any | None = None,
@@ -566,15 +1682,14 @@ class Pass(Step):
 
         if result:
             self._content["Result"] = result
+            self.result_template = JSONPath().compile_template(result)
 
         if output:
             self._content["Output"] = output
 
     def __call__(self, event: dict, context: Any, *args, **kwargs):
         if "Result" in self._content:
-            return JSONPath().process_payload_template(
-                self._content["Result"], event, context
-            )
+            return self.result_template.render(event, context)
         return event
 
 
@@ -614,7 +1729,7 @@ class StateMachine(Task):
         parameters=None,
         query_language=None,
         input_path=None,
-        result_path=None,
+        result_path="$",
         output_path=None,
         comment=None,
         **kwargs,
@@ -649,6 +1764,9 @@ class StateMachine(Task):
     def definition(self) -> dict:
         return self.sm_branch.definition
 
+    def dump(self, fp):
+        self.sm_branch.dump(fp)
+
 
 class StateMachineContext(ContextManager[StateMachine]):
     """Context manager specifically for StateMachine objects."""
@@ -665,7 +1783,7 @@ class LambdaFunction(Task):
         parameters: dict | None = None,
         query_language: str | None = None,
         input_path: str | None = None,
-        result_path: str | None = None,
+        result_path: str | None = "$",
         output_path: str | None = None,
         comment: str | None = None,
         timeout: int = 900,
@@ -711,8 +1829,54 @@ class LambdaFunction(Task):
     def output(self, path: str):
         return Ref(path)
 
+    def __getstate__(self):
+        # @lambda_task replaces the module attribute with this wrapper, so the
+        # function cannot be pickled by reference and is stored as its location
+        state = super().__getstate__()
+        location = (self.func.__module__, self.func.__qualname__)
+        if isinstance(_resolve(*location), LambdaFunction):
+            state["func"] = location
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state["func"], tuple):
+            state["func"] = _resolve(*state["func"]).func
+        self.__dict__.update(state)
+
     def __call__(self, event, context, *args, **kwargs):
-        return self.func(event, context, *args, **kwargs)
+        result = self.func(event, context, *args, **kwargs)
+        if inspect.iscoroutine(result):
+            # async handlers outside of Branch.acall get their own event loop,
+            # which cannot be started from a running one
+            if _running_loop():
+                result.close()
+                raise RuntimeError(
+                    f"The async handler of {self.name} cannot run synchronously in a "
+                    "running event loop, await Branch.acall instead."
+                )
+            return asyncio.run(result)
+        return result
+
+    async def acall(self, event, context, *args, **kwargs):
+        result = self.func(event, context, *args, **kwargs)
+        if inspect.isawaitable(result):
+            return await result
+        return result
+
+
+def _running_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _resolve(module_name: str, qualname: str) -> Any:
+    obj = sys.modules.get(module_name) or import_module(module_name)
+    for part in qualname.split("."):
+        obj = getattr(obj, part, None)
+    return obj
 
 
 class LambdaTaskContext(ContextManager[LambdaFunction]):
@@ -725,3 +1889,187 @@ def lambda_task(func: Callable, **kwargs) -> LambdaFunction:
     _lambda_function = LambdaFunction(func, **kwargs)
     LambdaTaskContext.push_context_obj(_lambda_function)
     return _lambda_function
+
+
+def test_retry_max_attempts_zero():
+    from airfunctions.clock import VirtualClock
+
+    calls = []
+
+    def flaky(event, context):
+        calls.append(event)
+        raise RuntimeError("failed")
+
+    task = LambdaFunction(flaky)
+    task.retry("States.ALL", interval_seconds=1, max_attempts=0)
+    assert task._content["Retry"][0]["MaxAttempts"] == 0
+    clock = VirtualClock()
+    executor = (Pass("start") >> task >> Pass("end")).compile(clock=clock)
+    try:
+        executor({"id": 1})
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("the error must not be retried")
+    assert len(calls) == 1 and sum(clock.waits.values()) == 0
+
+
+def test_result_path():
+    data = {"id": 1, "items": [1, 2], "meta": {"source": "api"}}
+    nested = _bind_result_path("$.meta.results.summary")
+    output = nested(data, 5)
+    assert output == {"id": 1, "items": [1, 2], "meta": {"source": "api", "results": {"summary": 5}}}
+    # the input is not mutated and subtrees off the path are shared
+    assert data == {"id": 1, "items": [1, 2], "meta": {"source": "api"}}
+    assert output["items"] is data["items"]
+    assert _bind_result_path("$") is None
+    assert _bind_result_path(None)(data, 5) is data
+
+    def count(event, context):
+        return len(event["items"])
+
+    def workflow(task):
+        return (Pass("start") >> task >> Pass("end")).compile()
+
+    assert workflow(LambdaFunction(count, result_path="$.stats.count"))(data) == {
+        **data, "stats": {"count": 2}
+    }
+    assert workflow(LambdaFunction(count, result_path="$"))(data) == 2
+    assert workflow(LambdaFunction(count))(data) == 2
+    # an explicit null ResultPath is deployed as null and discards the result
+    discard = Pass("start") >> LambdaFunction(count, result_path=None) >> Pass("end")
+    assert discard.definition["States"]["count"]["ResultPath"] is None
+    assert '"ResultPath": null' in discard.to_json()
+    assert discard.compile()(data) == data
+    default = Pass("start") >> LambdaFunction(count) >> Pass("end")
+    assert "ResultPath" not in default.definition["States"]["count"]
+    assert data == {"id": 1, "items": [1, 2], "meta": {"source": "api"}}
+
+
+def test_catch_routing():
+    from airfunctions.clock import VirtualClock
+
+    class Declined(Exception):
+        pass
+
+    calls = []
+
+    def charge(event, context):
+        calls.append(event)
+        if event["amount"] > 100:
+            raise Declined(f"amount {event['amount']} too high")
+        if event["amount"] < 0:
+            raise KeyError("negative")
+        if event["amount"] == 0:
+            raise ValueError("empty")
+        return {"charged": event["amount"]}
+
+    task = LambdaFunction(charge)
+    task.retry(Declined, interval_seconds=1, max_attempts=2)
+    # the first matching catcher wins, States.ALL comes last and takes the rest
+    task.catch(Declined, Pass("declined"), result_path="$.error")
+    task.catch("States.ALL", Pass("failed", result={"failed": True}))
+    clock = VirtualClock()
+    executor = (Pass("start") >> task >> Pass("end")).compile(clock=clock)
+
+    # the error left after the retries continues at the Catch state
+    assert executor({"amount": 500}) == {
+        "amount": 500,
+        "error": {"Error": "Declined", "Cause": "amount 500 too high"},
+    }
+    assert len(calls) == 3 and clock.waits["charge"] == 2
+    assert executor({"amount": -1}) == {"failed": True}
+    assert executor({"amount": 10}) == {"charged": 10}
+
+    # no matching catcher, the error fails the execution
+    task = LambdaFunction(charge)
+    task.catch(Declined, Pass("declined"))
+    executor = (Pass("start") >> task >> Pass("end")).compile()
+    try:
+        executor({"amount": 0})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("the error must not be caught")
+    assert executor({"amount": 500}) == {"Error": "Declined", "Cause": "amount 500 too high"}
+
+
+def test_acall_matches_call():
+    from airfunctions.clock import VirtualClock
+    from airfunctions.tracing import Tracer
+
+    class Flaky(Exception):
+        pass
+
+    attempts = {}
+
+    async def settle(event, context):
+        attempts[event["id"]] = attempts.get(event["id"], 0) + 1
+        await asyncio.sleep(0)
+        if event["id"] == 0 or attempts[event["id"]] < 3:
+            raise Flaky(f"order {event['id']}")
+        return {"settled": event["id"]}
+
+    task = LambdaFunction(settle, result_path="$.result")
+    task.retry(Flaky, interval_seconds=1, max_attempts=2)
+    task.catch("States.ALL", Pass("failed"), result_path="$.error")
+    branch = Pass("start") >> task >> Pass("end")
+    events = [{"id": 0}, {"id": 1}]
+
+    async def arun(executor, tracer):
+        return [await executor.acall(event, None, tracer) for event in events]
+
+    runs = []
+    for asynchronous in (False, True):
+        attempts.clear()
+        clock = VirtualClock()
+        executor = branch.compile(clock=clock)
+        with Tracer() as tracer:
+            if asynchronous:
+                outputs = asyncio.run(arun(executor, tracer))
+            else:
+                outputs = [executor.trace(event, None, tracer) for event in events]
+        runs.append((outputs, dict(clock.waits), [span.state for span in tracer.spans]))
+    # retries and catchers are decided alike and the states are traced alike
+    assert runs[0] == runs[1]
+    outputs, waits, states = runs[1]
+    assert outputs == [
+        {"id": 0, "error": {"Error": "Flaky", "Cause": "order 0"}},
+        {"id": 1, "result": {"settled": 1}},
+    ]
+    assert waits == {"settle": 4}
+    assert states == ["start", "settle", "failed", "start", "settle", "end"]
+
+    # Branch.acall records on the active tracer
+    attempts.clear()
+    with Tracer() as tracer:
+        assert asyncio.run(branch.acall({"id": 0}, None))["error"]["Error"] == "Flaky"
+    assert [span.state for span in tracer.spans] == ["start", "settle", "failed"]
+
+
+def test_async_handler_in_running_loop():
+    async def fetch(event, context):
+        return {"fetched": event["id"]}
+
+    branch = Pass("start") >> LambdaFunction(fetch) >> Pass("end")
+    assert branch({"id": 1}, None) == {"fetched": 1}
+
+    async def main():
+        try:
+            branch({"id": 1}, None)
+        except RuntimeError as error:
+            assert "Branch.acall" in str(error)
+        else:
+            raise AssertionError("a sync run in a running loop must fail clearly")
+        return await branch.acall({"id": 2}, None)
+
+    assert asyncio.run(main()) == {"fetched": 2}
+
+
+if __name__ == "__main__":
+    test_retry_max_attempts_zero()
+    test_result_path()
+    test_catch_routing()
+    test_acall_matches_call()
+    test_async_handler_in_running_loop()
+    print("All tests passed!")
@@ -0,0 +1,341 @@
+import json
+import os
+import threading
+import time
+from threading import get_ident
+from typing import IO, Any, NamedTuple
+
+from airfunctions.errors import error_name
+
+# tracer recording the runs of branches, see Tracer
+_active: "Tracer | None" = None
+
+PHASES = ("total", "input", "handler", "output")
+
+
+def active_tracer() -> "Tracer | None":
+    return _active
+
+
+class Histogram:
+    """
+    HDR-style histogram of non-negative integer values (nanoseconds).
+    Values below 2**precision are counted exactly, larger ones in log-linear buckets
+    of 2**precision sub-buckets per power of two, so recorded values keep a relative
+    error below 2**-precision whatever their magnitude.
+    """
+
+    def __init__(self, precision: int = 7):
+        self.precision = precision
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min: int | None = None
+        self.max: int | None = None
+
+    def _bucket(self, value: int) -> int:
+        precision = self.precision
+        shift = value.bit_length() - 1 - precision
+        if shift < 0:
+            return value
+        return ((shift + 1) << precision) + (value >> shift) - (1 << precision)
+
+    def _value(self, bucket: int) -> int:
+        """Middle of the values counted in bucket."""
+        precision = self.precision
+        shift = (bucket >> precision) - 1
+        if shift < 0:
+            return bucket
+        mantissa = (bucket & ((1 << precision) - 1)) + (1 << precision)
+        return (mantissa << shift) + ((1 << shift) >> 1)
+
+    def record(self, value: int):
+        value = max(0, int(value))
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def record_many(self, values: list[int]):
+        if not values:
+            return
+        counts = self.counts
+        precision = self.precision
+        offset = 1 << precision
+        for value in values:
+            shift = value.bit_length() - 1 - precision
+            bucket = value if shift < 0 else ((shift + 1) << precision) + (value >> shift) - offset
+            counts[bucket] = counts.get(bucket, 0) + 1
+        self.count += len(values)
+        self.total += sum(values)
+        low, high = min(values), max(values)
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other: "Histogram"):
+        if other.precision != self.precision:
+            raise ValueError("Histograms of different precision cannot be merged.")
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent: float) -> int:
+        """Value below which percent of the recorded values fall."""
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(max(self._value(bucket), self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "min": self.min or 0,
+            "mean": round(self.mean),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "max": self.max or 0,
+        }
+
+    def __repr__(self):
+        return f"Histogram(count={self.count}, p50={self.percentile(50)}, max={self.max})"
+
+
+class Span(NamedTuple):
+    """One run of a state, with perf_counter_ns timestamps of its phases."""
+
+    branch: str
+    state: str
+    start: int
+    input_end: int
+    handler_end: int
+    end: int
+    input_size: int | None
+    output_size: int | None
+    error: str | None
+    thread: int
+
+    def durations(self) -> tuple[int, int, int, int]:
+        """Nanoseconds spent in total, in input processing, in the handler and in output processing."""
+        return (
+            self.end - self.start,
+            self.input_end - self.start,
+            self.handler_end - self.input_end,
+            self.end - self.handler_end,
+        )
+
+
+# builds a Span from a tuple without going through the generated __new__
+_new_span = tuple.__new__
+
+
+def _size(value: Any) -> int:
+    return len(json.dumps(value, default=str))
+
+
+class Tracer:
+    """
+    Records every state run by Branch calls while active (used as a context manager
+    or between start and stop): enter and exit timestamps, the time spent in input
+    processing, the handler and output processing, and input and output sizes as
+    JSON text (sizes=False skips serializing the data). Durations are aggregated
+    into histograms per state and phase. Runs of nested Parallel and Map branches
+    in threads are recorded too, runs in other processes and acall are not.
+    """
+
+    # spans recorded before they are aggregated into the histograms
+    FOLD_EVERY = 4096
+
+    def __init__(self, sizes: bool = True, keep_spans: bool = True):
+        self.sizes = sizes
+        self.keep_spans = keep_spans
+        self.spans: list[Span] = []
+        self._histograms: dict[tuple[str, str], Histogram] = {}
+        self._pending: list[Span] = []
+        self.started_at = time.perf_counter_ns()
+        self._previous: list[Tracer | None] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> "Tracer":
+        global _active
+        self._previous.append(_active)
+        _active = self
+        return self
+
+    def stop(self):
+        global _active
+        _active = self._previous.pop()
+
+    def __enter__(self) -> "Tracer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def record(
+        self,
+        branch: str,
+        state: str,
+        start: int,
+        input_end: int,
+        handler_end: int,
+        end: int,
+        input_data: Any = None,
+        output_data: Any = None,
+        error: BaseException | None = None,
+    ):
+        span = _new_span(
+            Span,
+            (
+                branch,
+                state,
+                start,
+                input_end,
+                handler_end,
+                end,
+                _size(input_data) if self.sizes else None,
+                _size(output_data) if self.sizes and error is None else None,
+                error_name(error) if error is not None else None,
+                get_ident(),
+            ),
+        )
+        with self._lock:
+            if self.keep_spans:
+                self.spans.append(span)
+            self._pending.append(span)
+            if len(self._pending) >= self.FOLD_EVERY:
+                self._fold()
+
+    def _fold(self):
+        durations: dict[str, list[list[int]]] = {}
+        for _, state, start, input_end, handler_end, end, *_ in self._pending:
+            lists = durations.get(state)
+            if lists is None:
+                lists = durations[state] = [[], [], [], []]
+            lists[0].append(end - start)
+            lists[1].append(input_end - start)
+            lists[2].append(handler_end - input_end)
+            lists[3].append(end - handler_end)
+        self._pending = []
+
+        histograms = self._histograms
+        for state, lists in durations.items():
+            for phase, values in zip(PHASES, lists):
+                key = (state, phase)
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = Histogram()
+                histogram.record_many(values)
+
+    @property
+    def histograms(self) -> dict[tuple[str, str], Histogram]:
+        """Histograms of durations in nanoseconds per (state, phase)."""
+        with self._lock:
+            self._fold()
+            return self._histograms
+
+    def histogram(self, state: str, phase: str = "total") -> Histogram:
+        return self.histograms.get((state, phase)) or Histogram()
+
+    def summary(self) -> dict:
+        """Latency percentiles in nanoseconds per state and phase."""
+        states: dict[str, dict] = {}
+        for (state, phase), histogram in self.histograms.items():
+            states.setdefault(state, {})[phase] = histogram.summary()
+        return states
+
+    def to_json(self) -> dict:
+        return {
+            "unit": "ns",
+            "states": self.summary(),
+            "spans": [
+                {
+                    "branch": span.branch,
+                    "state": span.state,
+                    "start": span.start - self.started_at,
+                    "end": span.end - self.started_at,
+                    "input": span.input_end - span.start,
+                    "handler": span.handler_end - span.input_end,
+                    "output": span.end - span.handler_end,
+                    "input_size": span.input_size,
+                    "output_size": span.output_size,
+                    "error": span.error,
+                }
+                for span in self.spans
+            ],
+        }
+
+    def to_chrome_trace(self) -> dict:
+        """
+        The spans as Chrome trace events (chrome://tracing, Perfetto), a complete
+        event per state with its phases nested inside.
+        """
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            start = (span.start - self.started_at) / 1000
+            args = {
+                "branch": span.branch,
+                "input_size": span.input_size,
+                "output_size": span.output_size,
+            }
+            if span.error is not None:
+                args["error"] = span.error
+            events.append(
+                {
+                    "name": span.state,
+                    "cat": "state",
+                    "ph": "X",
+                    "ts": start,
+                    "dur": (span.end - span.start) / 1000,
+                    "pid": pid,
+                    "tid": span.thread,
+                    "args": args,
+                }
+            )
+            phases = (
+                ("input", span.start, span.input_end),
+                ("handler", span.input_end, span.handler_end),
+                ("output", span.handler_end, span.end),
+            )
+            for name, begin, end in phases:
+                events.append(
+                    {
+                        "name": name,
+                        "cat": "phase",
+                        "ph": "X",
+                        "ts": (begin - self.started_at) / 1000,
+                        "dur": (end - begin) / 1000,
+                        "pid": pid,
+                        "tid": span.thread,
+                    }
+                )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump_json(self, fp: IO[str]):
+        json.dump(self.to_json(), fp)
+
+    def dump_chrome_trace(self, fp: IO[str]):
+        json.dump(self.to_chrome_trace(), fp)
+
+    def __repr__(self):
+        return f"Tracer(spans={len(self.spans)}, states={len(self.summary())})"
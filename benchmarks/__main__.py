@@ -0,0 +1,74 @@
+"""
+Run the benchmark suite, store the results as a baseline and compare runs.
+
+    python -m benchmarks run [pattern ...] [--repeat N] [--save results.json]
+    python -m benchmarks run --compare baseline.json [--threshold 0.1]
+    python -m benchmarks compare baseline.json results.json
+    python -m benchmarks list
+
+Comparing exits with status 1 when a scenario regressed by more than the threshold.
+"""
+import argparse
+import sys
+
+from benchmarks import scenarios  # noqa: F401, registers the scenarios
+from benchmarks.suite import (SCENARIOS, compare, format_time, load,
+                              print_comparison, run, save)
+
+
+def report(name: str, result: dict):
+    print(
+        f"{name:<32} {format_time(result['min']):>10} "
+        f"{format_time(result['median']):>10} ±{format_time(result['stdev'])}",
+        flush=True,
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run scenarios")
+    run_parser.add_argument("patterns", nargs="*", help="glob patterns of scenario names")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--save", metavar="PATH", help="store the results as JSON")
+    run_parser.add_argument("--compare", metavar="PATH", help="compare with a baseline")
+    run_parser.add_argument("--threshold", type=float, default=0.10)
+
+    compare_parser = commands.add_parser("compare", help="compare two stored results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    commands.add_parser("list", help="list scenarios")
+
+    args = parser.parse_args(argv)
+    if args.command == "list":
+        for name in SCENARIOS:
+            print(name)
+        return 0
+
+    if args.command == "compare":
+        baseline, current = load(args.baseline), load(args.current)
+    else:
+        print(f"{'scenario':<32} {'min':>10} {'median':>10}")
+        current = run(args.patterns, args.repeat, report)
+        for name, reason in current["skipped"].items():
+            print(f"{name:<32} skipped: {reason}")
+        if args.save:
+            save(current, args.save)
+        if not args.compare:
+            return 0
+        baseline = load(args.compare)
+
+    comparisons = compare(baseline, current, args.threshold)
+    print()
+    for label, document in (("baseline", baseline), ("current", current)):
+        env = document["environment"]
+        print(f"{label}: {env['commit']} python {env['python']} on {env['platform']}, {env['date']}")
+    print_comparison(comparisons)
+    return 1 if any(c.status == "regressed" for c in comparisons) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
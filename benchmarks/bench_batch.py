@@ -0,0 +1,42 @@
+"""
+Throughput of replaying events with Branch.run_batch for a growing number of
+worker processes, with a CPU-bound handler and a share of failing events.
+
+Run with: python -m benchmarks.bench_batch [events] [workers ...]
+"""
+import os
+import sys
+
+from airfunctions.steps import Pass, lambda_task
+
+
+@lambda_task
+def score(event, context):
+    if event["id"] % 100 == 0:
+        raise ValueError(f"event {event['id']} rejected")
+    total = 0
+    for i in range(event["work"]):
+        total += i * i % 7
+    return {"id": event["id"], "score": total}
+
+
+workflow = Pass("start", result={"id.$": "$.id", "work.$": "$.work"}) >> score
+
+
+def main(count: int, workers: list[int]):
+    print(f"{'workers':>7} {'events':>8} {'failed':>7} {'elapsed':>9} {'throughput':>12}")
+    for worker_count in workers:
+        events = ({"id": i, "work": 500} for i in range(count))
+        run = workflow.run_batch(events, workers=worker_count, chunk_size=200)
+        for _ in run:
+            pass
+        print(
+            f"{worker_count:>7} {run.completed:>8} {run.failed:>7} "
+            f"{run.elapsed:>8.2f}s {run.throughput:>10.0f}/s"
+        )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    workers = [int(arg) for arg in sys.argv[2:]] or sorted({1, 2, os.cpu_count() or 1})
+    main(count, workers)
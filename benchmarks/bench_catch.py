@@ -0,0 +1,49 @@
+"""
+Error routing throughput: a Task fails a share of its events with one of many error
+types and Catch blocks send each error to its own handler state. Routing looks the
+error name up once, so it should not slow down as catchers are added.
+
+Run with: python -m benchmarks.bench_catch [events] [catchers ...]
+"""
+import sys
+import time
+
+from airfunctions.steps import Pass, lambda_task
+
+FAILURE_RATES = (0.0, 0.5, 1.0)
+
+
+def build(catchers: int, failure_rate: float):
+    errors = [type(f"Error{i}", (Exception,), {}) for i in range(catchers)]
+    cutoff = int(failure_rate * 100)
+
+    @lambda_task
+    def process(event, context):
+        if event["id"] % 100 < cutoff:
+            # fail with the error caught last, the worst case for a linear scan
+            raise errors[-1](f"event {event['id']}")
+        return event
+
+    for i, error in enumerate(errors):
+        process.catch(error, Pass(f"handle_{i}"), result_path="$.error")
+    return Pass("start") >> process >> Pass("done")
+
+
+def main(count: int, catchers: list[int]):
+    header = " ".join(f"{f'{rate:.0%} failing':>13}" for rate in FAILURE_RATES)
+    print(f"{'catchers':>8} {header}")
+    for catcher_count in catchers:
+        row = []
+        for rate in FAILURE_RATES:
+            executor = build(catcher_count, rate).compile()
+            events = [{"id": i} for i in range(count)]
+            start = time.perf_counter()
+            executor.run_many(events)
+            row.append(f"{count / (time.perf_counter() - start):>11.0f}/s")
+        print(f"{catcher_count:>8} {' '.join(row)}")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    catchers = [int(arg) for arg in sys.argv[2:]] or [1, 10, 100, 1000]
+    main(count, catchers)
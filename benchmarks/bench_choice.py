@@ -0,0 +1,165 @@
+"""
+Choice rules evaluated as local runs evaluate them, on the deployed JSONata
+Condition: by the general JSONata engine and by the generated function of
+compile_rules, per condition over a stream of events, and for a choice-heavy
+workflow run through Branch calls. Routing Choice states of equality rules on
+one field are timed testing their rules in order against the dispatch table of
+Choice.dispatch, and rules repeating their checks as written against the
+optimized conditions and shared subexpressions of Choice.router.
+
+Run with: python -m benchmarks.bench_choice [events]
+"""
+import random
+import sys
+import time
+
+from airfunctions.conditions import Ref, dispatcher
+from airfunctions.jsonata import compile, compile_condition, compile_rules, unwrap
+from airfunctions.steps import Branch, Choice, Pass
+
+CONDITIONS = {
+    "eq": Ref("tier") == "gold",
+    "nested": Ref("order.total") > 100,
+    "and": (Ref("tier") == "gold") & (Ref("order.total") > 100),
+    "or-chain": (Ref("country") == "PL") | (Ref("country") == "DE") | (Ref("country") == "FR"),
+    "not": ~(Ref("order.items") < 3),
+}
+
+
+def events(count: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "tier": rng.choice(["gold", "silver", "bronze"]),
+            "country": rng.choice(["PL", "DE", "FR", "US", "JP"]),
+            "order": {"total": rng.randint(1, 200), "items": rng.randint(1, 6)},
+        }
+        for _ in range(count)
+    ]
+
+
+def rate(func, data: list) -> float:
+    start = time.perf_counter()
+    for event in data:
+        func(event, None)
+    return len(data) / (time.perf_counter() - start)
+
+
+def workflow(choices: int = 10, rules: int = 8) -> Branch:
+    """Choice states in a row, every rule of one joining before the next."""
+    branch = Pass("start") >> Pass("prepare")
+    for i in range(choices):
+        route = Choice(f"route_{i}", default=Pass(f"other_{i}"))
+        for j in range(rules - 1):
+            route.choose(Ref("order.total") == j * 10 + i, Pass(f"exact_{i}_{j}"))
+        route.choose(
+            (Ref("tier") == "gold") & (Ref("order.total") > 100), Pass(f"gold_{i}")
+        )
+        branch = branch >> route >> Pass(f"join_{i}")
+    return branch
+
+
+def routing(rules: int) -> Choice:
+    """Choice routing on the country field, the last rule an or of two countries."""
+    route = Choice(f"route_{rules}", default=Pass("unknown"))
+    for i in range(rules - 1):
+        route.choose(Ref("country") == f"C{i}", Pass(f"to_{i}"))
+    route.choose((Ref("country") == "PL") | (Ref("country") == "DE"), Pass("europe"))
+    return route
+
+
+def redundant(rules: int) -> list:
+    """
+    Conditions repeating the same checks, written as they often are: the costly
+    comparison of two fields first and the tier check spelled twice.
+    """
+    gold = Ref("tier") == "gold"
+    return [
+        (Ref("order.total") == Ref("order.items")) | (gold & gold & (Ref("country") == f"C{i}"))
+        for i in range(rules)
+    ]
+
+
+def countries(count: int, rules: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    names = [f"C{i}" for i in range(rules)] + ["PL", "DE", "US"]
+    return [{"country": rng.choice(names)} for _ in range(count)]
+
+
+def ordered(route: Choice):
+    rules = route.rules
+    default = route.default
+
+    def choose(event, context):
+        for evaluate, target in rules:
+            if evaluate(event, context):
+                return target
+        return default
+
+    return choose
+
+
+def main(count: int):
+    data = events(count)
+    print(f"{'condition':>10} {'engine':>12} {'generated':>12} {'speedup':>8}")
+    for name, condition in CONDITIONS.items():
+        expression = compile(unwrap(condition.jsonata()))
+
+        def engine(event, context):
+            return expression.evaluate(event, {"states": {"input": event, "context": {}}})
+
+        generated = compile_rules([(condition.jsonata(), True)], False)
+        assert all(engine(e, None) is generated(e, None) for e in data[:1000])
+        interpreted = rate(engine, data)
+        compiled = rate(generated, data)
+        print(
+            f"{name:>10} {interpreted:>10.0f}/s {compiled:>10.0f}/s "
+            f"{compiled / interpreted:>7.2f}x"
+        )
+
+    branch = workflow()
+    sample = data[: max(1, count // 10)]
+    print(f"\nworkflow of 10 Choice states x 8 rules: {rate(branch, sample):.0f} events/s")
+
+    print(f"\n{'rules':>10} {'in order':>12} {'dispatch':>12} {'speedup':>8}")
+    for rules in (10, 50, 200):
+        route = routing(rules)
+        scan = ordered(route)
+        table = dispatcher(*route.dispatch, route.default)
+        inputs = countries(count, rules)
+        assert all(scan(e, None) == table(e, None) for e in inputs[:1000])
+        linear = rate(scan, inputs)
+        hashed = rate(table, inputs)
+        print(f"{rules:>10} {linear:>10.0f}/s {hashed:>10.0f}/s {hashed / linear:>7.2f}x")
+
+    print(f"\n{'rules':>10} {'as written':>12} {'optimized':>12} {'speedup':>8} {'JSONata chars':>16}")
+    for rules in (8, 32):
+        conditions = redundant(rules)
+        route = Choice(f"redundant_{rules}", default=Pass("standard"))
+        for i, condition in enumerate(conditions):
+            route.choose(condition, Pass(f"priority_{i}"))
+        written = [
+            (compile_condition(condition.jsonata(top=False)), f"priority_{i}")
+            for i, condition in enumerate(conditions)
+        ]
+        inputs = [dict(e, country=f"C{i % (rules * 2)}") for i, e in enumerate(data)]
+
+        def scan(event, context):
+            for evaluate, target in written:
+                if evaluate(event, context):
+                    return target
+            return route.default
+
+        assert all(scan(e, None) == route.router(e, None) for e in inputs[:1000])
+        before = sum(len(condition.jsonata(top=False)) for condition in conditions)
+        after = sum(len(condition.jsonata()) - 6 for condition in conditions)
+        linear = rate(scan, inputs)
+        optimized = rate(route.router, inputs)
+        print(
+            f"{rules:>10} {linear:>10.0f}/s {optimized:>10.0f}/s {optimized / linear:>7.2f}x "
+            f"{before:>7} -> {after:<6}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
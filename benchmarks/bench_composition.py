@@ -0,0 +1,96 @@
+"""
+Benchmark of building workflows with the >> operator: long chains, Parallel
+fan-outs and Choice fan-outs, reporting build time, peak allocated memory and the
+scaling exponent between sizes (1.0 is linear, 2.0 quadratic).
+
+Run with: python -m benchmarks.bench_composition [size ...]
+"""
+import math
+import sys
+import time
+import tracemalloc
+
+from airfunctions.conditions import Ref
+from airfunctions.steps import Choice, Pass
+
+
+def build_chain(size: int):
+    branch = Pass("step_0") >> Pass("step_1")
+    for i in range(2, size):
+        branch = branch >> Pass(f"step_{i}")
+    return branch
+
+
+def build_wired(size: int):
+    # appends in place through the last step, as in branch["step"] >> Pass(...)
+    branch = Pass("step_0") >> Pass("step_1")
+    for i in range(2, size):
+        branch = branch[f"step_{i - 1}"] >> Pass(f"step_{i}")
+    return branch
+
+
+def build_choice_chain(size: int):
+    # every third step fans out, so the following step is wired to several ends
+    branch = Pass("step_0") >> Pass("step_1")
+    for i in range(2, size):
+        if i % 3:
+            branch = branch >> Pass(f"step_{i}")
+        else:
+            choice = Choice(f"step_{i}", default=Pass(f"default_{i}"))
+            choice.choose(Ref("value") == i, Pass(f"route_{i}"))
+            branch = branch >> choice
+    return branch
+
+
+def build_parallel(size: int):
+    return Pass("start") >> [Pass(f"branch_{i}") for i in range(size)] >> Pass("end")
+
+
+def build_choice(size: int):
+    choice = Choice("route", default=Pass("default"))
+    for i in range(size):
+        choice.choose(Ref("value") == i, Pass(f"route_{i}"))
+    return Pass("start") >> choice
+
+
+SHAPES = {
+    "chain": build_chain,
+    "wired": build_wired,
+    "choices": build_choice_chain,
+    "parallel": build_parallel,
+    "choice": build_choice,
+}
+
+
+def measure(build, size: int) -> tuple[float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    build(size)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(sizes: list[int]):
+    print(
+        f"{'shape':<10} {'size':>7} {'total':>10} {'per step':>10} "
+        f"{'peak mem':>10} {'exponent':>9}"
+    )
+    for name, build in SHAPES.items():
+        previous = None
+        for size in sizes:
+            elapsed, peak = measure(build, size)
+            exponent = "-"
+            if previous and size > previous[0]:
+                growth = math.log(elapsed / previous[1]) / math.log(size / previous[0])
+                exponent = f"{growth:.2f}"
+            previous = (size, elapsed)
+            print(
+                f"{name:<10} {size:>7} {elapsed * 1e3:>8.1f}ms "
+                f"{elapsed / size * 1e6:>8.1f}us {peak / 2**20:>8.1f}MB {exponent:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1_000, 10_000])
@@ -0,0 +1,67 @@
+"""
+Benchmark of rendering large ASL definitions: a full json.dumps of the definition
+against the cached per-state serialization, before and after a single change, and
+streaming to disk with Branch.dump.
+
+Run with: python -m benchmarks.bench_definition [size ...]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from airfunctions.steps import Map, Pass, parallel
+
+
+def build(size: int):
+    # a chain with a Parallel and a Map every 100 states, each embedding a branch
+    branch = Pass("step_0", result={"index": 0}) >> Pass("step_1")
+    for i in range(2, size):
+        if i % 100 == 0:
+            inner = Pass(f"inner_{i}_a") >> Pass(f"inner_{i}_b")
+            branch = branch >> parallel(Pass(f"left_{i}"), inner)
+        elif i % 100 == 50:
+            branch = branch >> Map(f"map_{i}", item_processor=Pass(f"item_{i}"))
+        else:
+            branch = branch >> Pass(f"step_{i}", result={"index": i})
+    return branch
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(sizes: list[int]):
+    print(
+        f"{'size':>7} {'json.dumps':>11} {'first':>9} {'cached':>9} "
+        f"{'changed':>9} {'dump':>9} {'dump mem':>9}"
+    )
+    for size in sizes:
+        branch = build(size)
+        full = timed(lambda: json.dumps(branch.definition))
+        first = timed(branch.to_json)
+        cached = timed(branch.to_json)
+        branch[branch.head.name].retry("States.ALL", 1, 3)
+        changed = timed(branch.to_json)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "definition.json")
+            tracemalloc.start()
+            with open(path, "w") as f:
+                dumped = timed(lambda: branch.dump(f))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        print(
+            f"{size:>7} {full * 1e3:>9.1f}ms {first * 1e3:>7.1f}ms "
+            f"{cached * 1e3:>7.1f}ms {changed * 1e3:>7.1f}ms "
+            f"{dumped * 1e3:>7.1f}ms {peak / 2**10:>7.0f}KB"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000])
@@ -0,0 +1,61 @@
+"""
+Benchmark of JSONPath filter expressions over long arrays of homogeneous dicts.
+
+Run with: python -m benchmarks.bench_filters [size ...]
+"""
+import random
+import sys
+import time
+
+from airfunctions.jsonpath import JSONPath, JSONPathFilter
+
+FILTERS = [
+    "@.price < 50",
+    "@.category == 'books'",
+    "@.category == 'books' && @.price >= 90",
+    "@.price < 5 || @.category == 'toys'",
+]
+
+
+def make_items(size: int) -> list[dict]:
+    rng = random.Random(size)
+    categories = ["books", "toys", "garden", "music"]
+    return [
+        {"id": i, "price": rng.random() * 100, "category": rng.choice(categories)}
+        for i in range(size)
+    ]
+
+
+def best_of(func, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(sizes: list[int]):
+    print(f"{'filter':<40} {'size':>9} {'per item':>10} {'batched':>10} {'apply':>10}")
+    for size in sizes:
+        items = make_items(size)
+        data = {"items": items}
+        for expression in FILTERS:
+            compiled = JSONPathFilter(expression)
+            path = f"$.items[?({expression})]"
+            JSONPath.compile(path)
+
+            per_item = best_of(lambda: list(filter(compiled.predicate, items)))
+            if compiled.batch is not None:
+                batched = f"{best_of(lambda: compiled.batch(items)) * 1e3:.1f}ms"
+            else:
+                batched = "-"
+            applied = best_of(lambda: JSONPath.compile(path).find(data))
+            print(
+                f"{expression:<40} {size:>9} {per_item * 1e3:>8.1f}ms "
+                f"{batched:>10} {applied * 1e3:>8.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,79 @@
+"""
+Throughput of local executions in events per second: a reference interpreter
+resolving states by name on every transition against the compiled executor
+returned by Branch.compile().
+
+Run with: python -m benchmarks.bench_interpreter [events]
+"""
+import sys
+import time
+
+from airfunctions.conditions import Ref
+from airfunctions.steps import Branch, Choice, Pass, lambda_task
+
+
+@lambda_task
+def enrich(event, context):
+    return {**event, "enriched": True}
+
+
+def build(length: int = 20) -> Branch:
+    branch = Pass("start", result={"id.$": "$.id", "size.$": "$.size"}) >> enrich
+    for i in range(length):
+        if i % 2:
+            branch = branch >> Pass(f"pass_{i}", input_path="$", output_path="$")
+        else:
+            branch = branch >> Pass(
+                f"pass_{i}", result={"id.$": "$.id", "size.$": "$.size", "step": i}
+            )
+    route = Choice("route", default=Pass("small")).choose(
+        Ref("size") > 10, Pass("large")
+    )
+    return branch >> route
+
+
+def interpret(branch: Branch, event, context=None):
+    """Walk the branch resolving every transition by name, as before compiling."""
+    curr = branch.head
+    data = event
+    while True:
+        raw = data
+        data = curr._parse_input(data)
+        if isinstance(curr, Choice):
+            target = curr.default
+            for condition, name in curr.rules:
+                if condition(data, context):
+                    target = name
+                    break
+            curr = branch.steps[target]
+            continue
+        data = curr._parse_output(curr(data, context), raw)
+        if curr.end:
+            return data
+        curr = branch.steps[curr.next]
+
+
+def events_per_second(func, events: list) -> float:
+    start = time.perf_counter()
+    func(events)
+    return len(events) / (time.perf_counter() - start)
+
+
+def main(count: int):
+    branch = build()
+    events = [{"id": i, "size": i % 20} for i in range(count)]
+    compiled = branch.compile()
+
+    assert compiled.run_many(events[:100]) == [interpret(branch, e) for e in events[:100]]
+
+    reference = events_per_second(lambda evs: [interpret(branch, e) for e in evs], events)
+    fast = events_per_second(compiled.run_many, events)
+    print(f"{'states':>7} {'events':>8} {'by name':>12} {'compiled':>12} {'speedup':>8}")
+    print(
+        f"{len(compiled.names):>7} {count:>8} {reference:>10.0f}/s "
+        f"{fast:>10.0f}/s {fast / reference:>7.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,62 @@
+"""
+Benchmark of intrinsic function evaluation with and without the AST cache.
+
+Run with: python -m benchmarks.bench_intrinsics
+"""
+import timeit
+
+from airfunctions.jsonpath import PayloadTemplateProcessor, parse_intrinsic
+
+INPUT = {
+    "name": "World",
+    "order": {"id": "o-123", "items": [{"sku": "a", "qty": 2}, {"sku": "b", "qty": 1}]},
+    "payload": '{"key": "value", "nested": {"n": 1}}',
+    "csv": "a,b,c,d,e,f",
+    "numbers": list(range(50)),
+    "left": {"a": 1, "b": {"c": 2}},
+    "right": {"b": {"d": 3}},
+}
+CONTEXT = {"Execution": {"Id": "arn:exec:1", "StartTime": "2025-01-01T00:00:00Z"}}
+
+CORPUS = [
+    "States.Format('Hello, {}!', $.name)",
+    "States.Format('Order {} started by {} at {}', $.order.id, $$.Execution.Id, $$.Execution.StartTime)",
+    "States.StringToJson($.payload)",
+    "States.JsonToString($.order)",
+    "States.Array($.name, $.order.id, 1, true, null)",
+    "States.ArrayPartition($.numbers, 10)",
+    "States.ArrayContains($.numbers, 42)",
+    "States.ArrayGetItem($.order.items, 1)",
+    "States.ArrayLength($.order.items)",
+    "States.Hash($.order, 'SHA-256')",
+    "States.JsonMerge($.left, $.right, false)",
+    "States.MathAdd(States.ArrayLength($.numbers), -1)",
+    "States.StringSplit($.csv, ',')",
+    "States.Array(States.Format('{}-{}', $.order.id, $.name), States.ArrayLength($.numbers))",
+]
+
+
+def main():
+    number = 2_000
+    processor = PayloadTemplateProcessor()
+    functions = processor.intrinsic_functions
+
+    def uncached():
+        for expression in CORPUS:
+            parse_intrinsic(expression).evaluate(INPUT, CONTEXT, functions)
+
+    def cached():
+        for expression in CORPUS:
+            processor.evaluate_intrinsic_function(expression, INPUT, CONTEXT)
+
+    parse = min(timeit.repeat(uncached, number=number, repeat=5)) / number
+    reuse = min(timeit.repeat(cached, number=number, repeat=5)) / number
+    per_call = len(CORPUS)
+    print(f"corpus of {per_call} expressions")
+    print(f"parse every call: {parse / per_call * 1e6:8.2f}us per expression")
+    print(f"cached AST:       {reuse / per_call * 1e6:8.2f}us per expression")
+    print(f"speedup:          {parse / reuse:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
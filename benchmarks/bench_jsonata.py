@@ -0,0 +1,50 @@
+"""
+The JSONata engine against compiled JSONPath on the same selections, and the
+Arguments of a JSONata state against the Parameters template of a JSONPath state.
+
+Run with: python -m benchmarks.bench_jsonata [items]
+"""
+import sys
+import timeit
+
+from airfunctions.jsonata import JSONataTemplate, compile
+from airfunctions.jsonpath import JSONPath
+from benchmarks.scenarios import (ARGUMENTS, EXPRESSIONS, PATHS, TEMPLATE,
+                                  corpus, payload)
+
+
+def per_call(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def main(items: int):
+    data = payload(items)
+    number = 20_000 if items <= 10 else 200
+    print(f"{'selection':<10} {'jsonpath':>12} {'jsonata':>12} {'ratio':>8}")
+    for name, path in PATHS.items():
+        compiled_path = JSONPath.compile(path)
+        expression = compile(EXPRESSIONS[name])
+        expected = compiled_path.find(data)
+        got = expression.evaluate(data)
+        assert (got if isinstance(got, list) and len(expected) != 1 else [got]) == expected, name
+        jsonpath = per_call(lambda: compiled_path.find(data), number)
+        jsonata = per_call(lambda: expression.evaluate(data), number)
+        print(
+            f"{name:<10} {jsonpath * 1e6:>10.2f}us {jsonata * 1e6:>10.2f}us "
+            f"{jsonata / jsonpath:>7.2f}x"
+        )
+
+    event = corpus(1)[0]
+    parameters = JSONPath().compile_template(TEMPLATE)
+    arguments = JSONataTemplate(ARGUMENTS)
+    assert parameters.render(event) == arguments.render_state(event)
+    jsonpath = per_call(lambda: parameters.render(event), 20_000)
+    jsonata = per_call(lambda: arguments.render_state(event), 20_000)
+    print(
+        f"\n{'template':<10} {jsonpath * 1e6:>10.2f}us {jsonata * 1e6:>10.2f}us "
+        f"{jsonata / jsonpath:>7.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,55 @@
+"""
+Microbenchmark of the compiled JSONPath evaluator against JSONPathEvaluator.
+
+Run with: python -m benchmarks.bench_jsonpath
+"""
+import timeit
+
+from airfunctions.jsonpath import (CompiledJSONPath, JSONPathEvaluator,
+                                   JSONPathLexer, JSONPathParser)
+
+
+def nested_document(depth: int) -> tuple[str, dict]:
+    """Build a document nested depth levels deep and the path reaching its leaf."""
+    data = {"leaf": 1}
+    for level in reversed(range(depth)):
+        data = {f"k{level}": [data]} if level % 2 else {f"k{level}": data}
+    parts = []
+    for level in range(depth):
+        parts.append(f".k{level}")
+        if level % 2:
+            parts.append("[0]")
+    return "$" + "".join(parts) + ".leaf", data
+
+
+def bench(path: str, data: dict, number: int) -> tuple[float, float]:
+    evaluator = JSONPathEvaluator(JSONPathParser(JSONPathLexer(path)).parse())
+    compiled = CompiledJSONPath(path)
+    assert evaluator.evaluate(data) == compiled.find(data)
+
+    interpreted = min(
+        timeit.repeat(lambda: evaluator.evaluate(data), number=number, repeat=5)
+    )
+    compiled_time = min(
+        timeit.repeat(lambda: compiled.find(data), number=number, repeat=5)
+    )
+    return interpreted / number, compiled_time / number
+
+
+def main():
+    number = 20_000
+    print(f"{'path':<28} {'interpreted':>12} {'compiled':>12} {'speedup':>8}")
+    cases = [nested_document(depth) for depth in (1, 5, 10, 25, 50)]
+    cases.append(("$.k0[*].leaf", {"k0": [{"leaf": i} for i in range(10)]}))
+    cases.append(("$..leaf", nested_document(10)[1]))
+    for path, data in cases:
+        interpreted, compiled = bench(path, data, number)
+        label = path if len(path) <= 28 else path[:25] + "..."
+        print(
+            f"{label:<28} {interpreted * 1e6:>10.2f}us {compiled * 1e6:>10.2f}us "
+            f"{interpreted / compiled:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
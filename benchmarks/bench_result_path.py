@@ -0,0 +1,90 @@
+"""
+ResultPath on large events: placing a small task result into a 200 KB state input
+by copying the whole input (copy.deepcopy, then setting the field) against the
+structurally shared assignment of local runs, which copies only the objects
+along the path, per assignment and for a chain of tasks each adding its result.
+
+Run with: python -m benchmarks.bench_result_path [kilobytes] [tasks]
+"""
+import copy
+import json
+import random
+import sys
+import time
+
+from airfunctions.jsonpath import JSONPath
+from airfunctions.steps import LambdaFunction, Pass
+
+PATH = "$.results.summary"
+
+
+def event(kilobytes: int, seed: int = 0) -> dict:
+    """An order event of about the given JSON size, mostly a list of line items."""
+    rng = random.Random(seed)
+    data = {"id": "order-1", "customer": {"id": 7, "tier": "gold"}, "results": {}, "items": []}
+    while len(json.dumps(data)) < kilobytes * 1024:
+        data["items"].extend(
+            {
+                "sku": f"sku-{rng.randint(0, 9999)}",
+                "price": rng.randint(1, 500),
+                "tags": [rng.choice("abcdef") for _ in range(3)],
+            }
+            for _ in range(100)
+        )
+    return data
+
+
+def summarizer(i: int):
+    def summarize(event, context):
+        return {"count": len(event), "total": sum(event)}
+
+    # tasks are states named after their handlers
+    summarize.__name__ = summarize.__qualname__ = f"summarize_{i}"
+    return summarize
+
+
+def deepcopy_assign(data: dict, value) -> dict:
+    output = copy.deepcopy(data)
+    output["results"]["summary"] = value
+    return output
+
+
+def per_call(func, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number
+
+
+def main(kilobytes: int, tasks: int):
+    data = event(kilobytes)
+    value = {"count": 3, "total": 42}
+    assign = JSONPath.compile(PATH).assign
+    assert assign(data, value) == deepcopy_assign(data, value)
+    print(f"event of {len(json.dumps(data)) / 1024:.0f} KB, ResultPath {PATH}")
+    copied = per_call(lambda: deepcopy_assign(data, value), 20)
+    shared = per_call(lambda: assign(data, value), 20_000)
+    print(f"{'deepcopy':<10} {copied * 1e6:>12.1f}us")
+    print(f"{'shared':<10} {shared * 1e6:>12.1f}us {copied / shared:>10.0f}x")
+
+    workflow = Pass("start")
+    for i in range(tasks):
+        workflow = workflow >> LambdaFunction(
+            summarizer(i),
+            input_path="$.items[*].price",
+            result_path=f"$.results.task_{i}",
+        )
+    workflow = workflow >> Pass("end")
+    output = workflow(data, None)
+    assert len(output["results"]) == tasks and not data["results"]
+    run = per_call(lambda: workflow(data, None), 20)
+    print(
+        f"\nworkflow of {tasks} tasks with a ResultPath each: {run * 1e3:.2f}ms per event, "
+        f"copying the input for each would add {tasks * copied * 1e3:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    kilobytes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    tasks = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    main(kilobytes, tasks)
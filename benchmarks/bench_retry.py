@@ -0,0 +1,68 @@
+"""
+Retry storm in virtual time: a Task failing a share of its attempts is retried with
+exponential backoff on a VirtualClock, reporting the simulated latency and the
+retries per state next to the real time spent running the events.
+
+Run with: python -m benchmarks.bench_retry [events] [failure rate ...]
+"""
+import random
+import sys
+import time
+
+from airfunctions.clock import VirtualClock
+from airfunctions.steps import Pass, lambda_task
+
+
+class ThrottlingException(Exception):
+    pass
+
+
+failure_rate = 0.0
+
+
+@lambda_task
+def call_api(event, context):
+    if random.random() < failure_rate:
+        raise ThrottlingException("rate exceeded")
+    return {"id": event["id"], "status": "ok"}
+
+
+call_api.retry(
+    ThrottlingException,
+    interval_seconds=1,
+    max_attempts=6,
+    max_delay_seconds=30,
+    back_off_rate=2.0,
+)
+workflow = Pass("start") >> call_api
+
+
+def main(count: int, rates: list[float]):
+    global failure_rate
+    print(
+        f"{'failures':>8} {'events':>8} {'failed':>7} {'retries':>8} "
+        f"{'sim total':>11} {'sim/event':>10} {'real':>8}"
+    )
+    for rate in rates:
+        failure_rate = rate
+        random.seed(0)
+        clock = VirtualClock()
+        executor = workflow.compile(clock=clock)
+        failed = 0
+        start = time.perf_counter()
+        for i in range(count):
+            try:
+                executor({"id": i}, None)
+            except ThrottlingException:
+                failed += 1
+        real = time.perf_counter() - start
+        print(
+            f"{rate:>8.0%} {count:>8} {failed:>7} {clock.waits['call_api']:>8} "
+            f"{clock.elapsed:>10.0f}s {clock.elapsed / count:>9.2f}s {real:>7.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rates = [float(arg) for arg in sys.argv[2:]] or [0.0, 0.1, 0.3, 0.5, 0.8]
+    main(count, rates)
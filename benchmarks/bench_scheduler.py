@@ -0,0 +1,55 @@
+"""
+Interleaving many simulated executions with Wait states on the Scheduler, in
+virtual time. Compares the scheduler with running the same events one after
+another through the compiled executor, where every wait also takes no real time.
+
+Run with: python -m benchmarks.bench_scheduler [executions] [waits per execution ...]
+"""
+import random
+import sys
+import time
+
+from airfunctions.clock import VirtualClock
+from airfunctions.scheduler import Scheduler
+from airfunctions.steps import Pass, Wait
+
+
+def build(waits: int):
+    workflow = Pass("start")
+    for i in range(waits):
+        workflow = workflow >> Wait(f"wait_{i}", seconds_path="$.delay") >> Pass(f"step_{i}")
+    return workflow
+
+
+def main(count: int, waits: list[int]):
+    print(
+        f"{'waits':>5} {'executions':>10} {'sequential':>12} {'scheduler':>12} "
+        f"{'max pending':>11} {'simulated':>11}"
+    )
+    for wait_count in waits:
+        workflow = build(wait_count)
+        random.seed(0)
+        events = [{"delay": random.randint(1, 3600)} for _ in range(count)]
+
+        executor = workflow.compile(clock=VirtualClock())
+        start = time.perf_counter()
+        executor.run_many(events)
+        sequential = count / (time.perf_counter() - start)
+
+        scheduler = Scheduler(VirtualClock())
+        start = time.perf_counter()
+        for event in events:
+            scheduler.submit(workflow, event)
+        scheduler.run()
+        scheduled = count / (time.perf_counter() - start)
+
+        print(
+            f"{wait_count:>5} {count:>10} {sequential:>10.0f}/s {scheduled:>10.0f}/s "
+            f"{scheduler.max_pending:>11} {scheduler.clock.elapsed:>10.0f}s"
+        )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    waits = [int(arg) for arg in sys.argv[2:]] or [1, 5, 20]
+    main(count, waits)
@@ -0,0 +1,53 @@
+"""
+Cost of tracing local runs: the same events through Branch calls with no tracer,
+with a tracer skipping data sizes and with a full tracer.
+
+Run with: python -m benchmarks.bench_tracing [states] [events]
+"""
+import sys
+import time
+
+from airfunctions.steps import Pass, lambda_task
+from airfunctions.tracing import Tracer
+
+
+@lambda_task
+def handler(event, context):
+    return {"value": event["value"] + 1, "tags": event["tags"]}
+
+
+def build(states: int):
+    workflow = Pass("start", input_path="$") >> handler
+    for i in range(states):
+        workflow = workflow >> Pass(
+            f"pass_{i}", result={"value.$": "$.value", "tags.$": "$.tags", "step": i}
+        )
+    return workflow
+
+
+def measure(workflow, events) -> float:
+    start = time.perf_counter()
+    for event in events:
+        workflow(event, None)
+    return len(events) / (time.perf_counter() - start)
+
+
+def main(states: int, count: int):
+    workflow = build(states)
+    events = [{"value": i, "tags": ["a", "b", "c"]} for i in range(count)]
+    baseline = measure(workflow, events)
+    print(f"{'mode':>14} {'events/s':>10} {'overhead':>9}")
+    print(f"{'off':>14} {baseline:>10.0f} {'':>9}")
+    for label, tracer in (
+        ("no sizes", Tracer(sizes=False)),
+        ("full", Tracer()),
+    ):
+        with tracer:
+            rate = measure(workflow, events)
+        print(f"{label:>14} {rate:>10.0f} {baseline / rate - 1:>8.0%}")
+
+
+if __name__ == "__main__":
+    states = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    main(states, count)
@@ -0,0 +1,354 @@
+"""
+Scenarios of the benchmark suite, see benchmarks.suite. Inputs are generated from
+fixed seeds so every run measures the same work.
+"""
+import os
+import random
+import tempfile
+
+from airfunctions.conditions import Ref
+from airfunctions.jsonata import JSONataTemplate
+from airfunctions.jsonata import compile as compile_jsonata
+from airfunctions.jsonpath import JSONPath
+from airfunctions.steps import (Branch, Choice, LambdaFunction, Map, Pass,
+                                lambda_task, parallel)
+from benchmarks.bench_choice import countries
+from benchmarks.bench_choice import events as orders
+from benchmarks.bench_choice import redundant
+from benchmarks.bench_choice import routing
+from benchmarks.bench_choice import workflow as choice_workflow
+from benchmarks.bench_result_path import event as large_event
+from benchmarks.bench_result_path import summarizer
+from benchmarks.suite import Skip, scenario
+
+
+def corpus(count: int, seed: int = 0) -> list[dict]:
+    """Synthetic events of varied size, the same for a given seed."""
+    rng = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "size": rng.randint(0, 20),
+            "user": {"name": f"user-{rng.randint(0, 999)}", "tier": rng.choice("abc")},
+            "items": [
+                {"sku": f"sku-{rng.randint(0, 99)}", "price": rng.randint(1, 100)}
+                for _ in range(rng.randint(1, 8))
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def payload(items: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {
+        "a": {"b": {"c": {"d": 1}}},
+        "meta": {"source": "bench", "version": 3},
+        "items": [
+            {"id": i, "price": rng.randint(1, 100), "tags": ["x", "y"]}
+            for i in range(items)
+        ],
+    }
+
+
+# DSL: building workflows with >>
+
+
+def chain(length: int, prefix: str = "pass") -> Branch:
+    branch = Pass(f"{prefix}_0")
+    for i in range(1, length):
+        branch = branch >> Pass(f"{prefix}_{i}")
+    return branch
+
+
+@scenario("dsl.chain.200")
+def dsl_chain():
+    return lambda: chain(200)
+
+
+@scenario("dsl.choices.50")
+def dsl_choices():
+    def build():
+        branch = Pass("start")
+        for i in range(50):
+            route = Choice(f"route_{i}", default=Pass(f"small_{i}")).choose(
+                Ref("size") > i, Pass(f"large_{i}")
+            )
+            branch = branch >> route
+        return branch
+
+    return build
+
+
+@scenario("dsl.parallel.20x10")
+def dsl_parallel():
+    return lambda: Pass("start") >> parallel(
+        *(chain(10, f"b{i}") for i in range(20))
+    ) >> Pass("end")
+
+
+@scenario("dsl.merge.50x20")
+def dsl_merge():
+    def build():
+        branch = chain(20, "part_0")
+        for i in range(1, 50):
+            branch = branch >> chain(20, f"part_{i}")
+        return branch
+
+    return build
+
+
+# Local execution of Branch.__call__ over event corpora
+
+
+@lambda_task
+def enrich(event, context):
+    return {**event, "total": sum(item["price"] for item in event["items"])}
+
+
+@lambda_task
+def validate(event, context):
+    if event["id"] % 2:
+        raise ValueError(f"event {event['id']} rejected")
+    return event
+
+
+def run_corpus(workflow: Branch, events: list[dict]):
+    def run():
+        for event in events:
+            workflow(event, None)
+
+    return run
+
+
+@scenario("exec.chain.1k")
+def exec_chain():
+    workflow = Pass("start", result={"id.$": "$.id", "items.$": "$.items"}) >> enrich
+    for i in range(20):
+        workflow = workflow >> Pass(f"pass_{i}", input_path="$", output_path="$")
+    return run_corpus(workflow, corpus(1000))
+
+
+@scenario("exec.choice.1k")
+def exec_choice():
+    route = Choice("route", default=Pass("small")).choose(Ref("size") > 10, Pass("large"))
+    workflow = Pass("start") >> Pass("prepare", input_path="$") >> route
+    return run_corpus(workflow, corpus(1000))
+
+
+@scenario("exec.choices.10x8.1k")
+def exec_choices():
+    return run_corpus(choice_workflow(10, 8), orders(1000))
+
+
+@scenario("exec.routing.200.1k")
+def exec_routing():
+    workflow = Pass("start") >> Pass("prepare") >> routing(200)
+    return run_corpus(workflow, countries(1000, 200))
+
+
+@scenario("exec.redundant.32.1k")
+def exec_redundant():
+    route = Choice("route", default=Pass("standard"))
+    for i, condition in enumerate(redundant(32)):
+        route.choose(condition, Pass(f"priority_{i}"))
+    workflow = Pass("start") >> Pass("prepare") >> route
+    return run_corpus(workflow, [dict(e, country=f"C{i % 64}") for i, e in enumerate(orders(1000))])
+
+
+@scenario("exec.catch.1k")
+def exec_catch():
+    validate.catch(ValueError, Pass("rejected"), result_path="$.error")
+    workflow = Pass("start") >> validate >> Pass("accepted")
+    return run_corpus(workflow, corpus(1000))
+
+
+@scenario("exec.result_path.200kb")
+def exec_result_path():
+    workflow = Pass("start")
+    for i in range(10):
+        workflow = workflow >> LambdaFunction(
+            summarizer(i), input_path="$.items[0:10].price", result_path=f"$.results.task_{i}"
+        )
+    workflow = workflow >> Pass("end")
+    return run_corpus(workflow, [large_event(200, seed) for seed in range(10)])
+
+
+@scenario("exec.map.100x100")
+def exec_map():
+    each = Map(
+        "each",
+        item_processor=Pass("price", result={"sku.$": "$.sku", "price.$": "$.price"}),
+        items_path="$.items",
+    )
+    workflow = Pass("start") >> each
+    events = [{"items": payload(100)["items"]} for _ in range(100)]
+    return run_corpus(workflow, events)
+
+
+# JSONPath.apply on varied path shapes and payload sizes
+
+PATHS = {
+    "field": "$.meta",
+    "deep": "$.a.b.c.d",
+    "index": "$.items[5]",
+    "wildcard": "$.items[*].id",
+    "slice": "$.items[2:8]",
+    "filter": "$.items[?(@.price > 50)]",
+    "descent": "$..id",
+}
+
+
+def register_jsonpath(shape: str, path: str, items: int):
+    data = payload(items)
+    jsonpath = JSONPath()
+    # cheap paths are timed over more calls per sample
+    number = 2000 if items <= 10 else 20
+
+    @scenario(f"jsonpath.{shape}.{items}", number=number)
+    def setup():
+        return lambda: jsonpath.apply(path, data)
+
+
+for _shape, _path in PATHS.items():
+    for _items in (10, 1000):
+        register_jsonpath(_shape, _path, _items)
+
+
+# JSONata expressions selecting what the paths above select
+
+EXPRESSIONS = {
+    "field": "meta",
+    "deep": "a.b.c.d",
+    "index": "items[5]",
+    "wildcard": "items.id",
+    "slice": "items[[2..7]]",
+    "filter": "items[price > 50]",
+    "descent": "**.id",
+}
+
+
+def register_jsonata(shape: str, expression: str, items: int):
+    data = payload(items)
+    compiled = compile_jsonata(expression)
+    number = 2000 if items <= 10 else 20
+
+    @scenario(f"jsonata.{shape}.{items}", number=number)
+    def setup():
+        return lambda: compiled.evaluate(data)
+
+
+for _shape, _expression in EXPRESSIONS.items():
+    for _items in (10, 1000):
+        register_jsonata(_shape, _expression, _items)
+
+
+# Payload templates
+
+TEMPLATE = {
+    "id.$": "$.id",
+    "name.$": "$.user.name",
+    "greeting.$": "States.Format('Hello {} of tier {}', $.user.name, $.user.tier)",
+    "prices.$": "$.items[*].price",
+    "count.$": "States.ArrayLength($.items)",
+    "static": {"kind": "order", "version": 2},
+    "nested": {"first.$": "$.items[0]", "tier.$": "$.user.tier"},
+}
+
+
+@scenario("template.process.1k")
+def template_process():
+    jsonpath = JSONPath()
+    events = corpus(1000)
+
+    def process():
+        for event in events:
+            jsonpath.process_payload_template(TEMPLATE, event)
+
+    return process
+
+
+@scenario("template.compiled.1k")
+def template_compiled():
+    template = JSONPath().compile_template(TEMPLATE)
+    events = corpus(1000)
+
+    def render():
+        for event in events:
+            template.render(event)
+
+    return render
+
+
+ARGUMENTS = {
+    "id": "{% $states.input.id %}",
+    "name": "{% $states.input.user.name %}",
+    "greeting": "{% 'Hello ' & $states.input.user.name & ' of tier ' & $states.input.user.tier %}",
+    "prices": "{% $states.input.items.price %}",
+    "count": "{% $count($states.input.items) %}",
+    "static": {"kind": "order", "version": 2},
+    "nested": {"first": "{% $states.input.items[0] %}", "tier": "{% $states.input.user.tier %}"},
+}
+
+
+@scenario("template.jsonata.1k")
+def template_jsonata():
+    template = JSONataTemplate(ARGUMENTS)
+    events = corpus(1000)
+
+    def render():
+        for event in events:
+            template.render_state(event)
+
+    return render
+
+
+# Terraform generation
+
+PYPROJECT = """\
+[tool.poetry-plugin-lambda-build]
+layer-artifact-path = "layer.zip"
+function-artifact-path = "function.zip"
+"""
+
+
+def make_handler(i: int):
+    def handler(event, context):
+        return event
+
+    handler.__name__ = handler.__qualname__ = f"handler_{i}"
+    return handler
+
+
+@scenario("terraform.to_terraform.300")
+def terraform_to_terraform():
+    try:
+        from airfunctions.bundle import TerraformBundler
+    except ImportError as exc:
+        raise Skip(f"bundle dependencies missing: {exc}")
+
+    functions = [LambdaFunction(make_handler(i)) for i in range(300)]
+    machines = []
+    for i in range(10):
+        branch = functions[i * 30]
+        for function in functions[i * 30 + 1 : (i + 1) * 30]:
+            branch = branch >> function
+        machines.append(branch.to_statemachine(f"machine_{i}"))
+
+    bundler = TerraformBundler()
+    bundler.lambda_functions = functions
+    bundler.state_machines = machines
+    directory = tempfile.mkdtemp(prefix="airfunctions-bench-")
+    with open(os.path.join(directory, "pyproject.toml"), "w") as f:
+        f.write(PYPROJECT)
+
+    def generate():
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            for blocks in bundler.terraform_files().values():
+                blocks.to_string()
+        finally:
+            os.chdir(cwd)
+
+    return generate
@@ -0,0 +1,189 @@
+"""
+Benchmark suite: named scenarios timed the same way on every run, results stored
+as JSON baselines and compared against each other to catch regressions.
+
+A scenario is a setup function registered with @scenario; it builds its inputs
+(seeded, so every run measures the same work) and returns the callable to time.
+"""
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+
+class Skip(Exception):
+    """Raised by a scenario setup when the scenario cannot run here."""
+
+
+@dataclass
+class Scenario:
+    name: str
+    setup: Callable[[], Callable[[], Any]]
+    # calls of the timed callable per sample
+    number: int = 1
+
+
+SCENARIOS: dict[str, Scenario] = {}
+
+
+def scenario(name: str, number: int = 1):
+    """Register the decorated setup function as a scenario."""
+
+    def register(setup: Callable[[], Callable[[], Any]]):
+        SCENARIOS[name] = Scenario(name, setup, number)
+        return setup
+
+    return register
+
+
+def measure(bench: Scenario, repeat: int = 5) -> dict:
+    """Seconds per call of a scenario, over repeat samples after a warm-up call."""
+    func = bench.setup()
+    func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(bench.number):
+            func()
+        samples.append((time.perf_counter() - start) / bench.number)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "repeat": repeat,
+        "number": bench.number,
+    }
+
+
+def select(patterns: list[str] | None = None) -> list[Scenario]:
+    """Scenarios whose name matches any of the glob patterns, all by default."""
+    if not patterns:
+        return list(SCENARIOS.values())
+    return [
+        bench
+        for name, bench in SCENARIOS.items()
+        if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+    ]
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def run(
+    patterns: list[str] | None = None,
+    repeat: int = 5,
+    report: Callable[[str, dict], None] | None = None,
+) -> dict:
+    """Run the selected scenarios, returning a result document to save or compare."""
+    results = {}
+    skipped = {}
+    for bench in select(patterns):
+        try:
+            result = measure(bench, repeat)
+        except Skip as exc:
+            skipped[bench.name] = str(exc)
+            continue
+        results[bench.name] = result
+        if report is not None:
+            report(bench.name, result)
+    return {"environment": environment(), "results": results, "skipped": skipped}
+
+
+def save(document: dict, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+@dataclass
+class Comparison:
+    name: str
+    baseline: float | None
+    current: float | None
+    status: str
+
+    @property
+    def change(self) -> float | None:
+        """Relative change of the time per call, positive when slower."""
+        if not self.baseline or self.current is None:
+            return None
+        return self.current / self.baseline - 1
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.10) -> list[Comparison]:
+    """
+    Compare the minimum time per call of every scenario. A scenario slower than
+    the baseline by more than threshold has regressed, one faster by more than
+    threshold has improved.
+    """
+    before = baseline["results"]
+    after = current["results"]
+    comparisons = []
+    for name in sorted(before.keys() | after.keys()):
+        if name not in after:
+            comparisons.append(Comparison(name, before[name]["min"], None, "missing"))
+            continue
+        if name not in before:
+            comparisons.append(Comparison(name, None, after[name]["min"], "new"))
+            continue
+        old, new = before[name]["min"], after[name]["min"]
+        if new > old * (1 + threshold):
+            status = "regressed"
+        elif new < old * (1 - threshold):
+            status = "improved"
+        else:
+            status = "unchanged"
+        comparisons.append(Comparison(name, old, new, status))
+    return comparisons
+
+
+def format_time(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def print_comparison(comparisons: list[Comparison], out=sys.stdout):
+    width = max([len(c.name) for c in comparisons] + [8])
+    print(f"{'scenario':<{width}} {'baseline':>10} {'current':>10} {'change':>8}  status", file=out)
+    for c in comparisons:
+        change = "-" if c.change is None else f"{c.change:+.1%}"
+        print(
+            f"{c.name:<{width}} {format_time(c.baseline):>10} "
+            f"{format_time(c.current):>10} {change:>8}  {c.status}",
+            file=out,
+        )